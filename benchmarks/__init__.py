@@ -0,0 +1,5 @@
+# Offline benchmarks of the spiders, they only use the html pages saved on
+# benchmarks/fixtures so they can run without network.
+#
+# Run them from the root of the project, e.g.:
+#     python -m benchmarks.bench_extractors
@@ -0,0 +1,228 @@
+"""Offline benchmark of the parse callbacks of every spider, driven through
+fake HtmlResponse objects built from the pages saved on benchmarks/fixtures.
+
+For every callback it reports the items/sec, the time spent on each field of
+the items and the peak memory allocated while parsing one page.
+
+    python -m benchmarks.bench_callbacks [--pages N] [--extractor compiled]
+    python -m benchmarks.bench_callbacks --fields id
+    python -m benchmarks.bench_callbacks --save baseline.json
+    python -m benchmarks.bench_callbacks --baseline baseline.json
+
+With --baseline the run fails (exit code 1) when a callback is slower than the
+saved one by more than --tolerance, so it can be used before deploying.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from itemloaders import ItemLoader
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+
+from workshop1.extractors import CompiledField
+from workshop1.projection import extract_fields
+from workshop1.spiders.books_spider import CrawlerTaller
+from workshop1.spiders.indeed_spider import IndeedCrawlSpider
+from workshop1.spiders.reed_spider import ReedUKCrawlSpider
+from workshop1.spiders.total_jobs_spider import TotalJobsCrawlSpider
+from workshop1.spiders.upwork_spider import UpworkCrawlSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# * (spider, callback, fixture, url of the page)
+CASES = [
+    (ReedUKCrawlSpider, 'parse_job', 'reed_job.html',
+     'https://www.reed.co.uk/jobs/data-scientist/42671353'),
+    (TotalJobsCrawlSpider, 'parse_job', 'total_jobs_listing.html',
+     'https://www.totaljobs.com/jobs/data-scientist/in-london?page=2'),
+    (IndeedCrawlSpider, 'parse_job', 'indeed_listing.html',
+     'https://uk.indeed.com/jobs?q=Data+Scientist&l=London&start=10'),
+    (UpworkCrawlSpider, 'parse_job', 'upwork_listing.html',
+     'https://www.upwork.com/search/jobs/?page=2&q=Data%20science%20UK'),
+    (CrawlerTaller, 'parse_books', 'books_product.html',
+     'https://books.toscrape.com/catalogue/set-me-free_988/index.html'),
+]
+
+
+def load_fixture(fixture):
+    with open(os.path.join(FIXTURES_DIR, fixture), 'rb') as f:
+        return f.read()
+
+
+def fake_response(body, url):
+    """New response for every call, so the html is parsed again like on a real crawl"""
+    return HtmlResponse(url, body=body, encoding='utf-8', request=Request(url))
+
+
+def parse_page(callback, body, url):
+    """Runs the callback over one page and returns the number of items"""
+    return sum(1 for result in callback(fake_response(body, url)) or ()
+               if not isinstance(result, Request))
+
+
+@contextmanager
+def field_timer():
+    """Times every field loaded while the context is active, patching the
+    ItemLoader methods and CompiledField.extract. Yields the dict with the
+    seconds spent on each field ('<load_item>' holds the output processors)."""
+    timings = defaultdict(float)
+    active = []
+
+    def timed(method, name_of):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            # ! add_xpath calls add_value, only the outermost call is timed
+            if active:
+                return method(*args, **kwargs)
+            active.append(True)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[name_of(*args)] += time.perf_counter() - start
+                active.pop()
+        return wrapper
+
+    patches = [
+        (ItemLoader, 'add_xpath', lambda loader, field, *a: field),
+        (ItemLoader, 'add_css', lambda loader, field, *a: field),
+        (ItemLoader, 'add_value', lambda loader, field, *a: field),
+        (ItemLoader, 'load_item', lambda loader: '<load_item>'),
+        (CompiledField, 'extract', lambda field, *a: field.name),
+    ]
+    originals = [(cls, name, cls.__dict__[name]) for cls, name, _ in patches]
+    for cls, name, name_of in patches:
+        setattr(cls, name, timed(cls.__dict__[name], name_of))
+    try:
+        yield timings
+    finally:
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+
+
+def measure(callback, body, url, pages):
+    """Benchmarks a callback over the same page
+
+    :param callback: bound callback of the spider, e.g. spider.parse_job
+    :param body: html of the page
+    :type body: bytes
+    :param url: url of the page
+    :type url: str
+    :param pages: number of times the page is parsed
+    :type pages: int
+    :return: dict with items_per_page, pages_per_sec, items_per_sec,
+        field_us (microseconds per page spent on every field) and
+        peak_kib (peak memory allocated while parsing one page)
+    :rtype: dict
+    """
+    # * Warm up the caches (lru_cache, compiled regexes) before timing
+    items = parse_page(callback, body, url)
+
+    start = time.perf_counter()
+    for _ in range(pages):
+        parse_page(callback, body, url)
+    elapsed = time.perf_counter() - start
+
+    with field_timer() as timings:
+        for _ in range(pages):
+            parse_page(callback, body, url)
+
+    # * Peak memory of a single page, the highest of a few runs
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(pages, 5)):
+        tracemalloc.reset_peak()
+        parse_page(callback, body, url)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        'items_per_page': items,
+        'pages_per_sec': pages / elapsed,
+        'items_per_sec': items * pages / elapsed,
+        'field_us': {name: seconds / pages * 1e6 for name, seconds in
+                     sorted(timings.items(), key=lambda kv: -kv[1])},
+        'peak_kib': peak / 1024,
+    }
+
+
+def run(pages=200, extractor='itemloader', fields=None):
+    """Benchmarks every case and returns the results by '<spider>.<callback>'.
+    With fields, the spiders only extract those (like -s EXTRACT_FIELDS)"""
+    results = {}
+    for spider_cls, callback, fixture, url in CASES:
+        kwargs = {'extractor': extractor} if hasattr(spider_cls, 'extractor') else {}
+        spider = spider_cls(**kwargs)
+        if fields:
+            spider.extract_fields = extract_fields(
+                Settings({'EXTRACT_FIELDS': fields, 'ITEM_PIPELINES': {}}), spider_cls)
+        results['%s.%s' % (spider.name, callback)] = measure(
+            getattr(spider, callback), load_fixture(fixture), url, pages)
+    return results
+
+
+def report(results, baseline=None):
+    print('%-24s %10s %12s %12s %10s %10s' % (
+        'callback', 'items/page', 'items/sec', 'pages/sec', 'peak KiB', 'vs base'))
+    for name, result in results.items():
+        change = ''
+        if baseline and name in baseline:
+            change = '%+.1f%%' % (
+                (result['items_per_sec'] / baseline[name]['items_per_sec'] - 1) * 100)
+        print('%-24s %10d %12.0f %12.0f %10.1f %10s' % (
+            name, result['items_per_page'], result['items_per_sec'],
+            result['pages_per_sec'], result['peak_kib'], change))
+    print()
+    print('%-24s %-20s %12s' % ('callback', 'field', 'us/page'))
+    for name, result in results.items():
+        for field, us in result['field_us'].items():
+            print('%-24s %-20s %12.1f' % (name, field, us))
+
+
+def regressions(results, baseline, tolerance):
+    """Names of the callbacks whose items/sec dropped more than the tolerance"""
+    return [
+        name for name, result in results.items()
+        if name in baseline
+        and result['items_per_sec'] < baseline[name]['items_per_sec'] * (1 - tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=200, help='times every page is parsed')
+    parser.add_argument('--extractor', default='itemloader', choices=['itemloader', 'compiled'])
+    parser.add_argument('--fields', nargs='+', help='only extract these fields')
+    parser.add_argument('--save', help='json file where the results are saved')
+    parser.add_argument('--baseline', help='json file with the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed drop of items/sec against the baseline (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.pages, args.extractor, args.fields)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print('\nSlower than the baseline: %s' % ', '.join(slower))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Time per posting of the CrossBoardIndex of workshop1.pipelines as it grows,
+on synthetic postings of the four job boards.
+
+    python -m benchmarks.bench_crossboard [postings]
+
+The index is filled up to every size and then 1000 more postings are added,
+half of them new and half copies of recent postings seen on another board
+with a reworded title. With 200000 postings it gave (ms/posting) 0.85 at
+1000, 1.15 at 10000, 1.57 at 100000 and 1.63 at 200000, and about 88% of
+the copies were found as near-duplicates.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from workshop1.pipelines import CrossBoardIndex
+
+BOARDS = ('reed_uk', 'total_jobs', 'indeed', 'upwork')
+SENIORITY = ('', 'Junior', 'Senior', 'Lead', 'Principal', 'Graduate', 'Head of')
+ROLES = ('Data Scientist', 'Machine Learning Engineer', 'Data Analyst', 'Data Engineer',
+         'NLP Scientist', 'Research Scientist', 'Analytics Manager', 'BI Developer')
+DOMAINS = ('', 'Python', 'Computer Vision', 'Pricing', 'Fraud', 'Marketing', 'Healthcare',
+           'Credit Risk', 'Forecasting', 'Recommendations', 'Supply Chain', 'Genomics')
+LOCATIONS = ('London', 'Manchester', 'Leeds', 'Bristol', 'Edinburgh', 'Birmingham',
+             'Cambridge', 'Glasgow', 'Oxford', 'Remote')
+
+
+def make_job(rng, number):
+    title = ' '.join(word for word in (
+        rng.choice(SENIORITY), rng.choice(ROLES), rng.choice(DOMAINS)) if word)
+    return {
+        'id': number,
+        'title': title,
+        'company': 'Company %d' % rng.randrange(20000),
+        'location': rng.choice(LOCATIONS),
+        'salary_annual': float(rng.randrange(30, 120) * 1000),
+    }
+
+
+def reworded(job):
+    """The same posting as shown by another board"""
+    return dict(job, title='%s (Hybrid)' % job['title'], id='x%s' % job['id'],
+                company=job['company'] + ' Ltd')
+
+
+def main(postings=200000):
+    rng = random.Random(7)
+    sizes = [size for size in (1000, 10000, 100000, 1000000) if size < postings] + [postings]
+    path = os.path.join(tempfile.mkdtemp(), 'crossboard.sqlite')
+    index = CrossBoardIndex(path)
+    indexed = []
+    print('%10s %14s %8s %8s' % ('postings', 'ms/posting', 'near', 'new'))
+    for size in sizes:
+        while len(indexed) < size:
+            job = make_job(rng, len(indexed))
+            index.add(rng.choice(BOARDS), job)
+            indexed.append(job)
+        index.db.commit()
+
+        found = {'near': 0, 'new': 0, 'exact': 0, 'known': 0}
+        start = time.perf_counter()
+        for i in range(1000):
+            if i % 2:
+                # * Copies of the postings of the last days
+                _, how = index.add('other_board', reworded(rng.choice(indexed[-2000:])))
+            else:
+                _, how = index.add(rng.choice(BOARDS), make_job(rng, 10 ** 9 + size + i))
+            found[how] += 1
+        elapsed = time.perf_counter() - start
+        print('%10d %14.3f %8d %8d' % (size, elapsed, found['near'], found['new']))
+    index.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
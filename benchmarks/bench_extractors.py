@@ -0,0 +1,53 @@
+"""Compares the pages/sec parsed by the ItemLoader path of parse_job against
+the precompiled extractor (-a extractor=compiled) of every job spider.
+
+    python -m benchmarks.bench_extractors [pages]
+"""
+import os
+import sys
+import time
+
+from scrapy.http import HtmlResponse, Request
+
+from workshop1.spiders.indeed_spider import IndeedCrawlSpider
+from workshop1.spiders.reed_spider import ReedUKCrawlSpider
+from workshop1.spiders.total_jobs_spider import TotalJobsCrawlSpider
+from workshop1.spiders.upwork_spider import UpworkCrawlSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+CASES = [
+    (ReedUKCrawlSpider, 'reed_job.html', 'https://www.reed.co.uk/jobs/data-scientist/42671353'),
+    (TotalJobsCrawlSpider, 'total_jobs_listing.html', 'https://www.totaljobs.com/jobs/data-scientist/in-london?page=2'),
+    (IndeedCrawlSpider, 'indeed_listing.html', 'https://uk.indeed.com/jobs?q=Data+Scientist&l=London&start=10'),
+    (UpworkCrawlSpider, 'upwork_listing.html', 'https://www.upwork.com/search/jobs/?page=2&q=Data%20science%20UK'),
+]
+
+
+def run(spider, body, url, pages):
+    """Parses the same page several times, building a new response each time so
+    the html is parsed again like on a real crawl, and returns pages/sec"""
+    items = 0
+    start = time.perf_counter()
+    for _ in range(pages):
+        request = Request(url)
+        response = HtmlResponse(url, body=body, encoding='utf-8', request=request)
+        items += sum(1 for _ in spider.parse_job(response))
+    elapsed = time.perf_counter() - start
+    return pages / elapsed, items / pages
+
+
+def main(pages=500):
+    print('%-12s %12s %14s %14s %8s' % ('spider', 'items/page', 'itemloader p/s', 'compiled p/s', 'speedup'))
+    for spider_cls, fixture, url in CASES:
+        with open(os.path.join(FIXTURES_DIR, fixture), 'rb') as f:
+            body = f.read()
+        loader_rate, items = run(spider_cls(), body, url, pages)
+        compiled_rate, compiled_items = run(spider_cls(extractor='compiled'), body, url, pages)
+        assert items == compiled_items
+        print('%-12s %12d %14.0f %14.0f %7.2fx' % (
+            spider_cls.name, items, loader_rate, compiled_rate, compiled_rate / loader_rate))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
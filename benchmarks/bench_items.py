@@ -0,0 +1,61 @@
+"""Memory per item of the items of every spider, with their Item classes (or
+the dicts of the compiled extractor) and with the compact items of
+workshop1.items (-a item_type=compact).
+
+    python -m benchmarks.bench_items [items]
+
+Every callback runs over its fixture until it has produced that many items,
+which are all kept alive like on the queues of the pipelines and the feed
+exporters, and the memory still allocated at the end is divided by them.
+The values of the fields take the same memory with both, so the saving is
+the container of the fields.
+"""
+import gc
+import sys
+import tracemalloc
+
+from scrapy.http import Request
+
+from benchmarks.bench_callbacks import CASES, fake_response, load_fixture
+
+
+def produce(callback, body, url, items):
+    kept = []
+    while len(kept) < items:
+        kept.extend(result for result in callback(fake_response(body, url)) or ()
+                    if not isinstance(result, Request))
+    return kept
+
+
+def bytes_per_item(spider_cls, callback, body, url, items, **kwargs):
+    """Memory allocated by the items of a callback, in bytes per item"""
+    spider = spider_cls(**kwargs)
+    callback = getattr(spider, callback)
+    # * Warm up the caches (lru_cache, compiled regexes) before measuring
+    produce(callback, body, url, 1)
+    gc.collect()
+    tracemalloc.start()
+    kept = produce(callback, body, url, items)
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return allocated / len(kept)
+
+
+def main(items=1000):
+    print('%-24s %-10s %12s %12s %9s' % ('callback', 'extractor', 'item B', 'compact B', 'saving'))
+    for spider_cls, callback, fixture, url in CASES:
+        body = load_fixture(fixture)
+        extractors = ('itemloader', 'compiled') if hasattr(spider_cls, 'extractor') else (None,)
+        for extractor in extractors:
+            kwargs = {'extractor': extractor} if extractor else {}
+            usual = bytes_per_item(spider_cls, callback, body, url, items, **kwargs)
+            compact = bytes_per_item(spider_cls, callback, body, url, items,
+                                     item_type='compact', **kwargs)
+            print('%-24s %-10s %12.0f %12.0f %8.0f%%' % (
+                '%s.%s' % (spider_cls.name, callback), extractor or '-', usual, compact,
+                (1 - compact / usual) * 100))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,102 @@
+"""Indexing rate and query time of workshop1.skills_index, on synthetic
+postings with a few skills each out of a vocabulary with a long tail.
+
+    python -m benchmarks.bench_skills_index [postings]
+
+Every query is checked against a scan of the postings. With 1000000
+postings the index was built at about 16000 postings/s and took 103 MB (18
+MB of them the posting lists, the rest the table of ids), and the queries
+took 1 to 12 ms while the scan of the list of dicts took 1.2 to 1.7 s.
+"""
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+from workshop1.skills_index import SkillIndex, SkillIndexWriter
+
+COMMON = ('Python', 'SQL', 'Excel', 'Machine Learning', 'Tableau', 'AWS', 'Java', 'R',
+          'Power BI', 'Spark', 'Statistics', 'Azure', 'Docker', 'TensorFlow', 'PyTorch')
+REGIONS = ('London', 'South East', 'North West', 'Scotland', 'East of England',
+           'West Midlands', 'South West', 'Wales')
+
+QUERIES = (
+    dict(all_skills=['python', 'sql'], region='London'),
+    dict(all_skills=['python'], min_salary=60000),
+    dict(any_skills=['pytorch', 'tensorflow'], not_skills=['java']),
+    dict(all_skills=['machine learning', 'aws'], region='Scotland', min_salary=40000,
+         max_salary=80000),
+    dict(all_skills=['skill 1234']),
+)
+
+
+def make_jobs(postings, seed=25):
+    rng = random.Random(seed)
+    vocabulary = list(COMMON) + ['Skill %d' % number for number in range(20000)]
+    # * Zipf like weights, the common skills are on most postings
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    jobs = []
+    for number in range(postings):
+        jobs.append({
+            'id': number,
+            'skills': set(rng.choices(vocabulary, cum_weights=weights, k=rng.randrange(1, 9))),
+            'region': rng.choice(REGIONS),
+            'salary': rng.randrange(20, 120) * 1000.0 if rng.random() < 0.7 else None,
+        })
+    return jobs
+
+
+def scan(jobs, all_skills=(), any_skills=(), not_skills=(), region=None,
+         min_salary=None, max_salary=None):
+    found = []
+    for job in jobs:
+        skills = job['lowered']
+        if not all(skill in skills for skill in all_skills):
+            continue
+        if any_skills and not any(skill in skills for skill in any_skills):
+            continue
+        if any(skill in skills for skill in not_skills):
+            continue
+        if region is not None and job['region'] != region:
+            continue
+        if min_salary is not None and (job['salary'] is None or job['salary'] < min_salary):
+            continue
+        if max_salary is not None and (job['salary'] is None or job['salary'] > max_salary):
+            continue
+        found.append(job['id'])
+    return found
+
+
+def main(postings=1000000):
+    jobs = make_jobs(postings)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'skills_index.sqlite')
+        start = time.perf_counter()
+        writer = SkillIndexWriter(path)
+        for job in jobs:
+            writer.add('bench', job['id'], job['skills'], job['region'], job['salary'])
+        writer.close()
+        elapsed = time.perf_counter() - start
+        print('indexed %d postings in %.1f s (%.0f postings/s), %.1f MB' % (
+            postings, elapsed, postings / elapsed, os.path.getsize(path) / 2 ** 20))
+
+        for job in jobs:
+            job['lowered'] = {skill.lower() for skill in job['skills']}
+        index = SkillIndex(path)
+        for query in QUERIES:
+            start = time.perf_counter()
+            docnos = index.query(**query)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            expected = scan(jobs, **query)
+            scanned = time.perf_counter() - start
+            # * The postings were added once and in order, so docno is the id
+            assert docnos.tolist() == expected, query
+            print('%8d matches %7.1f ms (scan %6.0f ms)  %s' % (
+                len(docnos), elapsed * 1000, scanned * 1000, query))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,78 @@
+"""Crawl run by test_checkpoint on a subprocess, so it can be killed:
+
+    python tests/checkpoint_crawl.py <base url> <checkpoint dir> <feed> <pages> [kill after]
+
+Every page yields ITEMS_PER_PAGE items and links to the pages 2n and 2n + 1.
+The items wait a bit on SlowPipeline, so the checkpoints find pages with some
+of their items exported and some not.
+With kill after, the process kills itself with SIGKILL once it has scraped
+that many items, like a crawl that dies in the middle. The items also go to
+a json feed next to the jsonlines one, which can not be cut on a resume.
+"""
+import os
+import signal
+import sys
+
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+
+ITEMS_PER_PAGE = 3
+
+
+class SlowPipeline:
+
+    def process_item(self, item, spider):
+        return deferLater(reactor, 0.02 * item['number'], lambda: item)
+
+
+class TreeSpider(scrapy.Spider):
+    name = 'tree'
+
+    def __init__(self, base_url, pages, kill_after=0, **kwargs):
+        super().__init__(**kwargs)
+        self.start_urls = [base_url + '/page/1']
+        self.base_url = base_url
+        self.pages = int(pages)
+        self.kill_after = int(kill_after)
+        self.scraped = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        return spider
+
+    def item_scraped(self, item, response, spider):
+        self.scraped += 1
+        if self.kill_after and self.scraped >= self.kill_after:
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    def parse(self, response):
+        page = int(response.url.rsplit('/', 1)[1])
+        for number in range(ITEMS_PER_PAGE):
+            yield {'page': page, 'number': number}
+        for child in (2 * page, 2 * page + 1):
+            if child <= self.pages:
+                yield response.follow('%s/page/%d' % (self.base_url, child))
+
+
+if __name__ == '__main__':
+    base_url, directory, feed, pages = sys.argv[1:5]
+    kill_after = sys.argv[5] if len(sys.argv) > 5 else 0
+    process = CrawlerProcess({
+        'SCHEDULER': 'workshop1.checkpoint.CheckpointScheduler',
+        'CHECKPOINT_DIR': directory,
+        'CHECKPOINT_INTERVAL': 0.1,
+        'FEEDS': {
+            feed: {'format': 'jsonlines', 'overwrite': True},
+            os.path.splitext(feed)[0] + '.json': {'format': 'json'},
+        },
+        'CONCURRENT_REQUESTS': 8,
+        'ITEM_PIPELINES': {'__main__.SlowPipeline': 100},
+        'LOG_LEVEL': 'INFO',
+    })
+    process.crawl(TreeSpider, base_url=base_url, pages=pages, kill_after=kill_after)
+    process.start()
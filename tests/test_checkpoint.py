@@ -0,0 +1,83 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tests.checkpoint_crawl import ITEMS_PER_PAGE
+
+CRAWL = os.path.join(os.path.dirname(__file__), 'checkpoint_crawl.py')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = 300
+
+
+class SlowPages(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(0.01)
+        body = b'<html><body>page</body></html>'
+        self.send_response(200 if self.path.startswith('/page/') else 404)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowPages)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+
+
+def crawl(site, directory, feed, kill_after=0):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    args = [sys.executable, CRAWL, site, directory, feed, str(PAGES)]
+    if kill_after:
+        args.append(str(kill_after))
+    return subprocess.run(args, env=env, cwd=ROOT, capture_output=True, timeout=120)
+
+
+def read_feed(feed):
+    with open(feed, encoding='utf8') as f:
+        return [(item['page'], item['number']) for item in map(json.loads, f)]
+
+
+def test_resume_after_kill_has_no_duplicated_or_lost_items(site, tmp_path):
+    directory, feed = str(tmp_path / 'checkpoint'), str(tmp_path / 'items.jl')
+    # * Killed twice in the middle, then resumed until the end
+    for kill_after in (200, 250):
+        result = crawl(site, directory, feed, kill_after)
+        assert result.returncode == -signal.SIGKILL, result.stderr.decode()
+    result = crawl(site, directory, feed)
+    assert result.returncode == 0, result.stderr.decode()
+
+    items = read_feed(feed)
+    expected = {(page, number) for page in range(1, PAGES + 1) for number in range(ITEMS_PER_PAGE)}
+    assert len(items) == len(set(items)), 'duplicated items'
+    assert set(items) == expected
+
+
+def test_feeds_that_can_not_be_cut_are_restarted(site, tmp_path):
+    directory, feed = str(tmp_path / 'checkpoint'), str(tmp_path / 'items.jl')
+    result = crawl(site, directory, feed, kill_after=200)
+    assert result.returncode == -signal.SIGKILL, result.stderr.decode()
+    result = crawl(site, directory, feed)
+    assert result.returncode == 0, result.stderr.decode()
+    assert b'can not be cut on a resume' in result.stderr
+
+    # * The json feed only has the items of the resumed crawl, and it is whole
+    with open(str(tmp_path / 'items.json'), encoding='utf8') as f:
+        items = [(item['page'], item['number']) for item in json.load(f)]
+    assert len(items) == len(set(items))
+    assert set(items) < set(read_feed(feed))
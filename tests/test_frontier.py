@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from scrapy import Request
+
+from workshop1.frontier import SharedFrontierScheduler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CRAWL = '''
+import sys
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+
+
+class LinksSpider(scrapy.Spider):
+    name = 'links'
+
+    def parse(self, response):
+        for href in response.css('a::attr(href)').getall():
+            yield response.follow(href)
+
+
+def closed(spider, reason):
+    print('finish_reason', reason)
+
+
+base_url, db = sys.argv[1:3]
+process = CrawlerProcess({
+    'SCHEDULER': 'workshop1.frontier.SharedFrontierScheduler',
+    'FRONTIER_DB': db,
+    'DOWNLOADER_MIDDLEWARES': {'workshop1.frontier.FrontierAckMiddleware': 990},
+    'ROBOTSTXT_OBEY': True,
+    'CLOSESPIDER_TIMEOUT': 20,
+    'LOG_LEVEL': 'INFO',
+})
+crawler = process.create_crawler(LinksSpider)
+crawler.signals.connect(closed, signal=signals.spider_closed)
+process.crawl(crawler, start_urls=[base_url + '/'])
+process.start()
+'''
+
+
+class Pages(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/robots.txt':
+            body = b'User-agent: *\nDisallow: /blocked\n'
+        else:
+            body = (b'<html><body><a href="/page/1">1</a><a href="/page/2">2</a>'
+                    b'<a href="/blocked">blocked</a></body></html>')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain' if self.path == '/robots.txt' else 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Pages)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+
+
+def test_requests_ignored_before_the_download_are_acknowledged(site, tmp_path):
+    db = str(tmp_path / 'frontier.sqlite')
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, '-c', CRAWL, site, db], env=env, cwd=ROOT,
+                            capture_output=True, timeout=60)
+    assert b'finish_reason finished' in result.stdout, result.stderr.decode()
+    with sqlite3.connect(db) as connection:
+        states = dict(connection.execute('SELECT key, state FROM frontier'))
+    # * The start url, the two pages and the one robots.txt disallows
+    assert len(states) == 4
+    assert set(states.values()) == {'done'}
+
+
+class MemoryFrontier:
+
+    lease = 300.0
+
+    def __init__(self):
+        self.keys = []
+
+    def push(self, spider, key, priority, data):
+        if key in self.keys:
+            return False
+        self.keys.append(key)
+        return True
+
+
+def test_rescheduled_leased_requests_get_a_new_key():
+    class Crawler:
+        stats = type('Stats', (), {'inc_value': lambda *args, **kwargs: None})()
+
+    frontier = MemoryFrontier()
+    scheduler = SharedFrontierScheduler(Crawler(), frontier, 'worker', 16)
+    scheduler.spider = type('Spider', (), {'name': 'links'})()
+    request = Request('http://example.com/page/1', dont_filter=True)
+    assert scheduler.enqueue_request(request)
+    # * The circuit breaker delays the leased request twice
+    for _ in range(2):
+        delayed = request.replace(dont_filter=True)
+        delayed.meta['frontier_key'] = frontier.keys[0]
+        assert scheduler.enqueue_request(delayed)
+    assert len(set(frontier.keys)) == 3
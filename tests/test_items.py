@@ -0,0 +1,58 @@
+from collections import Counter
+
+import pytest
+from itemadapter import ItemAdapter
+from scrapy import Request
+
+from benchmarks.bench_callbacks import CASES, fake_response, load_fixture
+from workshop1.items import loaded_fields
+from workshop1.pipelines import JobDedupPipeline
+
+
+class Stats(Counter):
+
+    def inc_value(self, key, count=1, spider=None):
+        self[key] += count
+
+
+def scrape(spider_cls, callback, fixture, url, **kwargs):
+    spider = spider_cls(**kwargs)
+    results = getattr(spider, callback)(fake_response(load_fixture(fixture), url)) or ()
+    return spider, [result for result in results if not isinstance(result, Request)]
+
+
+CALLBACKS = [
+    (case, extractor) for case in CASES
+    for extractor in (('itemloader', 'compiled') if hasattr(case[0], 'extractor') else (None,))
+]
+
+
+@pytest.mark.parametrize('case, extractor', CALLBACKS,
+                         ids=['%s-%s' % (case[0].name, extractor) for case, extractor in CALLBACKS])
+def test_compact_items_have_the_fields_of_the_items(case, extractor):
+    kwargs = {'extractor': extractor} if extractor else {}
+    _, items = scrape(*case, **kwargs)
+    _, compact = scrape(*case, item_type='compact', **kwargs)
+    assert items and [loaded_fields(item) for item in items] == [
+        loaded_fields(item) for item in compact]
+    # * The fields that were never loaded stay None, they are not exported as []
+    for item, compact_item in zip(items, compact):
+        assert {name: value for name, value in ItemAdapter(compact_item).items()
+                if value is not None} == dict(ItemAdapter(item))
+
+
+# * The items of the upwork fixture have no id, the pipeline leaves them alone
+@pytest.mark.parametrize('case', [case for case in CASES
+                                  if case[0].name in ('reed_uk', 'total_jobs', 'indeed')],
+                         ids=lambda case: case[0].name)
+def test_dedup_digest_is_the_same_with_both_item_types(case, tmp_path):
+    store, output = str(tmp_path / 'jobs.sqlite'), str(tmp_path / '%(name)s.jsonl')
+    for item_type, outcome in (('item', 'dedup/new'), ('compact', 'dedup/unchanged')):
+        spider, items = scrape(*case, item_type=item_type)
+        stats = Stats()
+        pipeline = JobDedupPipeline(store, output, stats)
+        pipeline.open_spider(spider)
+        for item in items:
+            pipeline.process_item(item, spider)
+        pipeline.close_spider(spider)
+        assert stats == {outcome: len(items)}, item_type
@@ -0,0 +1,37 @@
+import datetime
+
+import pytest
+
+from workshop1.processor_functions import resolve_posting_date
+
+FETCHED_ON = datetime.date(2021, 5, 31)
+
+# * Posting dates of reed_uk.csv, reed_uk.json and total_jobs.json, and the
+# * relative ones of indeed and upwork
+POSTING_DATES = [
+    ('Posted Yesterday', '2021-05-30'),
+    ('Posted 2 days ago', '2021-05-29'),
+    ('Posted 6 days ago', '2021-05-25'),
+    ('Posted 1 week ago', '2021-05-24'),
+    ('Posted 25 May', '2021-05-25'),
+    ('Posted 27 April', '2021-04-27'),
+    ('Today', '2021-05-31'),
+    ('Just posted', '2021-05-31'),
+    ('5 hours ago', '2021-05-31'),
+    ('Posted 45 minutes ago', '2021-05-31'),
+    ('Posted an hour ago', '2021-05-31'),
+    ('3 weeks ago', '2021-05-10'),
+    ('Posted 1 month ago', '2021-05-01'),
+    ('30+ days ago', '2021-05-01'),
+    ('Recently', 'Recently'),
+    ('Expires in 2 days', 'Expires in 2 days'),
+]
+
+
+@pytest.mark.parametrize('text, expected', POSTING_DATES)
+def test_resolve_posting_date(text, expected):
+    assert resolve_posting_date(text, {'fetched_on': FETCHED_ON}) == expected
+
+
+def test_date_without_year_after_the_fetch_is_last_year():
+    assert resolve_posting_date('Posted 25 December', {'fetched_on': FETCHED_ON}) == '2020-12-25'
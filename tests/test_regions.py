@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from workshop1.regions import RegionIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def index():
+    return RegionIndex.from_csv(os.path.join(ROOT, 'gdp_uk_2019.csv'))
+
+
+@pytest.mark.parametrize('region, locality, country, expected', [
+    ('South East England', 'London', 'England', 'London'),
+    ('South East England', 'Sutton', 'England', 'London'),
+    (None, 'Stratford', None, 'London'),
+    ('West Midlands', 'Sutton', 'England', 'West Midlands'),
+    ('West Midlands', 'Stratford', 'England', 'West Midlands'),
+    ('North West England', 'Lancashire', 'England', 'North West'),
+    (None, None, 'Scotland', 'Scotland'),
+    ('North Carolina', 'Durham', 'USA', None),
+    (None, 'Cambridge', 'USA', None),
+    ('Dublin', 'Dublin', 'Ireland', None),
+])
+def test_match(index, region, locality, country, expected):
+    assert index.match(region, locality, country) == expected
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+
+import pytest
+
+from workshop1.salary import EMPTY_SALARY, MAX_ANNUAL, MIN_ANNUAL, Salary, parse_salary
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# * Salaries of reed_uk.csv and total_jobs.json, with what they parse to
+SALARIES = [
+    ('From £22,000 to £27,000 per annum', Salary(22000.0, 27000.0, 'GBP', 'annum', 24500.0)),
+    ('£30k - 35k per year', Salary(30000.0, 35000.0, 'GBP', 'annum', 32500.0)),
+    ('£33 - £40k DOE', Salary(33000.0, 40000.0, 'GBP', 'annum', 36500.0)),
+    ('£400 - 450 per day', Salary(400.0, 450.0, 'GBP', 'day', 97750.0)),
+    ('Up to £27 per hour', Salary(27.0, 27.0, 'GBP', 'hour', 46575.0)),
+    ('up to £40,000', Salary(40000.0, 40000.0, 'GBP', 'annum', 40000.0)),
+    ('35000 - 39999 per annum', Salary(35000.0, 39999.0, None, 'annum', 37499.5)),
+    ('£32600 - £46862 Per Year', Salary(32600.0, 46862.0, 'GBP', 'annum', 39731.0)),
+    ('£45,000-£55000 pro rata', Salary(45000.0, 55000.0, 'GBP', 'annum', 50000.0)),
+    ('£80000 Remote Working (80 - 90%) , 30 Days Holiday, Superb Pension',
+     Salary(80000.0, 80000.0, 'GBP', 'annum', 80000.0)),
+    ('£40000 - £50000 per annum + 10% bonus + pension + health + 25 day hol',
+     Salary(40000.0, 50000.0, 'GBP', 'annum', 45000.0)),
+    ('From £40,000 to £50,000 per annum 40 - 50K (plus bonus and benefits)',
+     Salary(40000.0, 50000.0, 'GBP', 'annum', 45000.0)),
+    ('AUD$90,000 - AUD$115,000 per annum', Salary(90000.0, 115000.0, 'AUD', 'annum', 102500.0)),
+    ('USD$90,000 - USD$135,000 per annum, negotiable',
+     Salary(90000.0, 135000.0, 'USD', 'annum', 112500.0)),
+    ('€70.00 - €80.00 per hour', Salary(70.0, 80.0, 'EUR', 'hour', 129375.0)),
+    ('£0 - £60000 per annum', Salary(60000.0, 60000.0, 'GBP', 'annum', 60000.0)),
+    ('£0 per annum Competitive across different experience levels', EMPTY_SALARY),
+    ('£negotiable + bonus/pension c.£6,150', EMPTY_SALARY),
+    ('€100 - €110 per annum', EMPTY_SALARY),
+    ('Competitive salary and benefits', EMPTY_SALARY),
+]
+
+
+def scraped_salaries():
+    with open(os.path.join(ROOT, 'reed_uk.csv'), encoding='utf8', newline='') as f:
+        salaries = {row['salary'] for row in csv.DictReader(f)}
+    with open(os.path.join(ROOT, 'total_jobs.json'), encoding='utf8') as f:
+        for row in json.load(f):
+            salary = row.get('salary')
+            salaries.add(salary[0] if isinstance(salary, list) and salary else salary)
+    return {salary.strip() for salary in salaries if salary}
+
+
+@pytest.mark.parametrize('text, expected', SALARIES)
+def test_parse_salary(text, expected):
+    assert parse_salary(text) == expected
+
+
+def test_table_comes_from_the_scraped_data():
+    assert {text for text, _ in SALARIES} <= scraped_salaries()
+
+
+def test_every_scraped_salary_is_plausible():
+    for text in scraped_salaries():
+        salary = parse_salary(text)
+        if salary != EMPTY_SALARY:
+            assert 0 < salary.min <= salary.max, text
+            assert MIN_ANNUAL <= salary.annual <= MAX_ANNUAL, text
@@ -0,0 +1,22 @@
+from workshop1.seen_ids import SeenIdStore
+
+
+def test_new_ids_are_written_before_close(tmp_path):
+    path = str(tmp_path / 'seen_ids.txt')
+    store = SeenIdStore(path)
+    for job_id in range(SeenIdStore.FLUSH_EVERY):
+        assert store.add(job_id)
+    assert not store.add(0)
+    # * Read while the first store is still open, like after a killed crawl
+    assert len(SeenIdStore(path)) == SeenIdStore.FLUSH_EVERY
+    store.close()
+
+
+def test_cut_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'seen_ids.txt'
+    path.write_text('42671353\n42671354\n4267', encoding='utf8')
+    store = SeenIdStore(str(path))
+    assert 42671354 in store and 4267 not in store
+    store.add(42671355)
+    store.close()
+    assert path.read_text(encoding='utf8') == '42671353\n42671354\n42671355\n'
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from workshop1.skills_index import SkillIndex, SkillIndexWriter, normalise_skill
+
+SKILLS = ('Python', 'SQL', 'Excel', 'AWS', 'Java', 'Docker', 'Spark', 'R')
+REGIONS = ('London', 'South East', 'Scotland', 'Wales', None)
+QUERIES = (
+    dict(all_skills=['python']),
+    dict(all_skills=['python', 'sql'], region='London'),
+    dict(any_skills=['aws', 'docker'], not_skills=['java']),
+    dict(all_skills=['excel'], min_salary=40000, max_salary=80000),
+    dict(region='Scotland', min_salary=60000),
+    dict(not_skills=['r']),
+    dict(region='Nowhere'),
+)
+
+
+class SmallWriter(SkillIndexWriter):
+    """Writer with small segments, so a few hundred postings go through
+    several flushes and merges"""
+
+    FLUSH_EVERY = 7
+    MAX_SEGMENTS = 3
+
+
+def scan(jobs, all_skills=(), any_skills=(), not_skills=(), region=None,
+         min_salary=None, max_salary=None):
+    found = set()
+    for key, (skills, job_region, salary) in jobs.items():
+        skills = {normalise_skill(skill) for skill in skills}
+        if not all(skill in skills for skill in all_skills):
+            continue
+        if any_skills and not any(skill in skills for skill in any_skills):
+            continue
+        if any(skill in skills for skill in not_skills):
+            continue
+        if region is not None and job_region != region:
+            continue
+        if min_salary is not None and (salary is None or salary < min_salary):
+            continue
+        if max_salary is not None and (salary is None or salary > max_salary):
+            continue
+        found.add(key)
+    return found
+
+
+def check(path, jobs):
+    index = SkillIndex(path)
+    assert index.size == len(index.salaries)
+    for query in QUERIES:
+        assert set(index.jobs(index.query(**query))) == scan(jobs, **query), query
+
+
+def test_query_matches_scan_across_flushes_merges_and_updates(tmp_path):
+    path = str(tmp_path / 'skills_index.sqlite')
+    rng = random.Random(25)
+    jobs = {}
+    # * Every session adds new postings and changes or repeats old ones, and
+    # * closing it merges the segments
+    for session in range(4):
+        writer = SmallWriter(path)
+        for _ in range(150):
+            key = (rng.choice(('reed_uk', 'indeed')), rng.randrange(120))
+            job = (rng.sample(SKILLS, rng.randrange(0, 4)), rng.choice(REGIONS),
+                   rng.randrange(20, 100) * 1000.0 if rng.random() < 0.8 else None)
+            if key in jobs and rng.random() < 0.3:
+                job = jobs[key]
+            writer.add(key[0], key[1], *job)
+            jobs[key] = job
+        writer.close()
+        check(path, jobs)
+
+
+def test_failed_posting_leaves_the_index_aligned(tmp_path):
+    path = str(tmp_path / 'skills_index.sqlite')
+    writer = SmallWriter(path)
+    writer.add('reed_uk', 1, ['Python'], 'London', 50000)
+    writer.add('reed_uk', 2, ['SQL'], 'Wales', 30000)
+    # * A document number that does not fit the uint32 arrays
+    next_doc, writer.next_doc = writer.next_doc, 2 ** 32
+    with pytest.raises(OverflowError):
+        writer.add('reed_uk', 1, ['Python', 'Java'], 'Scotland', 70000)
+    writer.next_doc = next_doc
+    writer.add('reed_uk', 3, ['Python'], 'Scotland', 70000)
+    writer.close()
+    check(path, {('reed_uk', 1): (['Python'], 'London', 50000),
+                 ('reed_uk', 2): (['SQL'], 'Wales', 30000),
+                 ('reed_uk', 3): (['Python'], 'Scotland', 70000)})
+
+
+def test_more_than_65536_regions(tmp_path):
+    path = str(tmp_path / 'skills_index.sqlite')
+    writer = SkillIndexWriter(path)
+    jobs = {}
+    for number in range(66000):
+        jobs[('upwork', number)] = (['Python'], 'Region %d' % number, None)
+        writer.add('upwork', number, *jobs[('upwork', number)])
+    writer.close()
+    index = SkillIndex(path)
+    for number in (0, 1, 65535, 65536, 65537, 65999):
+        assert index.jobs(index.query(region='Region %d' % number)) == [('upwork', number)]
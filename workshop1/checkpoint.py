@@ -0,0 +1,481 @@
+"""Crash-safe, resumable crawls:
+
+    scrapy crawl reed_uk -s SCHEDULER=workshop1.checkpoint.CheckpointScheduler \\
+        -s CHECKPOINT_DIR=crawls/reed_uk-1
+
+If the crawl dies, running the same command again resumes it from the last
+checkpoint instead of from start_urls. CHECKPOINT_DIR holds:
+
+- requests.log: every scheduled request, appended as a length-prefixed pickle,
+  so the pending requests live on disk and not as Python objects
+- seen.fp: the fingerprints of the scheduled requests, 20 bytes each on a
+  memory-mapped open addressing table
+- checkpoint.json: written every CHECKPOINT_INTERVAL seconds, it holds the
+  position of the log up to which the requests were taken, the positions of
+  the ones taken but not finished yet, the size of the local feed files and
+  the byte ranges of the items that those unfinished requests exported
+
+On resume only the unfinished requests and the ones after that position are
+scheduled again, the finished ones are skipped. The feeds are cut to their
+checkpointed size and the items of the unfinished requests are removed from
+them, so every item is written once. The feeds are always appended to on a
+resume, even the ones with 'overwrite': True.
+
+! Only the local feeds whose items are whole lines can be cut like that, the
+! formats on RESUMABLE_FORMATS. Any other feed (json, xml, parquet, csv with a
+! header per run, remote storages or batches) is restarted on a resume, so it
+! only has the items scraped since then (the parquet feed of reed_uk is a new
+! file every run anyway); a warning tells which ones.
+"""
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.extensions.feedexport import FeedExporter
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+from scrapy.utils.request import request_fingerprint
+from twisted.internet import task
+
+
+class FingerprintFile:
+    """Set of request fingerprints kept on a memory-mapped file.
+
+    Every fingerprint takes a fixed 20 byte slot of an open addressing table,
+    the table is kept at most 70% full and is rebuilt with the double of
+    slots when it grows. Writes go straight to the mapped pages, so they
+    survive a crash of the process; flush() also pushes them to the disk.
+
+    :param path: path of the file, it is created if it does not exist
+    :type path: str
+    :param capacity: number of fingerprints expected, the table grows if it
+        is exceeded
+    :type capacity: int
+    """
+
+    MAGIC = b'WSFP0001'
+    HEADER = struct.Struct('<8sQQ')
+    SLOT = 20
+    MAX_LOAD = 0.7
+
+    def __init__(self, path, capacity=1 << 16):
+        self.path = path
+        if not os.path.exists(path):
+            slots = 8
+            while slots * self.MAX_LOAD < capacity:
+                slots *= 2
+            self._create(path, slots)
+        self._open()
+
+    def _create(self, path, slots):
+        with open(path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, slots, 0))
+            f.truncate(self.HEADER.size + slots * self.SLOT)
+
+    def _open(self):
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.slots, self.count = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError('%s is not a fingerprint file' % self.path)
+        self.mask = self.slots - 1
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, fingerprint):
+        mm = self.mm
+        empty = bytes(self.SLOT)
+        index = int.from_bytes(fingerprint[:8], 'little') & self.mask
+        while True:
+            offset = self.HEADER.size + index * self.SLOT
+            current = mm[offset:offset + self.SLOT]
+            if current == fingerprint or current == empty:
+                return offset, current == fingerprint
+            index = (index + 1) & self.mask
+
+    def __contains__(self, fingerprint):
+        return self._find(fingerprint)[1]
+
+    def add(self, fingerprint):
+        """Adds a 20 byte fingerprint, returns False if it was already there"""
+        offset, found = self._find(fingerprint)
+        if found:
+            return False
+        self.mm[offset:offset + self.SLOT] = fingerprint
+        self.count += 1
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.slots, self.count)
+        if self.count > self.slots * self.MAX_LOAD:
+            self._grow()
+        return True
+
+    def _grow(self):
+        tmp_path = self.path + '.tmp'
+        self._create(tmp_path, self.slots * 2)
+        grown = FingerprintFile(tmp_path)
+        empty = bytes(self.SLOT)
+        for offset in range(self.HEADER.size, len(self.mm), self.SLOT):
+            fingerprint = self.mm[offset:offset + self.SLOT]
+            if fingerprint != empty:
+                grown.add(fingerprint)
+        grown.close()
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+
+class RequestLog:
+    """Append-only log of serialized requests read in order from a cursor.
+
+    :param path: path of the log
+    :type path: str
+    :param offset: position where the reading starts
+    :type offset: int
+    :param replay: positions of records before offset to read again first
+    :type replay: list
+    """
+
+    LENGTH = struct.Struct('<I')
+
+    def __init__(self, path, offset=0, replay=()):
+        self.path = path
+        self.writer = open(path, 'ab')
+        self._drop_partial_record()
+        self.reader = open(path, 'rb')
+        self.read_offset = offset
+        self.replay = deque(sorted(replay))
+        self.pending = len(self.replay) + self._count(offset)
+
+    def _drop_partial_record(self):
+        # ! The last record can be incomplete if the process died writing it
+        end = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(self.LENGTH.size)
+                if len(header) < self.LENGTH.size:
+                    break
+                size, = self.LENGTH.unpack(header)
+                if len(f.read(size)) < size:
+                    break
+                end = f.tell()
+        if end != self.writer.tell():
+            self.writer.truncate(end)
+            self.writer.seek(end)
+
+    def _count(self, offset):
+        count = 0
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(self.LENGTH.size)
+                if not header:
+                    return count
+                f.seek(self.LENGTH.unpack(header)[0], os.SEEK_CUR)
+                count += 1
+
+    def __len__(self):
+        return self.pending
+
+    def append(self, data):
+        self.writer.write(self.LENGTH.pack(len(data)) + data)
+        # * Written to the OS right away, so it is not lost if the process dies
+        self.writer.flush()
+        self.pending += 1
+
+    def _read(self, offset):
+        self.reader.seek(offset)
+        size, = self.LENGTH.unpack(self.reader.read(self.LENGTH.size))
+        return self.reader.read(size)
+
+    def pop(self):
+        """Returns (offset, data) of the next record, or None if there is none"""
+        if not self.pending:
+            return None
+        self.pending -= 1
+        if self.replay:
+            offset = self.replay.popleft()
+            return offset, self._read(offset)
+        offset = self.read_offset
+        data = self._read(offset)
+        self.read_offset = self.reader.tell()
+        return offset, data
+
+    def flush(self):
+        self.writer.flush()
+        os.fsync(self.writer.fileno())
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
+
+
+# * Feed formats whose items are whole lines that can be cut out and appended
+# * to, the only ones that a crawl can resume with
+RESUMABLE_FORMATS = ('jsonlines', 'jl', 'csv_append')
+
+
+def _copy(source, target, size, chunk=1 << 20):
+    while size > 0:
+        data = source.read(min(chunk, size))
+        if not data:
+            return
+        target.write(data)
+        size -= len(data)
+
+
+class CheckpointScheduler:
+    """Scheduler that keeps the pending requests and the seen fingerprints on
+    CHECKPOINT_DIR and writes a checkpoint every CHECKPOINT_INTERVAL seconds,
+    so a crawl that dies can be resumed. Requests are downloaded in the order
+    they were scheduled (breadth first), their priority is not used.
+
+    The start requests that were already scheduled are skipped on a resume,
+    they are on the log.
+    """
+
+    def __init__(self, crawler, directory, interval):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.directory = directory
+        self.interval = interval
+        self.checkpointer = None
+        self.spider = None
+        # * offset -> {feed path: [[start, end], ...]} of the items exported by
+        # * the requests that were not finished on the last checkpoint
+        self.exported = {}
+        self.feed_ends = {}
+        # * Feeds (their uri on FEEDS) that are cut on a resume
+        self.resumable = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        scheduler = cls(crawler, settings.get('CHECKPOINT_DIR') or 'checkpoint',
+                        settings.getfloat('CHECKPOINT_INTERVAL', 60.0))
+        # ! Connected after the FeedExporter, so its files are open and its
+        # ! items written when these run
+        crawler.signals.connect(scheduler.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(scheduler.item_scraped, signal=signals.item_scraped)
+        return scheduler
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.json')
+
+    def open(self, spider):
+        self.spider = spider
+        os.makedirs(self.directory, exist_ok=True)
+        state = {}
+        if os.path.exists(self._checkpoint_path):
+            with open(self._checkpoint_path, encoding='utf8') as f:
+                state = json.load(f)
+        self._check_feeds(append=bool(state))
+        self.seen = FingerprintFile(os.path.join(self.directory, 'seen.fp'))
+        self.log = RequestLog(os.path.join(self.directory, 'requests.log'),
+                              state.get('offset', 0), state.get('unfinished', ()))
+        if state:
+            state['feeds'] = self._restore_feeds(state.get('feeds', {}))
+            self._write_state(state)
+            slot = self.crawler.engine.slot
+            if slot.start_requests is not None:
+                slot.start_requests = self._unseen(slot.start_requests)
+            spider.logger.info(
+                'Resuming from the checkpoint of %s: %d requests pending, %d seen',
+                time.ctime(state['time']), len(self.log), len(self.seen))
+            self.stats.set_value('checkpoint/resumed_pending', len(self.log), spider=spider)
+
+        self.checkpointer = task.LoopingCall(self.checkpoint)
+        self.checkpointer.start(self.interval, now=False)
+
+    def spider_opened(self, spider):
+        for path, file, _ in self._feed_files():
+            self.feed_ends[path] = file.tell()
+        # * So a crash before the first interval does not keep its items
+        self.checkpoint()
+
+    def close(self, reason):
+        if self.checkpointer is not None and self.checkpointer.running:
+            self.checkpointer.stop()
+        self.checkpoint()
+        self.seen.close()
+        self.log.close()
+
+    def has_pending_requests(self):
+        return len(self.log) > 0
+
+    def __len__(self):
+        return len(self.log)
+
+    def enqueue_request(self, request):
+        fingerprint = bytes.fromhex(request_fingerprint(request))
+        if not request.dont_filter and fingerprint in self.seen:
+            self.stats.inc_value('checkpoint/duplicate', spider=self.spider)
+            return False
+        request.meta.pop('checkpoint_offset', None)
+        # ! Logged before the fingerprint is added, so a crash in between can
+        # ! only repeat a request, never lose it
+        self.log.append(pickle.dumps(request_to_dict(request, self.spider), protocol=4))
+        self.seen.add(fingerprint)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        return True
+
+    def next_request(self):
+        record = self.log.pop()
+        if record is None:
+            return None
+        offset, data = record
+        request = request_from_dict(pickle.loads(data), self.spider)
+        request.meta['checkpoint_offset'] = offset
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request
+
+    def _unseen(self, requests):
+        for request in requests:
+            if bytes.fromhex(request_fingerprint(request)) not in self.seen:
+                yield request
+
+    def _check_feeds(self, append):
+        """Makes the feeds that can be cut append to their files when the
+        crawl is resumed, and the rest start again"""
+        for extension in self.crawler.extensions.middlewares:
+            if not isinstance(extension, FeedExporter):
+                continue
+            for uri, options in extension.feeds.items():
+                local = urlparse(uri).scheme in ('', 'file') or os.path.isabs(uri)
+                if (local and options.get('format') in RESUMABLE_FORMATS
+                        and not options.get('batch_item_count')):
+                    self.resumable.add(uri)
+                    if append:
+                        options['overwrite'] = False
+                    continue
+                self.spider.logger.warning(
+                    'The feed %s (%s) can not be cut on a resume, it only gets the items '
+                    'scraped since the crawl was last started. The feeds that can be resumed '
+                    'are local ones with the formats %s', uri, options.get('format'),
+                    ', '.join(RESUMABLE_FORMATS))
+                if append:
+                    options['overwrite'] = True
+
+    def _feed_files(self):
+        for extension in self.crawler.extensions.middlewares:
+            if isinstance(extension, FeedExporter):
+                for slot in extension.slots:
+                    path = getattr(slot.storage, 'path', None)
+                    if (path is not None and slot.uri_template in self.resumable
+                            and not slot.file.closed):
+                        yield path, slot.file, slot.format
+
+    def item_scraped(self, item, response, spider):
+        offset = response.meta.get('checkpoint_offset') if response is not None else None
+        for path, file, feed_format in self._feed_files():
+            end = file.tell()
+            start = self.feed_ends.get(path, end)
+            self.feed_ends[path] = end
+            if offset is None or end == start:
+                continue
+            if start == 0 and feed_format == 'csv_append':
+                # ! The header line went with the first row, it is kept
+                file.flush()
+                with open(path, 'rb') as f:
+                    start = len(f.readline())
+            ranges = self.exported.setdefault(offset, {}).setdefault(path, [])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+
+    def _restore_feeds(self, feeds):
+        """Cuts every feed to its checkpointed size and removes the items of
+        the unfinished requests, returns the new sizes"""
+        restored = {}
+        for path, feed in feeds.items():
+            if not os.path.exists(path):
+                continue
+            drop = sorted(feed['drop'])
+            size = feed['size'] - sum(end - start for start, end in drop)
+            current = os.path.getsize(path)
+            if current < feed['size'] or current == size:
+                # ! Already cut, the crawl died before writing the new checkpoint
+                restored[path] = {'size': current, 'drop': []}
+                continue
+            tmp_path = path + '.tmp'
+            with open(path, 'rb') as source, open(tmp_path, 'wb') as target:
+                position = 0
+                for start, end in drop + [[feed['size'], feed['size']]]:
+                    _copy(source, target, start - position)
+                    source.seek(end)
+                    position = end
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(tmp_path, path)
+            restored[path] = {'size': size, 'drop': []}
+            self.stats.inc_value('checkpoint/dropped_bytes', current - size, spider=self.spider)
+        return restored
+
+    def _unfinished_requests(self):
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return
+        # * The engine keeps every request until the spider and the pipelines
+        # * are done with its response
+        yield from engine.slot.inprogress
+        # * Retries waiting for their backoff keep the offset of the original,
+        # * and the links held by RulePacingMiddleware the one of their page
+        middlewares = (engine.downloader.middleware.middlewares +
+                       engine.scraper.spidermw.middlewares)
+        for middleware in middlewares:
+            if hasattr(middleware, 'pending_requests'):
+                yield from middleware.pending_requests()
+
+    def _unfinished_offsets(self):
+        """Positions of the requests taken from the log that are not finished,
+        and of the ones still waiting to be taken again"""
+        offsets = {request.meta['checkpoint_offset'] for request in self._unfinished_requests()
+                   if 'checkpoint_offset' in request.meta}
+        return offsets.union(self.log.replay)
+
+    def _write_state(self, state):
+        tmp_path = self._checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path)
+
+    def checkpoint(self):
+        """Writes the checkpoint, replacing the previous one atomically"""
+        unfinished = self._unfinished_offsets()
+        # * The finished requests keep their items, so their ranges are forgotten
+        self.exported = {offset: self.exported[offset] for offset in unfinished
+                         if offset in self.exported}
+        feeds = {}
+        for path, file, _ in self._feed_files():
+            file.flush()
+            feeds[path] = {
+                'size': os.path.getsize(path),
+                'drop': sorted(item_range for exported in self.exported.values()
+                               for item_range in exported.get(path, ())),
+            }
+        self.log.flush()
+        self.seen.flush()
+        self._write_state({
+            'time': time.time(),
+            'offset': self.log.read_offset,
+            'unfinished': sorted(unfinished),
+            'seen': len(self.seen),
+            'feeds': feeds,
+        })
+        self.stats.inc_value('checkpoint/count', spider=self.spider)
@@ -0,0 +1,256 @@
+import math
+from array import array
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+class CompactIdSet:
+    """Set of unsigned 64 bit integers stored on a flat open addressing table.
+
+    Every key takes 8 bytes on an ``array('Q')`` instead of a Python int object
+    plus its slot on a builtin set, so millions of ids use a few megabytes.
+    The table is kept at most 70% full and doubles its size when it grows.
+
+    :param capacity: number of keys expected, the table grows if it is exceeded
+    :type capacity: int
+    """
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1024):
+        size = 8
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self._keys = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+        # ! 0 marks the empty slots, so the key 0 is tracked apart
+        self._has_zero = False
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        """Bytes used by the table of keys"""
+        return len(self._keys) * self._keys.itemsize
+
+    def _find(self, key):
+        keys = self._keys
+        mask = self._mask
+        index = ((key * _GOLDEN) & _MASK64) >> 32 & mask
+        while True:
+            current = keys[index]
+            if current == key or current == 0:
+                return index
+            index = (index + 1) & mask
+
+    def __contains__(self, key):
+        key &= _MASK64
+        if key == 0:
+            return self._has_zero
+        return self._keys[self._find(key)] == key
+
+    def add(self, key):
+        """Adds a key to the set
+
+        :param key: integer key, it is truncated to 64 bits
+        :type key: int
+        :return: True if the key was new, False if it was already on the set
+        :rtype: bool
+        """
+        key &= _MASK64
+        if key == 0:
+            if self._has_zero:
+                return False
+            self._has_zero = True
+            self._len += 1
+            return True
+
+        index = self._find(key)
+        if self._keys[index] == key:
+            return False
+        self._keys[index] = key
+        self._len += 1
+        if self._len > len(self._keys) * self.MAX_LOAD:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_keys = self._keys
+        self._keys = array('Q', bytes(16 * len(old_keys)))
+        self._mask = len(self._keys) - 1
+        for key in old_keys:
+            if key:
+                self._keys[self._find(key)] = key
+
+
+class CompactDigestSet:
+    """Set of fixed size binary digests stored on a flat open addressing table.
+
+    Like CompactIdSet but for digests wider than 64 bits, every digest takes
+    ``digest_size`` bytes of a single bytearray.
+
+    :param digest_size: bytes of every digest
+    :type digest_size: int
+    :param capacity: number of digests expected, the table grows if it is exceeded
+    :type capacity: int
+    """
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, digest_size=16, capacity=1024):
+        size = 8
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self.digest_size = digest_size
+        self._empty = bytes(digest_size)
+        self._table = bytearray(digest_size * size)
+        self._mask = size - 1
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        """Bytes used by the table of digests"""
+        return len(self._table)
+
+    def _find(self, digest):
+        table = self._table
+        width = self.digest_size
+        mask = self._mask
+        index = int.from_bytes(digest[:8], 'little') & mask
+        while True:
+            start = index * width
+            current = table[start:start + width]
+            if current == digest or current == self._empty:
+                return start, current == digest
+            index = (index + 1) & mask
+
+    def __contains__(self, digest):
+        return self._find(digest)[1]
+
+    def add(self, digest):
+        """Adds a digest to the set
+
+        :param digest: digest of exactly digest_size bytes, it must not be all zeros
+        :type digest: bytes
+        :return: True if the digest was new, False if it was already on the set
+        :rtype: bool
+        """
+        start, found = self._find(digest)
+        if found:
+            return False
+        self._table[start:start + self.digest_size] = digest
+        self._len += 1
+        if self._len > (self._mask + 1) * self.MAX_LOAD:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_table = self._table
+        width = self.digest_size
+        self._table = bytearray(2 * len(old_table))
+        self._mask = len(self._table) // width - 1
+        for start in range(0, len(old_table), width):
+            digest = bytes(old_table[start:start + width])
+            if digest != self._empty:
+                position = self._find(digest)[0]
+                self._table[position:position + width] = digest
+
+
+class BloomFilter:
+    """Bloom filter sized for a number of keys and a false positive rate.
+
+    :param capacity: number of keys that fit with the given error rate
+    :type capacity: int
+    :param error_rate: probability that a new key is reported as present
+    :type error_rate: float
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, h1, h2):
+        # * Double hashing, k positions out of two 64 bit hashes
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def contains(self, h1, h2):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2))
+
+    def add(self, h1, h2):
+        """Sets the bits of a key, returns True if any of them was not set"""
+        bits = self.bits
+        new = False
+        for p in self._positions(h1, h2):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+
+class ScalableBloomFilter:
+    """Bloom filter that keeps its false positive rate while it grows, by
+    adding a new filter with twice the capacity and half the error rate every
+    time the last one is full (Almeida et al., Scalable Bloom Filters).
+
+    Keys are 128 bit integers (e.g. the first half of a sha1 fingerprint)
+    whose two 64 bit halves are used as the hashes.
+
+    :param capacity: keys of the first filter
+    :type capacity: int
+    :param error_rate: false positive rate of the whole filter
+    :type error_rate: float
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.filters = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        """Bytes used by the bit arrays"""
+        return sum(len(f.bits) for f in self.filters)
+
+    @staticmethod
+    def _hashes(key):
+        return key & _MASK64, (key >> 64) & _MASK64 | 1
+
+    def __contains__(self, key):
+        h1, h2 = self._hashes(key)
+        return any(f.contains(h1, h2) for f in self.filters)
+
+    def add(self, key):
+        """Adds a key, returns False if it was (probably) already there"""
+        h1, h2 = self._hashes(key)
+        if any(f.contains(h1, h2) for f in self.filters):
+            return False
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            # ! The series of error rates adds up to error_rate
+            n = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.GROWTH ** n,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** n))
+        self.filters[-1].add(h1, h2)
+        self._len += 1
+        return True
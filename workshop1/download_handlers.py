@@ -0,0 +1,63 @@
+"""Download handlers of the project, enabled on DOWNLOAD_HANDLERS.
+
+GlobalConcurrencyDownloadHandler caps the downloads in flight of all the
+crawlers running on the same process (e.g. workshop1.orchestrator) to
+GLOBAL_CONCURRENT_REQUESTS. CONCURRENT_REQUESTS only limits each crawler,
+so without it several spiders would add up their limits.
+
+A token of the shared limit is only taken when the transfer starts, after
+the request went through its download slot (and its delay), and it is given
+back when the transfer ends. A slow or backed off site only holds the tokens
+of the downloads it really has in flight, so it does not starve the others.
+"""
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.misc import create_instance, load_object
+from twisted.internet.defer import DeferredSemaphore
+
+
+class GlobalConcurrencyDownloadHandler:
+    """Download handler that wraps the HTTP one of scrapy (or the one on
+    GLOBAL_CONCURRENCY_HANDLER) and waits for a token of the limit shared by
+    all the crawlers of the process before every download. With
+    GLOBAL_CONCURRENT_REQUESTS at 0 it is the wrapped handler.
+    """
+
+    lazy = False
+
+    # * (limit, semaphore) shared by the crawlers of a run, see reset()
+    _shared = None
+
+    def __init__(self, settings, crawler=None):
+        handler_cls = load_object(settings.get('GLOBAL_CONCURRENCY_HANDLER') or
+                                  HTTP11DownloadHandler)
+        self.handler = create_instance(handler_cls, settings, crawler)
+        self.stats = crawler.stats if crawler is not None else None
+        limit = settings.getint('GLOBAL_CONCURRENT_REQUESTS')
+        self.semaphore = self.shared_semaphore(limit) if limit > 0 else None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    @classmethod
+    def shared_semaphore(cls, limit):
+        # * The first crawler of the run creates it, or a new limit replaces it
+        if cls._shared is None or cls._shared[0] != limit:
+            cls._shared = (limit, DeferredSemaphore(limit))
+        return cls._shared[1]
+
+    @classmethod
+    def reset(cls):
+        """Forgets the shared semaphore, so the next run starts with a new one"""
+        cls._shared = None
+
+    def download_request(self, request, spider):
+        if self.semaphore is None:
+            return self.handler.download_request(request, spider)
+        if self.semaphore.tokens == 0 and self.stats is not None:
+            self.stats.inc_value('global_concurrency/waited', spider=spider)
+        # * run() releases the token when the download ends, fine or failed
+        return self.semaphore.run(self.handler.download_request, request, spider)
+
+    def close(self):
+        return self.handler.close()
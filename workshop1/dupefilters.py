@@ -0,0 +1,90 @@
+import os
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+from .compact_set import CompactDigestSet, CompactIdSet, ScalableBloomFilter
+
+
+class CompactDupeFilter(RFPDupeFilter):
+    """Dupefilter that keeps the request fingerprints as raw digests instead
+    of 40 char hex strings on a set.
+
+    With DUPEFILTER_DIGEST_SIZE = 8 the first 64 bits of every fingerprint
+    are kept on a CompactIdSet, with 16 the first 128 bits on a
+    CompactDigestSet. Like the stock filter, the full fingerprints are still
+    written to requests.seen when JOBDIR is set.
+
+    :param path: JOBDIR of the crawl, or None
+    :type path: str
+    :param debug: log every filtered request
+    :type debug: bool
+    :param digest_size: bytes kept of every fingerprint, 8 or 16
+    :type digest_size: int
+    """
+
+    def __init__(self, path=None, debug=False, digest_size=8):
+        if digest_size not in (8, 16):
+            raise ValueError('DUPEFILTER_DIGEST_SIZE must be 8 or 16, got %r' % digest_size)
+        self.digest_size = digest_size
+        super().__init__(None, debug)
+        self.fingerprints = self._new_set()
+        if path:
+            self.file = open(os.path.join(path, 'requests.seen'), 'a+')
+            self.file.seek(0)
+            for line in self.file:
+                if line.strip():
+                    self.fingerprints.add(self._key(line.rstrip()))
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getint('DUPEFILTER_DIGEST_SIZE', 8))
+
+    def _new_set(self):
+        if self.digest_size == 8:
+            return CompactIdSet()
+        return CompactDigestSet(self.digest_size)
+
+    def _key(self, fingerprint):
+        if self.digest_size == 8:
+            return int(fingerprint[:16], 16)
+        return bytes.fromhex(fingerprint[:32])
+
+    def request_seen(self, request):
+        fingerprint = self.request_fingerprint(request)
+        if not self.fingerprints.add(self._key(fingerprint)):
+            return True
+        if self.file:
+            self.file.write(fingerprint + '\n')
+        return False
+
+
+class BloomDupeFilter(CompactDupeFilter):
+    """Dupefilter on a scalable Bloom filter, that uses a few bits per request
+    at the cost of dropping a share of new requests as if they were repeated.
+    That share is DUPEFILTER_BLOOM_ERROR_RATE, whatever the size of the crawl.
+
+    :param capacity: requests of the first Bloom filter, set it near the
+        expected size of the crawl
+    :type capacity: int
+    :param error_rate: false positive rate
+    :type error_rate: float
+    """
+
+    def __init__(self, path=None, debug=False, capacity=100000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        super().__init__(path, debug, digest_size=16)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getint('DUPEFILTER_BLOOM_CAPACITY', 100000),
+                   settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE', 0.001))
+
+    def _new_set(self):
+        return ScalableBloomFilter(self.capacity, self.error_rate)
+
+    def _key(self, fingerprint):
+        return int(fingerprint[:32], 16)
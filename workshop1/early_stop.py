@@ -0,0 +1,110 @@
+"""Stops following the pagination of a job board once the listings only show
+jobs that were already scraped.
+
+The listings are sorted by recency, so on a daily refresh the new postings
+are all on the first pages. A spider opts in with two attributes:
+
+- pagination_rule: index of the rule that follows the listing pages
+- listing_job_ids(response): method that returns the ids of the jobs shown
+  on a listing page
+
+and EarlyStopMiddleware looks those ids up on the DEDUP_STORE of the
+JobDedupPipeline. After EARLY_STOP_PAGES listing pages in a row with only
+known jobs, the requests of the pagination rule are dropped, so the crawl
+ends with the pages that were already scheduled.
+"""
+import os
+import sqlite3
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request
+
+from .pipelines import job_key
+from .revalidation import REPLAYED
+
+
+class EarlyStopMiddleware:
+    """Spider middleware that drops the pagination of a spider after a number
+    of consecutive listing pages with only known jobs
+
+    :param store_path: path of the sqlite database of JobDedupPipeline
+    :type store_path: str
+    :param pages: listing pages in a row with only known jobs before stopping
+    :type pages: int
+    """
+
+    def __init__(self, store_path, pages, stats):
+        self.store_path = store_path
+        self.pages = pages
+        self.stats = stats
+        self.db = None
+        self.known_pages = 0
+        self.stopped = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pages = crawler.settings.getint('EARLY_STOP_PAGES', 0)
+        if pages <= 0:
+            raise NotConfigured
+        middleware = cls(crawler.settings.get('DEDUP_STORE', 'jobs.sqlite'), pages, crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def _opted_in(self, spider):
+        return (getattr(spider, 'pagination_rule', None) is not None and
+                hasattr(spider, 'listing_job_ids'))
+
+    def _is_listing(self, response, spider):
+        # * The start urls are listing pages too, they have no rule
+        rule = response.meta.get('rule')
+        return rule is None or rule == spider.pagination_rule
+
+    def spider_opened(self, spider):
+        # ! Read only, and only if the store exists: on the first run nothing is known
+        if self._opted_in(spider) and os.path.exists(self.store_path):
+            self.db = sqlite3.connect('file:%s?mode=ro' % self.store_path, uri=True)
+
+    def _known(self, spider, job_ids):
+        """True if there are ids and all of them are on the store"""
+        keys = {job_key(job_id) for job_id in job_ids} - {None}
+        if not keys or self.db is None:
+            return False
+        try:
+            count, = self.db.execute(
+                'SELECT COUNT(*) FROM jobs WHERE spider = ? AND id IN (%s)' % ','.join('?' * len(keys)),
+                (spider.name, *keys)).fetchone()
+        except sqlite3.OperationalError:
+            # ! The table is only created once the pipeline has run
+            return False
+        return count == len(keys)
+
+    def process_spider_output(self, response, result, spider):
+        if not self._opted_in(spider) or not self._is_listing(response, spider):
+            yield from result
+            return
+
+        # * A listing page replayed by workshop1.revalidation shows the same jobs as before
+        if (response.meta.get('revalidation') in REPLAYED or
+                self._known(spider, spider.listing_job_ids(response))):
+            self.known_pages += 1
+            self.stats.inc_value('early_stop/known_pages', spider=spider)
+        else:
+            self.known_pages = 0
+        if not self.stopped and self.known_pages >= self.pages:
+            self.stopped = True
+            self.stats.set_value('early_stop/stopped_at', response.url, spider=spider)
+            spider.logger.info('%d listing pages in a row with only known jobs, not following '
+                               'the pagination after %s', self.known_pages, response.url)
+
+        for element in result:
+            if (self.stopped and isinstance(element, Request) and
+                    element.meta.get('rule') == spider.pagination_rule):
+                self.stats.inc_value('early_stop/dropped', spider=spider)
+                continue
+            yield element
+
+    def spider_closed(self, spider):
+        if self.db is not None:
+            self.db.close()
@@ -0,0 +1,165 @@
+# Define here the custom feed exporters of the project
+#
+# Register them in the FEED_EXPORTERS setting and use the registered name as
+# the 'format' of a FEEDS entry.
+# See: https://docs.scrapy.org/en/latest/topics/feed-exports.html
+
+import datetime
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import BaseItemExporter, CsvItemExporter
+
+
+class AppendCsvItemExporter(CsvItemExporter):
+    """Csv exporter that only writes the header line when the file is empty,
+    so a feed with 'overwrite': False can keep appending rows run after run.
+    """
+
+    def __init__(self, file, **kwargs):
+        super().__init__(file, **kwargs)
+        if file.tell() > 0:
+            self._headers_not_written = False
+
+
+# Types of the columns written by ParquetItemExporter, the fields that are not
+# listed here are written as strings
+PARQUET_FIELD_TYPES = {
+    'id': 'int',
+    'availability': 'int',
+    'posting_date': 'date',
+    'date_posted': 'date',
+    'is_remote': 'bool',
+    'be_in_first_ten': 'bool',
+    'required_skills': 'list',
+    'salary_min': 'float',
+    'salary_max': 'float',
+    'salary_annual': 'float',
+    'region_population': 'int',
+    'region_gdp_per_head': 'int',
+}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() == 'true'
+    return bool(value)
+
+
+def _to_list(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+_CONVERTERS = {
+    'int': _to_int,
+    'float': _to_float,
+    'date': _to_date,
+    'bool': _to_bool,
+    'list': _to_list,
+    'str': str,
+}
+
+
+class ParquetItemExporter(BaseItemExporter):
+    """Exporter that writes typed columns on a parquet file, one row group
+    every ``batch_size`` items, so only one batch is kept in memory.
+
+    Single element lists left by the ItemLoaders are unwrapped, and values
+    that can not be converted to the type of their column are written as
+    nulls. The types can be changed with the ``field_types`` option of the
+    feed's item_export_kwargs. Requires pyarrow.
+    """
+
+    def __init__(self, file, batch_size=1000, field_types=None, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise NotConfigured('ParquetItemExporter requires pyarrow')
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.batch_size = batch_size
+        self.field_types = dict(PARQUET_FIELD_TYPES, **(field_types or {}))
+        self.writer = None
+        self.schema = None
+        self.columns = None
+
+    def _arrow_type(self, kind):
+        pa = self._pa
+        return {
+            'int': pa.int64(),
+            'float': pa.float64(),
+            'date': pa.date32(),
+            'bool': pa.bool_(),
+            'list': pa.list_(pa.string()),
+            'str': pa.string(),
+        }[kind]
+
+    def _start(self, fields):
+        self.fields_to_export = list(fields)
+        self.schema = self._pa.schema([
+            (name, self._arrow_type(self.field_types.get(name, 'str')))
+            for name in self.fields_to_export
+        ])
+        self.columns = {name: [] for name in self.fields_to_export}
+
+    def export_item(self, item):
+        adapter = ItemAdapter(item)
+        if self.schema is None:
+            self._start(self.fields_to_export or adapter.field_names())
+
+        for name in self.fields_to_export:
+            value = adapter.get(name)
+            kind = self.field_types.get(name, 'str')
+            if kind != 'list' and isinstance(value, (list, tuple)):
+                value = value[0] if value else None
+            if value is not None:
+                value = _CONVERTERS[kind](value)
+            self.columns[name].append(value)
+
+        if len(self.columns[self.fields_to_export[0]]) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if self.writer is None:
+            self.writer = self._pq.ParquetWriter(self.file, self.schema)
+        table = self._pa.Table.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_table(table)
+        self.columns = {name: [] for name in self.fields_to_export}
+
+    def finish_exporting(self):
+        if self.schema is None:
+            if not self.fields_to_export:
+                return
+            self._start(self.fields_to_export)
+        if self.writer is None or self.columns[self.fields_to_export[0]]:
+            self._write_batch()
+        self.writer.close()
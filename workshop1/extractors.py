@@ -0,0 +1,189 @@
+import copy
+
+from lxml import etree, html
+from itemloaders.processors import MapCompose, TakeFirst
+from itemloaders.utils import get_func_args
+
+
+class CompiledField:
+    """Field whose XPaths are compiled once and whose processors run in a
+    single pass over the extracted values.
+
+    :param name: name of the field on the emitted dict
+    :type name: str
+    :param xpaths: XPath, or tuple of alternative XPaths tried in order until
+        one of them gives a value
+    :type xpaths: str or tuple
+    :param functions: functions applied to every value, like MapCompose. The
+        ones with a ``loader_context`` argument receive the extraction context
+    :type functions: tuple
+    :param take_first: keep only the first non empty value, like TakeFirst
+    :type take_first: bool
+    :param exists: the field is True if the XPath matches anything, else False
+    :type exists: bool
+    """
+
+    def __init__(self, name, xpaths, functions=(), take_first=False, exists=False):
+        if isinstance(xpaths, str):
+            xpaths = (xpaths,)
+        self.name = name
+        # ! Plain strings like parsel, the "smart" ones of lxml keep a reference
+        # ! to their element, so every item would keep the tree of its page alive
+        self.xpaths = tuple(etree.XPath(xpath, smart_strings=False) for xpath in xpaths)
+        self.functions = tuple(
+            (function, 'loader_context' in get_func_args(function)) for function in functions)
+        self.take_first = take_first
+        self.exists = exists
+
+    def _process(self, values, context):
+        for function, wants_context in self.functions:
+            processed = []
+            for value in values:
+                if wants_context:
+                    value = function(value, loader_context=context)
+                else:
+                    value = function(value)
+                if value is None:
+                    continue
+                if isinstance(value, (list, tuple)):
+                    processed.extend(value)
+                else:
+                    processed.append(value)
+            values = processed
+        return values
+
+    def extract(self, node, context):
+        """Returns the value of the field on a node, or None if there is none"""
+        if self.exists:
+            return any(bool(xpath(node)) for xpath in self.xpaths)
+
+        values = []
+        for xpath in self.xpaths:
+            values = self._process([
+                value if isinstance(value, str)
+                else etree.tostring(value, encoding='unicode', with_tail=False)
+                for value in xpath(node)
+            ], context)
+            if values:
+                break
+
+        if self.take_first:
+            for value in values:
+                if value is not None and value != '':
+                    return value
+            return None
+        return values or None
+
+
+class CompiledExtractor:
+    """Precompiled replacement for the Selector + ItemLoader extraction of a
+    spider, that emits plain dicts with the same values that the ItemLoader
+    would have loaded.
+
+    :param fields: fields to extract
+    :type fields: list of CompiledField
+    :param rows_xpath: XPath of the nodes that hold one item each (listing
+        pages), if None the whole page is a single item
+    :type rows_xpath: str
+    :param constants: values added to every item, like ItemLoader.add_value
+    :type constants: dict
+    :param derived: functions that receive the value of an extracted field and
+        return a dict with more fields computed from it, e.g. salary_fields
+    :type derived: dict mapping a field name to a function
+    """
+
+    def __init__(self, fields, rows_xpath=None, constants=None, derived=None):
+        self.fields = tuple(fields)
+        self.rows_xpath = etree.XPath(rows_xpath) if rows_xpath else None
+        self.constants = constants or {}
+        self.derived = derived or {}
+        self._projections = {}
+
+    @classmethod
+    def from_item(cls, item_cls, xpaths, rows_xpath=None, exists=(), constants=None,
+                  derived=None):
+        """Builds the extractor taking the processors from the fields of an Item,
+        so both extraction paths share the same cleaning functions
+
+        :param item_cls: Item class whose field processors are used
+        :param xpaths: dict with the XPath (or alternatives) of every field
+        :type xpaths: dict
+        :param exists: names of the fields that are True when their XPath matches
+        :type exists: tuple
+        """
+        fields = []
+        for name, xpath in xpaths.items():
+            meta = item_cls.fields[name]
+            input_processor = meta.get('input_processor')
+            output_processor = meta.get('output_processor')
+            if input_processor is not None and not isinstance(input_processor, MapCompose):
+                raise TypeError('Unsupported input processor for %s: %r' % (name, input_processor))
+            if output_processor is not None and not isinstance(output_processor, TakeFirst):
+                raise TypeError('Unsupported output processor for %s: %r' % (name, output_processor))
+            fields.append(CompiledField(
+                name, xpath,
+                functions=input_processor.functions if input_processor else (),
+                take_first=output_processor is not None,
+                exists=name in exists,
+            ))
+        return cls(fields, rows_xpath=rows_xpath, constants=constants, derived=derived)
+
+    def project(self, fields):
+        """Returns the extractor of only some of the fields (and the derived
+        fields of them), see workshop1.projection. The extractors are cached,
+        so it can be called for every page
+
+        :param fields: names of the fields to extract, None extracts all of them
+        :type fields: frozenset
+        :rtype: CompiledExtractor
+        """
+        if fields is None:
+            return self
+        projected = self._projections.get(fields)
+        if projected is None:
+            projected = copy.copy(self)
+            projected.fields = tuple(field for field in self.fields if field.name in fields)
+            projected.constants = {
+                name: value for name, value in self.constants.items() if name in fields}
+            projected.derived = {
+                name: function for name, function in self.derived.items() if name in fields}
+            projected._projections = {}
+            self._projections[fields] = projected
+        return projected
+
+    def extract(self, node, context=None, item_cls=None):
+        """Returns the dict with the fields found on a node. The context is
+        passed to the processors like the context of an ItemLoader, and with
+        item_cls the fields are returned on an item of that class instead"""
+        if context is None:
+            context = {}
+        item = {}
+        for field in self.fields:
+            value = field.extract(node, context)
+            if value is not None:
+                item[field.name] = value
+        for name, value in self.constants.items():
+            item[name] = value
+        for name, function in self.derived.items():
+            item.update(function(item.get(name)))
+        return item if item_cls is None else item_cls(**item)
+
+    def extract_root(self, root, context=None, item_cls=None):
+        """Returns the list of items found on the root node of a page"""
+        if self.rows_xpath is None:
+            return [self.extract(root, context, item_cls)]
+        return [self.extract(row, context, item_cls) for row in self.rows_xpath(root)]
+
+    def extract_response(self, response, context=None, item_cls=None):
+        """Returns the list of items found on a response"""
+        return self.extract_root(response.selector.root, context, item_cls)
+
+    def extract_body(self, body, encoding='utf-8', base_url=None, context=None,
+                     item_cls=None):
+        """Returns the list of items found on the raw html of a page, used when
+        there is no response object, e.g. on the workers of a ParsePool"""
+        parser = html.HTMLParser(recover=True, encoding=encoding)
+        root = etree.fromstring(body, parser=parser, base_url=base_url)
+        if root is None:
+            return []
+        return self.extract_root(root, context, item_cls)
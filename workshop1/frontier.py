@@ -0,0 +1,276 @@
+"""Crawl frontier shared by several crawler processes, so one spider can be
+sharded across worker processes:
+
+    scrapy crawl reed_uk -s SCHEDULER=workshop1.frontier.SharedFrontierScheduler \\
+        -s FRONTIER_DB=/var/tmp/reed_uk_frontier.sqlite
+
+Run the same command on every worker. All the requests are pushed to the
+shared frontier, which drops the ones that were already queued by any worker,
+and every worker leases the next requests from it. A leased request can only
+be downloaded by the worker that holds the lease. Workers renew their leases
+while they hold the requests and acknowledge each request once it is
+downloaded, or once it fails or is ignored before its download (robots.txt,
+circuit breaker), which FrontierAckMiddleware reports. If a worker dies, its leases expire after FRONTIER_LEASE seconds
+and the requests go back to the other workers.
+
+A frontier holds one crawl, use a new FRONTIER_DB for every crawl.
+
+! SqliteFrontier is for the workers of a single host: the WAL mode of sqlite
+! needs shared memory, so it does not work on a network filesystem (NFS, SMB).
+! Workers on several nodes need a networked backend on FRONTIER_BACKEND, any
+! class with the methods of SqliteFrontier (e.g. one on Redis or Postgres).
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import time
+import uuid
+from collections import deque
+
+from scrapy import signals
+from scrapy.utils.misc import load_object
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+from scrapy.utils.request import request_fingerprint
+from twisted.internet import task
+
+
+class SqliteFrontier:
+    """Frontier stored on a sqlite database that several processes of the
+    same host can open at the same time, the database has to be on a local
+    disk. Any class with the same methods (e.g. one on Redis) can be used
+    instead with the FRONTIER_BACKEND setting.
+
+    :param path: path of the sqlite database
+    :type path: str
+    :param lease: seconds that a worker keeps the requests it takes
+    :type lease: float
+    """
+
+    def __init__(self, path, lease=300.0):
+        self.lease = lease
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS frontier ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, spider TEXT NOT NULL, '
+            'key TEXT NOT NULL, priority INTEGER NOT NULL, data BLOB NOT NULL, '
+            "state TEXT NOT NULL DEFAULT 'queued', worker TEXT, lease_until REAL, "
+            'UNIQUE (spider, key))')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS frontier_next ON frontier (spider, state, priority DESC, seq)')
+
+    def push(self, spider, key, priority, data):
+        """Adds a request, returns False if a request with the same key was
+        already added by any worker"""
+        cursor = self.db.execute(
+            'INSERT OR IGNORE INTO frontier (spider, key, priority, data) VALUES (?, ?, ?, ?)',
+            (spider, key, priority, data))
+        return cursor.rowcount == 1
+
+    def claim(self, spider, worker, count):
+        """Leases up to count requests to a worker, taking first the ones whose
+        lease expired, and returns their (key, data)"""
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.db.execute(
+                "SELECT seq, key, data FROM frontier WHERE spider = ? AND state = 'leased' "
+                'AND lease_until < ? LIMIT ?', (spider, now, count)).fetchall()
+            if len(rows) < count:
+                rows += self.db.execute(
+                    "SELECT seq, key, data FROM frontier WHERE spider = ? AND state = 'queued' "
+                    'ORDER BY priority DESC, seq LIMIT ?', (spider, count - len(rows))).fetchall()
+            self.db.executemany(
+                "UPDATE frontier SET state = 'leased', worker = ?, lease_until = ? WHERE seq = ?",
+                [(worker, now + self.lease, seq) for seq, _, _ in rows])
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return [(key, data) for _, key, data in rows]
+
+    def ack(self, spider, worker, key):
+        """Marks a request leased by the worker as done"""
+        self.db.execute(
+            "UPDATE frontier SET state = 'done', lease_until = NULL "
+            "WHERE spider = ? AND key = ? AND worker = ? AND state = 'leased'",
+            (spider, key, worker))
+
+    def renew(self, spider, worker, keys):
+        """Extends the leases of the requests that the worker still holds"""
+        lease_until = time.time() + self.lease
+        self.db.executemany(
+            "UPDATE frontier SET lease_until = ? "
+            "WHERE spider = ? AND key = ? AND worker = ? AND state = 'leased'",
+            [(lease_until, spider, key, worker) for key in keys])
+
+    def release(self, spider, worker, keys):
+        """Gives back requests leased by the worker without downloading them"""
+        self.db.executemany(
+            "UPDATE frontier SET state = 'queued', worker = NULL, lease_until = NULL "
+            "WHERE spider = ? AND key = ? AND worker = ? AND state = 'leased'",
+            [(spider, key, worker) for key in keys])
+
+    def pending(self, spider):
+        """Requests queued or leased, the ones leased by other workers can
+        still add new requests to the frontier"""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM frontier WHERE spider = ? AND state != 'done'",
+            (spider,)).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+class SharedFrontierScheduler:
+    """Scheduler that keeps the requests of the spider on a shared frontier
+    instead of on memory. It replaces the dupefilter too, as the frontier
+    already drops the requests that any worker has queued.
+
+    Requests with dont_filter (start urls, retries) are keyed by their
+    fingerprint and retry count, so the start urls of all the workers are
+    still fetched only once while every retry gets its own entry. A leased
+    request that is scheduled again (e.g. delayed by the circuit breaker)
+    gets a new random key, as it has to be fetched again however many times
+    it is delayed.
+
+    The number of pending requests is read from the frontier at most every
+    PENDING_TTL seconds (len() is called for every request by the pacing of
+    the rules), and kept up to date in between with the requests that this
+    worker pushes and acknowledges.
+    """
+
+    PENDING_TTL = 1.0
+
+    def __init__(self, crawler, frontier, worker, batch_size):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.frontier = frontier
+        self.worker = worker
+        self.batch_size = batch_size
+        self.buffer = deque()
+        self.leased = set()
+        self.renewer = None
+        self.spider = None
+        self.pending_count = None
+        self.pending_checked = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        backend = load_object(settings.get('FRONTIER_BACKEND', 'workshop1.frontier.SqliteFrontier'))
+        frontier = backend(settings.get('FRONTIER_DB', 'frontier.sqlite'),
+                           lease=settings.getfloat('FRONTIER_LEASE', 300.0))
+        worker = settings.get('FRONTIER_WORKER_ID') or '%s:%d' % (socket.gethostname(), os.getpid())
+        scheduler = cls(crawler, frontier, worker, settings.getint('FRONTIER_BATCH_SIZE', 16))
+        crawler.signals.connect(scheduler.request_done, signal=signals.response_received)
+        crawler.signals.connect(scheduler.request_done, signal=signals.request_left_downloader)
+        return scheduler
+
+    @staticmethod
+    def _key(request):
+        key = request_fingerprint(request)
+        if request.dont_filter:
+            key = '%s/%d' % (key, request.meta.get('retry_times', 0))
+        return key
+
+    def open(self, spider):
+        self.spider = spider
+        # * Renew the leases three times per lease period, so they only
+        # * expire when the worker stops
+        self.renewer = task.LoopingCall(self.renew_leases)
+        self.renewer.start(self.frontier.lease / 3, now=False)
+
+    def close(self, reason):
+        if self.renewer is not None and self.renewer.running:
+            self.renewer.stop()
+        if self.buffer:
+            self.frontier.release(self.spider.name, self.worker,
+                                  [request.meta['frontier_key'] for request in self.buffer])
+            self.buffer.clear()
+        self.frontier.close()
+
+    def renew_leases(self):
+        if self.leased:
+            self.frontier.renew(self.spider.name, self.worker, self.leased)
+
+    def _pending(self, fresh=False):
+        now = time.monotonic()
+        if fresh or self.pending_count is None or now - self.pending_checked > self.PENDING_TTL:
+            self.pending_count = self.frontier.pending(self.spider.name)
+            self.pending_checked = now
+        return self.pending_count
+
+    def has_pending_requests(self):
+        # ! The spider closes when this is False, so a cached 0 is checked again
+        return bool(self.buffer) or self._pending() > 0 or self._pending(fresh=True) > 0
+
+    def __len__(self):
+        return len(self.buffer) + self._pending()
+
+    def enqueue_request(self, request):
+        previous = request.meta.pop('frontier_key', None)
+        if previous is not None:
+            key = '%s/%s' % (request_fingerprint(request), uuid.uuid4().hex)
+        else:
+            key = self._key(request)
+        data = pickle.dumps(request_to_dict(request, self.spider), protocol=4)
+        if not self.frontier.push(self.spider.name, key, request.priority, data):
+            self.stats.inc_value('frontier/duplicate', spider=self.spider)
+            return False
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        self.stats.inc_value('frontier/pushed', spider=self.spider)
+        if self.pending_count is not None:
+            self.pending_count += 1
+        return True
+
+    def next_request(self):
+        if not self.buffer:
+            for key, data in self.frontier.claim(self.spider.name, self.worker, self.batch_size):
+                request = request_from_dict(pickle.loads(data), self.spider)
+                request.meta['frontier_key'] = key
+                self.buffer.append(request)
+                self.leased.add(key)
+            self.stats.inc_value('frontier/claimed', len(self.buffer), spider=self.spider)
+        if not self.buffer:
+            return None
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return self.buffer.popleft()
+
+    def request_done(self, request, spider, response=None):
+        """Acknowledges a leased request that was downloaded, failed or was
+        ignored, so the frontier does not keep it pending"""
+        key = request.meta.pop('frontier_key', None)
+        if key in self.leased:
+            self.leased.discard(key)
+            self.frontier.ack(spider.name, self.worker, key)
+            if self.pending_count:
+                self.pending_count -= 1
+
+
+class FrontierAckMiddleware:
+    """Downloader middleware that reports to SharedFrontierScheduler the
+    leased requests that never reach the downloader, as no signal is sent for
+    them: the ones that a process_request raises on (IgnoreRequest of
+    robots.txt, of the circuit breaker or of the offline replay). Without it
+    they stay leased, their leases are renewed and the spider never closes.
+
+    Its process_exception has to run before the ones that raise, so it needs
+    the highest order of DOWNLOADER_MIDDLEWARES. It does nothing with the
+    other schedulers.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_exception(self, request, exception, spider):
+        if 'frontier_key' in request.meta:
+            scheduler = getattr(self.crawler.engine.slot, 'scheduler', None)
+            if isinstance(scheduler, SharedFrontierScheduler):
+                scheduler.request_done(request, spider)
+        return None
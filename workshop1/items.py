@@ -3,10 +3,63 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+import dataclasses
+from typing import Any, Optional
+
 import scrapy
+from itemadapter import ItemAdapter
 
 
 class Workshop1Item(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+def compact_item(item_cls, types=None, name=None):
+    """Function that builds the compact version of an Item class: a dataclass
+    with __slots__, so every item keeps its values on fixed slots instead of
+    on a dict. It has the same fields, with the same metadata (the processors
+    used by ItemLoader), so it works with ItemLoader, itemadapter and the feed
+    exporters. The fields that were never loaded are None.
+
+    :param item_cls: Item class whose fields are copied
+    :type item_cls: type
+    :param types: type of the value of every field, the missing ones are Any
+    :type types: dict
+    :param name: name of the class, 'Compact' + the name of the Item by default
+    :type name: str
+    :rtype: type
+    """
+    types = types or {}
+    name = name or 'Compact' + item_cls.__name__
+    fields = [
+        (field, Optional[types.get(field, Any)], dataclasses.field(default=None, metadata=meta))
+        for field, meta in item_cls.fields.items()
+    ]
+    cls = _with_slots(dataclasses.make_dataclass(name, fields))
+    # * So the items can be pickled, it has to be assigned to this name on the module
+    cls.__module__ = item_cls.__module__
+    return cls
+
+
+def loaded_fields(item):
+    """Function that returns the fields of an item that have a value, the same
+    dict with an Item and with its compact version (which has every field, the
+    missing ones None)
+
+    :rtype: dict
+    """
+    return {name: value for name, value in ItemAdapter(item).items()
+            if value is not None and value != []}
+
+
+def _with_slots(cls):
+    # ! The same that dataclass(slots=True) does, which needs Python 3.10
+    names = tuple(field.name for field in dataclasses.fields(cls))
+    namespace = {
+        key: value for key, value in cls.__dict__.items()
+        if key not in names and key not in ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
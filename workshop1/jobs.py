@@ -0,0 +1,35 @@
+"""The job spiders and the merged format that their items share, used by the
+orchestrator and by the pipelines that compare the jobs of several boards.
+"""
+from itemadapter import ItemAdapter
+
+JOB_SPIDERS = ('reed_uk', 'total_jobs', 'indeed', 'upwork')
+
+# Names used on the merged output for the fields that each board calls
+# differently, the rest of the fields keep their name
+FIELD_ALIASES = {
+    'employer': 'company',
+    'posting_date': 'date_posted',
+    'employment_type': 'job_type',
+    'locality': 'location',
+}
+
+# Fields that keep their list of values, the rest are unwrapped
+LIST_FIELDS = ('required_skills',)
+
+
+def merged_job(board, item):
+    """Function that converts an item of any job spider to the merged format
+
+    :param board: name of the spider that scraped the item
+    :type board: str
+    :param item: item scraped by the spider
+    :return: dict with the board and the fields renamed with FIELD_ALIASES
+    :rtype: dict
+    """
+    job = {'board': board}
+    for name, value in ItemAdapter(item).items():
+        if name not in LIST_FIELDS and isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        job[FIELD_ALIASES.get(name, name)] = value
+    return job
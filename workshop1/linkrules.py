@@ -0,0 +1,287 @@
+"""Link extraction for all the rules of a CrawlSpider in a single pass.
+
+The stock CrawlSpider runs the LinkExtractor of every rule on its own, so on
+a listing page with several rules each one walks the whole document, joins
+and encodes every href, collects the text of every anchor and runs its own
+allow/deny regexes over every url. CombinedLinkRules does that work once per
+page:
+
+- the anchors are collected from the parsed document of the response, and
+  every anchor is turned into a Link only once
+- every restrict_xpaths is compiled once and evaluated once per page, even
+  when several rules share it
+- the allow and deny patterns of all the rules are joined in one regex, so a
+  single match per url tells which patterns it matches
+
+Every rule still gets the same links, in the same order, as its LinkExtractor
+would give. The extractors that it cannot reproduce (other tags or
+attributes, process_value, a subclass, ...) keep using their extract_links.
+"""
+import operator
+import re
+from urllib.parse import urljoin, urlparse
+
+from lxml import etree
+from parsel import Selector
+from scrapy.http import HtmlResponse
+from scrapy.link import Link
+from scrapy.linkextractors import _is_valid_url, _matches
+from scrapy.linkextractors.lxmlhtml import LxmlLinkExtractor, _collect_string_content, _identity
+from scrapy.utils.misc import rel_has_nofollow
+from scrapy.utils.python import unique as unique_list
+from scrapy.utils.response import get_base_url
+from scrapy.utils.url import url_has_any_extension, url_is_from_any_domain
+from w3lib.html import strip_html5_whitespace
+from w3lib.url import canonicalize_url, safe_url_string
+
+LINK_TAGS = ('a', 'area')
+LINK_ATTR = 'href'
+
+# Flags of a compiled pattern that can be kept on its group of the combined regex
+INLINE_FLAGS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'))
+
+# ! Group numbers change on the combined regex, so numbered backreferences break
+BACKREFERENCE_RE = re.compile(r'\\[1-9]')
+
+
+def _supported(extractor):
+    """True if CombinedLinkRules gives the same links as the extractor"""
+    if type(extractor) is not LxmlLinkExtractor:
+        return False
+    parser = extractor.link_extractor
+    tags = getattr(parser.scan_tag, 'args', ((),))[0]
+    attrs = getattr(parser.scan_attr, 'args', ((),))[0]
+    return (set(tags) == set(LINK_TAGS) and set(attrs) == {LINK_ATTR}
+            and parser.process_attr is _identity and parser.strip)
+
+
+def _group_source(regex):
+    """Source of a pattern for its group of the combined regex
+
+    :raises ValueError: if the pattern can not be part of the combined regex
+    """
+    if not isinstance(regex.pattern, str) or regex.flags & re.VERBOSE:
+        raise ValueError(regex.pattern)
+    if BACKREFERENCE_RE.search(regex.pattern):
+        raise ValueError(regex.pattern)
+    flags = ''.join(letter for flag, letter in INLINE_FLAGS if regex.flags & flag)
+    source = '(?%s:%s)' % (flags, regex.pattern) if flags else regex.pattern
+    # * Fails here, and not on the combined regex, if the pattern has e.g. named groups
+    re.compile('(?=%s)' % source)
+    return source
+
+
+class _RuleLinks:
+    """Reproduces the extract_links of one LxmlLinkExtractor on a _Page,
+    with the work that does not depend on the rule cached on the page
+
+    :param extractor: link extractor of the rule
+    :type extractor: scrapy.linkextractors.LinkExtractor
+    :param allow: names of the groups of its allow patterns on the combined regex
+    :type allow: tuple
+    :param deny: names of the groups of its deny patterns on the combined regex
+    :type deny: tuple
+    """
+
+    def __init__(self, extractor, allow, deny):
+        self.extractor = extractor
+        self.allow = allow
+        self.deny = deny
+
+    def _allowed(self, link, page):
+        # * Same checks and order as FilteringLinkExtractor._link_allowed
+        extractor = self.extractor
+        if not _is_valid_url(link.url):
+            return False
+        matched = page.matched_groups(link.url)
+        if self.allow and matched.isdisjoint(self.allow):
+            return False
+        if self.deny and not matched.isdisjoint(self.deny):
+            return False
+        if extractor.allow_domains or extractor.deny_domains or extractor.deny_extensions:
+            parsed_url = urlparse(link.url)
+            if extractor.allow_domains and not url_is_from_any_domain(
+                    parsed_url, extractor.allow_domains):
+                return False
+            if extractor.deny_domains and url_is_from_any_domain(
+                    parsed_url, extractor.deny_domains):
+                return False
+            if extractor.deny_extensions and url_has_any_extension(
+                    parsed_url, extractor.deny_extensions):
+                return False
+        if extractor.restrict_text and not _matches(link.text, extractor.restrict_text):
+            return False
+        return True
+
+    def extract_links(self, page):
+        extractor = self.extractor
+        unique = extractor.link_extractor.unique
+        if extractor.canonicalize:
+            key = operator.attrgetter('url')
+        else:
+            def key(link):
+                return page.canonical_url(link.url, keep_fragments=True)
+        all_links = []
+        for region in page.regions(extractor.restrict_xpaths):
+            links = page.links(region)
+            if unique:
+                links = unique_list(links, key=key)
+            links = [link for link in links if self._allowed(link, page)]
+            if extractor.canonicalize:
+                # ! New Links, the ones of the page are shared with the other rules
+                links = [Link(page.canonical_url(link.url), link.text, link.fragment,
+                              link.nofollow) for link in links]
+                if unique:
+                    links = unique_list(links, key=key)
+            all_links.extend(links)
+        return unique_list(all_links)
+
+
+class _Page:
+    """Work shared by all the rules on one response
+
+    :param response: page whose links are extracted
+    :type response: scrapy.http.HtmlResponse
+    :param rules: the CombinedLinkRules of the spider
+    :type rules: CombinedLinkRules
+    """
+
+    def __init__(self, response, rules):
+        self.response = response
+        self.rules = rules
+        self.root = response.selector.root
+        self.base_url = get_base_url(response)
+        self._links = {}
+        self._urls = {}
+        self._regions = {}
+        self._matched = {}
+        self._canonical = {}
+
+    def regions(self, restrict_xpaths):
+        """Elements whose anchors are extracted, in the order of restrict_xpaths"""
+        if not restrict_xpaths:
+            return [self.root]
+        regions = []
+        for xpath in restrict_xpaths:
+            if xpath not in self._regions:
+                self._regions[xpath] = [
+                    node for node in self.rules.xpaths[xpath](self.root)
+                    if isinstance(node, etree._Element)]
+            regions.extend(self._regions[xpath])
+        return regions
+
+    def _absolute_url(self, href):
+        response = self.response
+        try:
+            url = urljoin(self.base_url, strip_html5_whitespace(href))
+        except ValueError:
+            return None
+        return urljoin(response.url, safe_url_string(url, encoding=response.encoding))
+
+    def _link(self, element):
+        href = element.get(LINK_ATTR)
+        if href is None:
+            return None
+        # * Listings link the same href several times (image, title, ...)
+        if href not in self._urls:
+            self._urls[href] = self._absolute_url(href)
+        url = self._urls[href]
+        if url is None:
+            return None
+        return Link(url, _collect_string_content(element) or '',
+                    nofollow=rel_has_nofollow(element.get('rel')))
+
+    def links(self, region):
+        """Links of the anchors inside an element, each one is built only once"""
+        links = []
+        for element in region.iter(*LINK_TAGS):
+            if element not in self._links:
+                self._links[element] = self._link(element)
+            link = self._links[element]
+            if link is not None:
+                links.append(link)
+        return links
+
+    def canonical_url(self, url, keep_fragments=False):
+        """canonicalize_url of w3lib, computed once per url"""
+        if (url, keep_fragments) not in self._canonical:
+            self._canonical[url, keep_fragments] = canonicalize_url(
+                url, keep_fragments=keep_fragments)
+        return self._canonical[url, keep_fragments]
+
+    def matched_groups(self, url):
+        """Names of the allow and deny patterns of any rule found on the url"""
+        if url not in self._matched:
+            match = self.rules.combined.match(url)
+            self._matched[url] = frozenset(
+                name for name, value in match.groupdict().items() if value is not None)
+        return self._matched[url]
+
+
+class CombinedLinkRules:
+    """Extracts the links of all the rules of a spider at once
+
+    :param rules: compiled rules of the spider (CrawlSpider._rules)
+    :type rules: list
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.xpaths = {}
+        self.plans = []
+        groups = {}
+        for rule in rules:
+            self.plans.append(self._plan(rule.link_extractor, groups))
+        # * One optional lookahead per pattern, a group is set when its pattern
+        # * is found anywhere on the url
+        self.combined = re.compile(''.join(
+            '(?:(?=(?s:.*?)(?P<%s>%s)))?' % (name, source) for source, name in groups.items()))
+
+    def _plan(self, extractor, groups):
+        if not _supported(extractor):
+            return None
+        try:
+            sources = {regex: _group_source(regex)
+                       for regex in extractor.allow_res + extractor.deny_res}
+            xpaths = {xpath: self.xpaths.get(xpath) or etree.XPath(
+                xpath, namespaces=Selector._default_namespaces)
+                for xpath in extractor.restrict_xpaths}
+        except (ValueError, re.error, etree.XPathError):
+            return None
+        self.xpaths.update(xpaths)
+        for source in sources.values():
+            groups.setdefault(source, 'p%d' % len(groups))
+        return _RuleLinks(
+            extractor,
+            tuple(groups[sources[regex]] for regex in extractor.allow_res),
+            tuple(groups[sources[regex]] for regex in extractor.deny_res))
+
+    def extract_links(self, response):
+        """Returns the list of links of every rule, in the order of the rules"""
+        page = _Page(response, self)
+        return [rule.link_extractor.extract_links(response) if plan is None
+                else plan.extract_links(page)
+                for rule, plan in zip(self.rules, self.plans)]
+
+
+class CombinedRulesMixin:
+    """Mixin for a CrawlSpider that extracts the links of its rules with
+    CombinedLinkRules, put it before CrawlSpider on the bases of the spider.
+    The links go through process_links and process_request like always.
+    """
+
+    def _compile_rules(self):
+        super()._compile_rules()
+        self._link_rules = CombinedLinkRules(self._rules)
+
+    def _requests_to_follow(self, response):
+        if not isinstance(response, HtmlResponse):
+            return
+        seen = set()
+        rule_links = self._link_rules.extract_links(response)
+        for rule_index, (rule, links) in enumerate(zip(self._rules, rule_links)):
+            links = [lnk for lnk in links if lnk not in seen]
+            for link in rule.process_links(links):
+                seen.add(link)
+                request = self._build_request(rule_index, link)
+                yield rule.process_request(request, response)
@@ -3,11 +3,25 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
 from scrapy import signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import request_fingerprint
+from scrapy.utils.response import response_status_message
+from twisted.internet import reactor
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .response_store import ResponseStore
+
 
 class Workshop1SpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -61,11 +75,30 @@ class Workshop1DownloaderMiddleware:
     # scrapy acts as if the downloader middleware does not modify the
     # passed objects.
 
+    # When RESPONSE_STORE_ENABLED is set, every downloaded response is saved
+    # on RESPONSE_STORE_DIR/<spider name>. With RESPONSE_STORE_REPLAY the
+    # stored responses are returned instead, and requests that were never
+    # stored are ignored, so the spider runs without any network.
+    # The time of every download is kept on the 'fetched_at' meta of the
+    # request, and restored from the store when the response is replayed.
+
+    def __init__(self, store_enabled=False, store_dir='responsestore', replay=False):
+        self.store_enabled = store_enabled or replay
+        self.store_dir = store_dir
+        self.replay = replay
+        self.store = None
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(
+            store_enabled=crawler.settings.getbool('RESPONSE_STORE_ENABLED'),
+            store_dir=crawler.settings.get('RESPONSE_STORE_DIR', 'responsestore'),
+            replay=crawler.settings.getbool('RESPONSE_STORE_REPLAY'),
+        )
+        s.stats = crawler.stats
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def process_request(self, request, spider):
@@ -78,6 +111,13 @@ class Workshop1DownloaderMiddleware:
         # - or return a Request object
         # - or raise IgnoreRequest: process_exception() methods of
         #   installed downloader middleware will be called
+        if self.store is not None and self.replay:
+            response = self.store.retrieve(request_fingerprint(request), request)
+            if response is None:
+                self.stats.inc_value('response_store/replay_miss', spider=spider)
+                raise IgnoreRequest('Response not stored: %s' % request.url)
+            self.stats.inc_value('response_store/replay_hit', spider=spider)
+            return response
         return None
 
     def process_response(self, request, response, spider):
@@ -87,6 +127,15 @@ class Workshop1DownloaderMiddleware:
         # - return a Response object
         # - return a Request object
         # - or raise IgnoreRequest
+        if 'stored' in response.flags:
+            return response
+        request.meta['fetched_at'] = time.time()
+        # ! A 304 of a conditional request (workshop1.revalidation) has no body,
+        # ! it would replace the stored page
+        if (self.store is not None and not self.replay and response.status < 400
+                and response.status != 304):
+            self.store.store(request_fingerprint(request), response, request.meta['fetched_at'])
+            self.stats.inc_value('response_store/stored', spider=spider)
         return response
 
     def process_exception(self, request, exception, spider):
@@ -101,3 +150,299 @@ class Workshop1DownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+        if self.store_enabled:
+            self.store = ResponseStore(os.path.join(self.store_dir, spider.name))
+
+    def spider_closed(self, spider):
+        if self.store is not None:
+            self.store.close()
+
+
+class AdaptiveThrottleMiddleware:
+    # Rate controller that replaces the fixed download delays. Every domain
+    # (download slot) starts at ADAPTIVE_THROTTLE_START_DELAY with a single
+    # request in flight, then:
+    # - while the responses are fine and their latency stays close to the
+    #   best latency seen, the delay shrinks towards the minimum and, once
+    #   there, one more concurrent request is allowed every time as many
+    #   responses as allowed requests arrive (additive increase)
+    # - on a 429/503, a download error or a latency above
+    #   ADAPTIVE_THROTTLE_LATENCY_FACTOR times the best one, the concurrency
+    #   is halved and the delay doubled (multiplicative decrease), at most
+    #   once per latency period so a burst of errors counts as one signal.
+    #   With a single request in flight the delay is raised instead.
+    # The current delay and concurrency of every domain are kept on the stats.
+
+    # ! Latencies below this (seconds) are never considered slow, so the jitter
+    # ! of very fast sites does not trigger back offs
+    LATENCY_FLOOR = 0.2
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_delay = settings.getfloat('ADAPTIVE_THROTTLE_START_DELAY', 1.0)
+        self.min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.0)
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 60.0)
+        self.max_concurrency = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 16)
+        self.latency_factor = settings.getfloat('ADAPTIVE_THROTTLE_LATENCY_FACTOR', 2.0)
+        self.backoff_codes = set(settings.getlist(
+            'ADAPTIVE_THROTTLE_BACKOFF_HTTP_CODES', [429, 503]))
+        self.states = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _slot(self, request, spider):
+        downloader = self.crawler.engine.downloader
+        key = request.meta.get('download_slot') or downloader._get_slot_key(request, spider)
+        return key, downloader.slots.get(key)
+
+    def _state(self, key, slot):
+        state = self.states.get(key)
+        if state is None:
+            slot.delay = self.start_delay
+            slot.concurrency = 1
+            state = self.states[key] = {
+                'latency': None, 'best_latency': None, 'successes': 0, 'last_backoff': 0.0,
+            }
+            self._record(key, slot)
+        return state
+
+    def _record(self, key, slot):
+        self.stats.set_value('adaptive_throttle/%s/delay' % key, round(slot.delay, 3))
+        self.stats.set_value('adaptive_throttle/%s/concurrency' % key, slot.concurrency)
+
+    def process_request(self, request, spider):
+        key, slot = self._slot(request, spider)
+        if slot is not None:
+            self._state(key, slot)
+        return None
+
+    def process_response(self, request, response, spider):
+        key, slot = self._slot(request, spider)
+        if slot is None or 'stored' in response.flags:
+            return response
+        state = self._state(key, slot)
+
+        if response.status in self.backoff_codes:
+            self._backoff(key, slot, state, 'http_%d' % response.status)
+            return response
+        if response.status >= 400:
+            return response
+
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            state['latency'] = latency if state['latency'] is None \
+                else 0.8 * state['latency'] + 0.2 * latency
+            if state['best_latency'] is None or state['latency'] < state['best_latency']:
+                state['best_latency'] = max(state['latency'], self.LATENCY_FLOOR)
+
+        if state['latency'] is not None and \
+                state['latency'] > self.latency_factor * state['best_latency']:
+            self._backoff(key, slot, state, 'latency')
+        else:
+            self._ramp_up(key, slot, state)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # ! process_exception also gets the exceptions raised by the
+        # ! process_request of other middlewares (IgnoreRequest of robots.txt,
+        # ! of the circuit breaker...), only the download errors are signals
+        if not isinstance(exception, RetryMiddleware.EXCEPTIONS_TO_RETRY):
+            return None
+        key, slot = self._slot(request, spider)
+        if slot is not None:
+            self._backoff(key, slot, self._state(key, slot), 'exception')
+        return None
+
+    def _ramp_up(self, key, slot, state):
+        if slot.delay > self.min_delay:
+            slot.delay = max(self.min_delay, slot.delay * 0.8 - 0.01)
+        elif slot.concurrency < self.max_concurrency:
+            state['successes'] += 1
+            if state['successes'] >= slot.concurrency:
+                state['successes'] = 0
+                slot.concurrency += 1
+                self.stats.inc_value('adaptive_throttle/rampup_count')
+        self._record(key, slot)
+
+    def _backoff(self, key, slot, state, reason):
+        now = time.time()
+        if now - state['last_backoff'] < max(state['latency'] or 0, slot.delay):
+            return
+        state['last_backoff'] = now
+        state['successes'] = 0
+        if slot.concurrency > 1:
+            slot.concurrency //= 2
+            slot.delay = min(self.max_delay, slot.delay * 2)
+        else:
+            slot.delay = min(self.max_delay, max(self.start_delay, slot.delay * 2))
+        self.stats.inc_value('adaptive_throttle/backoff_count')
+        self.stats.inc_value('adaptive_throttle/backoff_reason/%s' % reason)
+        self._record(key, slot)
+
+
+class BackoffRetryMiddleware:
+    # Replacement of scrapy's RetryMiddleware (it reads the same RETRY_*
+    # settings). The failed requests are not re-queued right away:
+    # - every retry waits RETRY_BACKOFF_BASE * 2 ** (retries - 1) seconds (up
+    #   to RETRY_BACKOFF_MAX) with random jitter, or the Retry-After sent by
+    #   the server if it is longer, and only then goes back to the scheduler,
+    #   so it does not hold a download slot while it waits
+    # - each domain can retry at most RETRY_BUDGET_MIN plus RETRY_BUDGET_RATIO
+    #   of its requests, once the budget is spent the failures are final
+    # - when the failures of the last CIRCUIT_BREAKER_WINDOW responses of a
+    #   domain reach CIRCUIT_BREAKER_THRESHOLD, the domain is paused for
+    #   CIRCUIT_BREAKER_PAUSE seconds and its requests wait for it to reopen
+    # Requests that do not go through the scheduler (robots.txt) are left
+    # alone, they can not be scheduled again.
+
+    EXCEPTIONS_TO_RETRY = RetryMiddleware.EXCEPTIONS_TO_RETRY
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RETRY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.retry_http_codes = set(int(x) for x in settings.getlist('RETRY_HTTP_CODES'))
+        self.backoff_base = settings.getfloat('RETRY_BACKOFF_BASE', 1.0)
+        self.backoff_max = settings.getfloat('RETRY_BACKOFF_MAX', 120.0)
+        self.budget_min = settings.getint('RETRY_BUDGET_MIN', 10)
+        self.budget_ratio = settings.getfloat('RETRY_BUDGET_RATIO', 0.2)
+        self.breaker_window = settings.getint('CIRCUIT_BREAKER_WINDOW', 20)
+        self.breaker_threshold = settings.getfloat('CIRCUIT_BREAKER_THRESHOLD', 0.5)
+        self.breaker_pause = settings.getfloat('CIRCUIT_BREAKER_PAUSE', 60.0)
+        self.domains = {}
+        self.delayed = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _domain(self, request):
+        key = urlparse_cached(request).hostname or ''
+        domain = self.domains.get(key)
+        if domain is None:
+            domain = self.domains[key] = {
+                'requests': 0, 'retries': 0,
+                'outcomes': deque(maxlen=self.breaker_window), 'open_until': 0.0,
+            }
+        return key, domain
+
+    @staticmethod
+    def _schedulable(request):
+        return not request.meta.get('dont_obey_robotstxt')
+
+    def _delay(self, request, response=None):
+        retries = request.meta.get('retry_times', 0) + 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retries - 1))
+        # * Equal jitter, half of the delay is fixed and the other half random
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if response is not None:
+            retry_after = _retry_after_seconds(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _schedule_later(self, request, spider, delay):
+        def schedule():
+            del self.delayed[call]
+            self.crawler.engine.crawl(request, spider)
+        call = reactor.callLater(delay, schedule)
+        self.delayed[call] = request
+
+    def pending_requests(self):
+        """Requests waiting for their backoff to be scheduled again"""
+        return list(self.delayed.values())
+
+    def _record_outcome(self, key, domain, failed, spider):
+        domain['outcomes'].append(failed)
+        outcomes = domain['outcomes']
+        if (failed and len(outcomes) == outcomes.maxlen
+                and sum(outcomes) / len(outcomes) >= self.breaker_threshold):
+            domain['open_until'] = time.time() + self.breaker_pause
+            outcomes.clear()
+            self.stats.inc_value('circuit_breaker/opened/%s' % key, spider=spider)
+            spider.logger.warning('Pausing %s for %ds, too many failures', key, self.breaker_pause)
+
+    def _retry(self, request, reason, spider, response=None):
+        key, domain = self._domain(request)
+        if domain['retries'] >= self.budget_min + self.budget_ratio * domain['requests']:
+            self.stats.inc_value('retry/budget_exhausted/%s' % key, spider=spider)
+            return None
+        retryreq = get_retry_request(request, spider=spider, reason=reason)
+        if retryreq is None:
+            return None
+        domain['retries'] += 1
+        delay = self._delay(request, response)
+        self.stats.inc_value('retry/backoff_seconds', delay, spider=spider)
+        self._schedule_later(retryreq, spider, delay)
+        return retryreq
+
+    def process_request(self, request, spider):
+        if not self._schedulable(request):
+            return None
+        key, domain = self._domain(request)
+        wait = domain['open_until'] - time.time()
+        if wait > 0:
+            self.stats.inc_value('circuit_breaker/delayed', spider=spider)
+            # * dont_filter, the request was already seen by the dupefilter
+            self._schedule_later(request.replace(dont_filter=True), spider,
+                                 wait + random.uniform(0, 1))
+            raise IgnoreRequest('Circuit open for %s' % key)
+        domain['requests'] += 1
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get('dont_retry', False) or not self._schedulable(request):
+            return response
+        key, domain = self._domain(request)
+        failed = response.status in self.retry_http_codes
+        self._record_outcome(key, domain, failed, spider)
+        if failed and self._retry(request, response_status_message(response.status),
+                                  spider, response) is not None:
+            raise IgnoreRequest('Retry scheduled for %s' % request.url)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if (not isinstance(exception, self.EXCEPTIONS_TO_RETRY)
+                or request.meta.get('dont_retry', False) or not self._schedulable(request)):
+            return None
+        key, domain = self._domain(request)
+        self._record_outcome(key, domain, True, spider)
+        if self._retry(request, exception, spider) is not None:
+            raise IgnoreRequest('Retry scheduled for %s' % request.url)
+        return None
+
+    def spider_idle(self, spider):
+        # ! Keep the spider open while there are retries waiting for their turn
+        if self.delayed:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self.delayed:
+            if call.active():
+                call.cancel()
+        self.delayed.clear()
+
+
+def _retry_after_seconds(value):
+    """Seconds to wait according to a Retry-After header, given either as a
+    number of seconds or as an HTTP date, or None if it can not be read"""
+    if not value:
+        return None
+    value = value.decode('latin1').strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,98 @@
+"""Runs all the job spiders at the same time on a single reactor, so the crawl
+takes about as long as the slowest job board instead of the sum of all of
+them. The downloads of all the spiders share GLOBAL_CONCURRENT_REQUESTS, and
+every job scraped by any of them is also written to one merged jsonl file
+with the same field names for every board.
+
+    python -m workshop1.orchestrator
+    python -m workshop1.orchestrator --spiders reed_uk total_jobs --output jobs.jsonl
+    python -m workshop1.orchestrator -s GLOBAL_CONCURRENT_REQUESTS=16
+
+Each spider still writes its own FEEDS as with scrapy crawl.
+"""
+import argparse
+import logging
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.utils.project import get_project_settings
+
+from .download_handlers import GlobalConcurrencyDownloadHandler
+from .jobs import JOB_SPIDERS, merged_job
+
+logger = logging.getLogger(__name__)
+
+
+class MergedJobsWriter:
+    """Writes the items of several crawlers to the same jsonl file
+
+    :param path: path of the merged output
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        self.exporter = JsonLinesItemExporter(self.file, encoding='utf8', ensure_ascii=False)
+        self.exporter.start_exporting()
+        self.counts = {}
+
+    def connect(self, crawler):
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+
+    def item_scraped(self, item, response, spider):
+        self.exporter.export_item(merged_job(spider.name, item))
+        self.counts[spider.name] = self.counts.get(spider.name, 0) + 1
+
+    def close(self):
+        self.exporter.finish_exporting()
+        self.file.close()
+
+
+def run(spiders=JOB_SPIDERS, output='jobs_merged.jsonl', settings=None):
+    """Crawls the given spiders concurrently and returns the number of jobs
+    that each one added to the merged output
+
+    :param spiders: names of the spiders to run
+    :type spiders: tuple
+    :param output: path of the merged jsonl output
+    :type output: str
+    :param settings: settings that override the ones of the project
+    :type settings: dict
+    :rtype: dict
+    """
+    project_settings = get_project_settings()
+    # ! The merged output has all the fields of the items (see workshop1.projection)
+    project_settings.set('EXTRACT_ALL_FIELDS', True, priority='project')
+    if settings:
+        project_settings.setdict(settings, priority='cmdline')
+    # ! Every run shares a new GLOBAL_CONCURRENT_REQUESTS semaphore
+    GlobalConcurrencyDownloadHandler.reset()
+    process = CrawlerProcess(project_settings)
+    writer = MergedJobsWriter(output)
+    for name in spiders:
+        crawler = process.create_crawler(name)
+        writer.connect(crawler)
+        process.crawl(crawler)
+    try:
+        process.start()
+    finally:
+        writer.close()
+    logger.info('Jobs merged on %s: %s', output, writer.counts)
+    return writer.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs all the job spiders at the same time')
+    parser.add_argument('--spiders', nargs='+', default=list(JOB_SPIDERS),
+                        help='spiders to run (default: %s)' % ' '.join(JOB_SPIDERS))
+    parser.add_argument('--output', default='jobs_merged.jsonl', help='merged jsonl output')
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='set or override a setting, like scrapy crawl -s')
+    args = parser.parse_args(argv)
+    settings = dict(setting.split('=', 1) for setting in args.settings)
+    run(tuple(args.spiders), args.output, settings)
+
+
+if __name__ == '__main__':
+    main()
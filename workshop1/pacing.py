@@ -0,0 +1,137 @@
+"""Scheduling policy per Rule of a CrawlSpider.
+
+With plain rules the listing pages and the detail pages compete equally on
+the scheduler, so the queue fills up with pagination while the items trickle
+out. A PrioritisedRule gives its requests a priority, so the detail pages
+that produce the items are downloaded first, and with max_queue its requests
+wait on RulePacingMiddleware while the scheduler already holds that many
+requests, so the pagination only runs ahead when the queue has drained:
+
+    rules = (
+        PrioritisedRule(LinkExtractor(allow=r'\\?pageno=\\d+$'), follow=True,
+                        priority=0, max_queue=50),
+        PrioritisedRule(LinkExtractor(allow=r'/jobs/.*/\\d+'), callback='parse_job',
+                        priority=10),
+    )
+
+The priority is used by the default scheduler and by the shared frontier,
+the CheckpointScheduler downloads its requests in order and ignores it.
+"""
+from collections import deque
+
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import Request
+from scrapy.spiders import Rule
+from scrapy.utils.request import request_fingerprint
+
+
+class PrioritisedRule(Rule):
+    """Rule whose requests get a priority and can be held back while the
+    scheduler is full. It takes the same arguments as Rule, and:
+
+    :param priority: priority of the requests of the rule, higher is sooner
+    :type priority: int
+    :param max_queue: requests of the rule wait while the scheduler holds this
+        many requests or more, None never holds them
+    :type max_queue: int
+    """
+
+    def __init__(self, *args, priority=0, max_queue=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if max_queue is not None and max_queue < 1:
+            raise ValueError('max_queue must be at least 1, got %r' % max_queue)
+        self.priority = priority
+        self.max_queue = max_queue
+
+    def _compile(self, spider):
+        super()._compile(spider)
+        process_request = self.process_request
+
+        # * Set before process_request, so it can still change the priority
+        def prioritised_request(request, response):
+            request.priority = self.priority
+            return process_request(request, response)
+
+        self.process_request = prioritised_request
+
+
+class RulePacingMiddleware:
+    """Spider middleware that holds the requests of the rules with a
+    max_queue while the scheduler is full, and schedules them again in the
+    same order as it drains. It does nothing for the other requests.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        # * Held (request, request of the page that produced it) by rule index
+        self.held = {}
+        self.held_fingerprints = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.response_received, signal=signals.response_received)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        return middleware
+
+    def _paced_rule(self, request, spider):
+        index = request.meta.get('rule')
+        rules = getattr(spider, '_rules', None)
+        if index is None or not rules:
+            return None
+        if getattr(rules[index], 'max_queue', None) is None:
+            return None
+        return index
+
+    def _queue_size(self):
+        return len(self.crawler.engine.slot.scheduler)
+
+    def process_spider_output(self, response, result, spider):
+        for element in result:
+            if isinstance(element, Request):
+                index = self._paced_rule(element, spider)
+                if index is not None and (self.held.get(index) or
+                                          self._queue_size() >= spider._rules[index].max_queue):
+                    self._hold(index, element, response.request, spider)
+                    continue
+            yield element
+
+    def _hold(self, index, request, parent, spider):
+        fingerprint = request_fingerprint(request)
+        if not request.dont_filter and fingerprint in self.held_fingerprints:
+            self.stats.inc_value('pacing/duplicate', spider=spider)
+            return
+        self.held_fingerprints.add(fingerprint)
+        held = self.held.setdefault(index, deque())
+        held.append((request, parent))
+        self.stats.inc_value('pacing/held', spider=spider)
+        self.stats.max_value('pacing/held_max', len(held), spider=spider)
+
+    def release(self, spider):
+        """Schedules the held requests of every rule while the scheduler has
+        room for them, returns how many were scheduled"""
+        released = 0
+        for index, held in self.held.items():
+            max_queue = spider._rules[index].max_queue
+            while held and self._queue_size() < max_queue:
+                request, _ = held.popleft()
+                self.held_fingerprints.discard(request_fingerprint(request))
+                self.crawler.engine.crawl(request, spider)
+                released += 1
+        if released:
+            self.stats.inc_value('pacing/released', released, spider=spider)
+        return released
+
+    def pending_requests(self):
+        """Requests of the pages whose links are still held"""
+        return [parent for held in self.held.values() for _, parent in held]
+
+    def response_received(self, response, request, spider):
+        self.release(spider)
+
+    def spider_idle(self, spider):
+        # ! The scheduler is empty, so this always schedules something if anything is held
+        if self.release(spider):
+            raise DontCloseSpider
@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from twisted.internet import defer, reactor
+
+
+def _fire(deferred, future):
+    exception = future.exception()
+    if exception is not None:
+        deferred.errback(exception)
+    else:
+        deferred.callback(future.result())
+
+
+class ParsePool:
+    """Pool of worker processes that parse the html of the responses outside
+    of the Twisted reactor thread.
+
+    The functions sent to the pool must be defined at module level (so they
+    can be pickled) and return plain data, e.g. a list of dicts. At most
+    ``max_pending`` bodies are queued or being parsed at the same time, the
+    next callbacks wait until a worker is free, so their responses stay on
+    the scraper slot and Scrapy stops downloading when the slot is full.
+
+    :param workers: number of worker processes
+    :type workers: int
+    :param max_pending: maximum number of bodies sent to the workers at once
+    :type max_pending: int
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.semaphore = defer.DeferredSemaphore(max_pending)
+
+    def _submit(self, function, *args):
+        deferred = defer.Deferred()
+        future = self.executor.submit(function, *args)
+        # ! The future finishes on another thread, fire the deferred on the reactor
+        future.add_done_callback(lambda f: reactor.callFromThread(_fire, deferred, f))
+        return deferred
+
+    def run(self, function, *args):
+        """Returns a Deferred that fires with the result of function(*args)
+        once a worker has run it"""
+        return self.semaphore.run(self._submit, function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -3,11 +3,461 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+
+from scrapy.exceptions import DropItem, NotConfigured
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from .compact_set import CompactIdSet
+from .items import loaded_fields
+from .minhash import MinHashLSH, normalise_text
+from .jobs import JOB_SPIDERS, merged_job
+from .regions import RegionIndex
+from .skills_index import SkillIndexWriter
+
+
+def job_key(value):
+    """Function that turns the id of a job posting into an integer key
+
+    :param value: id of the job posting, as it was loaded on the item
+    :type value: int, str or list
+    :return: the id itself if it is numeric, otherwise a 63 bit hash of it,
+        or None if the item has no id
+    :rtype: int
+    """
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    digest = hashlib.blake2b(value.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & 0x7FFFFFFFFFFFFFFF
+
+
+class JobDedupPipeline:
+    """Pipeline that drops the job postings repeated on the same run, keeps the
+    last version of every posting on a sqlite store and appends the new or
+    changed ones to a newline-delimited json file.
+
+    The ids of the current run are kept on a CompactIdSet and the previous runs
+    are only looked up on the sqlite index, so the history is never loaded in
+    memory. Items without an id pass through untouched.
+
+    :param store_path: path of the sqlite database
+    :type store_path: str
+    :param output_path: path of the jsonl output, %(name)s is the spider name
+    :type output_path: str
+    """
+
+    COMMIT_EVERY = 500
+
+    # * Fields it needs on the items (workshop1.projection). The items of the
+    # * spiders that only extract some fields are merged with the stored ones
+    item_fields = ('id',)
+
+    def __init__(self, store_path, output_path, stats):
+        self.store_path = store_path
+        self.output_path = output_path
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.settings.get('DEDUP_STORE', 'jobs.sqlite'),
+            crawler.settings.get('DEDUP_OUTPUT', '%(name)s.jsonl'),
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.db = sqlite3.connect(self.store_path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'spider TEXT NOT NULL, id INTEGER NOT NULL, digest BLOB NOT NULL, '
+            'data TEXT NOT NULL, PRIMARY KEY (spider, id)) WITHOUT ROWID')
+        self.seen = CompactIdSet()
+        self.output = open(self.output_path % {'name': spider.name}, 'a', encoding='utf8')
+        self.pending = 0
+
+    def close_spider(self, spider):
+        self.db.commit()
+        self.db.close()
+        self.output.close()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        key = job_key(adapter.get('id'))
+        if key is None:
+            return item
+        if not self.seen.add(key):
+            self.stats.inc_value('dedup/duplicated', spider=spider)
+            raise DropItem('Duplicated job posting: %s' % adapter.get('id'))
+
+        # ! The compact items have every field, the ones never loaded are None
+        fields = loaded_fields(item)
+        row = self.db.execute(
+            'SELECT digest, data FROM jobs WHERE spider = ? AND id = ?', (spider.name, key)).fetchone()
+        if row is not None and getattr(spider, 'extract_fields', None) is not None:
+            # ! Only some fields were extracted, the rest keep their stored value
+            fields = dict(json.loads(row[1]), **fields)
+        data = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)
+        digest = hashlib.blake2b(data.encode('utf8'), digest_size=8).digest()
+        if row is not None and row[0] == digest:
+            self.stats.inc_value('dedup/unchanged', spider=spider)
+            return item
+
+        self.db.execute(
+            'INSERT INTO jobs (spider, id, digest, data) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (spider, id) DO UPDATE SET digest = excluded.digest, data = excluded.data',
+            (spider.name, key, digest, data))
+        self.output.write(data + '\n')
+        self.stats.inc_value('dedup/updated' if row else 'dedup/new', spider=spider)
+
+        self.pending += 1
+        if self.pending >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.output.flush()
+            self.pending = 0
+        return item
+
+
+# Words that only tell the legal form of a company, dropped from its name
+COMPANY_SUFFIXES = {'ltd', 'limited', 'plc', 'llc', 'llp', 'inc', 'co', 'group', 'uk'}
+
+
+def posting_fields(job):
+    """Function that normalises the fields that identify a job posting on any
+    board, from a job in the merged format of workshop1.jobs
+
+    :param job: job converted with merged_job
+    :type job: dict
+    :return: normalised title, company, location (text before the first comma)
+        and annual salary rounded to thousands, or None if it is unknown
+    :rtype: tuple
+    """
+    words = normalise_text(job.get('company')).split()
+    while words and words[-1] in COMPANY_SUFFIXES:
+        words.pop()
+    location = str(job.get('location') or '').split(',')[0]
+    salary = job.get('salary_annual')
+    if salary is not None:
+        salary = int(round(float(salary), -3))
+    return (normalise_text(job.get('title')), ' '.join(words),
+            normalise_text(location), salary)
+
+
+def _compatible(first, second):
+    """A missing value is compatible with anything, names also when one
+    contains the other (e.g. "harnham" and "harnham search")"""
+    return not first or not second or first in second or second in first
+
+
+class CrossBoardIndex:
+    """Index of the job postings of all the boards, clustered into canonical
+    postings, on a sqlite database.
+
+    A posting joins a cluster when its normalised title, company, location and
+    salary are the same as the ones of the cluster, or when its title is a
+    near-duplicate of the one of the cluster (MinHash over LSH buckets) and
+    the rest of the fields are compatible. Every lookup goes through the
+    indexes of the database, reads at most max_candidates clusters of every
+    LSH bucket (the newest ones, as the copies of a posting on other boards
+    are scraped around the same days) and compares the titles of at most
+    VERIFIED_CANDIDATES of them, so its cost grows with the log of the size
+    of the index.
+
+    :param path: path of the sqlite database
+    :type path: str
+    :param threshold: minimum estimated Jaccard similarity of the titles
+    :type threshold: float
+    :param max_candidates: newest clusters read from every LSH bucket
+    :type max_candidates: int
+    """
+
+    COMMIT_EVERY = 500
+    VERIFIED_CANDIDATES = 20
+
+    # ! Different ids on the same board are different postings, even with the
+    # ! same title (e.g. an agency recruiting several data scientists), so a
+    # ! cluster takes at most one posting of every board
+    OTHER_BOARDS = ('NOT EXISTS (SELECT 1 FROM postings WHERE postings.cluster = clusters.cluster '
+                    'AND postings.board = ?)')
+
+    def __init__(self, path, threshold=0.7, max_candidates=50):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.lsh = MinHashLSH()
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS clusters ('
+            'cluster INTEGER PRIMARY KEY, key INTEGER NOT NULL, board TEXT NOT NULL, '
+            'id INTEGER NOT NULL, title TEXT, company TEXT, location TEXT, salary INTEGER, '
+            'signature BLOB, postings INTEGER NOT NULL DEFAULT 1)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS clusters_key ON clusters (key)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS postings ('
+            'board TEXT NOT NULL, id INTEGER NOT NULL, cluster INTEGER NOT NULL, '
+            'PRIMARY KEY (board, id)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS postings_cluster ON postings (cluster, board)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'band INTEGER NOT NULL, bucket INTEGER NOT NULL, cluster INTEGER NOT NULL, '
+            'PRIMARY KEY (band, bucket, cluster)) WITHOUT ROWID')
+        self.pending = 0
+
+    def _near_duplicate(self, board, fields, signature):
+        title, company, location, salary = fields
+        band_hits = Counter()
+        for band, bucket in self.lsh.band_keys(signature):
+            band_hits.update(row[0] for row in self.db.execute(
+                'SELECT cluster FROM buckets WHERE band = ? AND bucket = ? '
+                'ORDER BY cluster DESC LIMIT ?', (band, bucket, self.max_candidates)))
+        # * The more bands a cluster shares the more similar its title is, so
+        # * only the ones that share the most are compared
+        candidates = [cluster for cluster, _ in band_hits.most_common(self.VERIFIED_CANDIDATES)]
+        best, best_similarity = None, self.threshold
+        for cluster, other_company, other_location, other_salary, data in self.db.execute(
+                'SELECT cluster, company, location, salary, signature FROM clusters '
+                'WHERE cluster IN (%s) AND %s' % (','.join('?' * len(candidates)), self.OTHER_BOARDS),
+                (*candidates, board)):
+            if not (_compatible(company, other_company) and _compatible(location, other_location)):
+                continue
+            if salary and other_salary and abs(salary - other_salary) > 0.1 * max(salary, other_salary):
+                continue
+            similarity = self.lsh.similarity(signature, self.lsh.from_bytes(data))
+            if similarity >= best_similarity:
+                best, best_similarity = cluster, similarity
+        return best
+
+    def add(self, board, job):
+        """Adds a posting of a board and returns its cluster and how it was
+        found: 'known' (the posting was already indexed), 'exact', 'near' or
+        'new' (it starts a new cluster)
+
+        :param board: name of the spider
+        :type board: str
+        :param job: job converted with merged_job
+        :type job: dict
+        :rtype: tuple
+        """
+        fields = posting_fields(job)
+        key = job_key('|'.join('' if value is None else str(value) for value in fields))
+        posting_id = job_key(job.get('id'))
+        if posting_id is None:
+            posting_id = key
+        row = self.db.execute('SELECT cluster FROM postings WHERE board = ? AND id = ?',
+                              (board, posting_id)).fetchone()
+        if row is not None:
+            return row[0], 'known'
+
+        signature = self.lsh.signature(fields[0])
+        found = 'exact'
+        row = self.db.execute('SELECT cluster FROM clusters WHERE key = ? AND %s LIMIT 1'
+                              % self.OTHER_BOARDS, (key, board)).fetchone()
+        cluster = row[0] if row is not None else None
+        if cluster is None and signature is not None:
+            found = 'near'
+            cluster = self._near_duplicate(board, fields, signature)
+        if cluster is None:
+            found = 'new'
+            cluster = self.db.execute(
+                'INSERT INTO clusters (key, board, id, title, company, location, salary, signature) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, board, posting_id, *fields,
+                 signature.tobytes() if signature is not None else None)).lastrowid
+            if signature is not None:
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO buckets (band, bucket, cluster) VALUES (?, ?, ?)',
+                    [(band, bucket, cluster) for band, bucket in self.lsh.band_keys(signature)])
+        else:
+            self.db.execute('UPDATE clusters SET postings = postings + 1 WHERE cluster = ?',
+                            (cluster,))
+        self.db.execute('INSERT INTO postings (board, id, cluster) VALUES (?, ?, ?)',
+                        (board, posting_id, cluster))
+
+        self.pending += 1
+        if self.pending >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+        return cluster, found
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class CrossBoardDedupPipeline:
+    """Pipeline that clusters the job postings of every board into canonical
+    postings on a CrossBoardIndex, so the same job found on reed, totaljobs,
+    indeed and upwork is only enriched once downstream. The items pass
+    through untouched, the cluster of every posting is on the postings table.
+
+    The spiders of a process share one index (and one sqlite connection), so
+    they can run together with workshop1.orchestrator. Only the items of the
+    job spiders (workshop1.jobs.JOB_SPIDERS) are indexed.
+    """
+
+    # * path -> [index, spiders using it]
+    _indexes = {}
+
+    # * Fields of the items of any board read by posting_fields (workshop1.projection)
+    item_fields = ('id', 'title', 'company', 'employer', 'location', 'locality',
+                   'salary_annual')
+
+    def __init__(self, store_path, threshold, max_candidates, stats):
+        self.store_path = store_path
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get('CROSSBOARD_STORE', 'crossboard.sqlite'),
+            settings.getfloat('CROSSBOARD_TITLE_THRESHOLD', 0.7),
+            settings.getint('CROSSBOARD_MAX_CANDIDATES', 50),
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.index = None
+        if spider.name not in JOB_SPIDERS:
+            return
+        if self.store_path not in self._indexes:
+            self._indexes[self.store_path] = [
+                CrossBoardIndex(self.store_path, self.threshold, self.max_candidates), 0]
+        self._indexes[self.store_path][1] += 1
+        self.index = self._indexes[self.store_path][0]
+
+    def close_spider(self, spider):
+        if self.index is None:
+            return
+        shared = self._indexes[self.store_path]
+        shared[1] -= 1
+        if not shared[1]:
+            shared[0].close()
+            del self._indexes[self.store_path]
+
+    def process_item(self, item, spider):
+        if self.index is None:
+            return item
+        _, found = self.index.add(spider.name, merged_job(spider.name, item))
+        self.stats.inc_value('crossboard/%s' % found, spider=spider)
+        return item
+
+
+class RegionalGDPPipeline:
+    """Pipeline that adds the population and the GDP per head of its region to
+    every job posting. The GDP table is read once, when the spider opens, into
+    a RegionIndex, so every item is a couple of dict lookups.
+
+    Only the items with a gdp_region field are enriched. The postings whose
+    location is not on the table are counted on the gdp/unmatched stats.
+
+    :param table_path: path of the csv with the GDP table
+    :type table_path: str
+    """
+
+    # * Fields it reads on the items (workshop1.projection)
+    item_fields = ('country', 'region', 'locality')
+
+    def __init__(self, table_path, stats):
+        self.table_path = table_path
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        table_path = crawler.settings.get('GDP_TABLE')
+        if not table_path or not os.path.exists(table_path):
+            raise NotConfigured('No GDP table on %r' % table_path)
+        return cls(table_path, crawler.stats)
+
+    def open_spider(self, spider):
+        self.index = RegionIndex.from_csv(self.table_path)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if 'gdp_region' not in adapter.field_names():
+            return item
+        location = [adapter.get(field) for field in self.item_fields]
+        name = self.index.match(region=location[1], locality=location[2], country=location[0])
+        if name is None:
+            self.stats.inc_value('gdp/unmatched', spider=spider)
+            place = ', '.join(dict.fromkeys(value for value in location[::-1] if value))
+            self.stats.inc_value('gdp/unmatched/%s' % (place or '(no location)'), spider=spider)
+            return item
+
+        row = self.index.table[name]
+        adapter['gdp_region'] = name
+        adapter['region_population'] = row['population']
+        adapter['region_gdp_per_head'] = row['gdp_per_head']
+        self.stats.inc_value('gdp/matched', spider=spider)
+        return item
+
+
+class SkillIndexPipeline:
+    """Pipeline that adds the required_skills, the region and the annual
+    salary of every job posting to the inverted index of
+    workshop1.skills_index, which is queried with:
+
+        python -m workshop1.skills_index python sql --region London
+
+    The region is the gdp_region of RegionalGDPPipeline when it is there, or
+    the locality or region of the posting. Like the CrossBoardIndex, the
+    spiders of a process share one writer.
+    """
+
+    # * path -> [writer, spiders using it]
+    _writers = {}
+
+    # * Fields it reads on the items (workshop1.projection)
+    item_fields = ('id', 'required_skills', 'gdp_region', 'locality', 'region', 'location',
+                   'salary_annual')
+
+    def __init__(self, index_path, stats):
+        self.index_path = index_path
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get('SKILLS_INDEX', 'skills_index.sqlite'), crawler.stats)
+
+    def open_spider(self, spider):
+        if self.index_path not in self._writers:
+            self._writers[self.index_path] = [SkillIndexWriter(self.index_path), 0]
+        self._writers[self.index_path][1] += 1
+        self.writer = self._writers[self.index_path][0]
+
+    def close_spider(self, spider):
+        shared = self._writers[self.index_path]
+        shared[1] -= 1
+        if not shared[1]:
+            shared[0].close()
+            del self._writers[self.index_path]
 
-class Workshop1Pipeline:
     def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        key = job_key(adapter.get('id'))
+        if key is None:
+            return item
+        region = None
+        for field in ('gdp_region', 'locality', 'region', 'location'):
+            region = adapter.get(field)
+            if isinstance(region, (list, tuple)):
+                region = region[0] if region else None
+            if region:
+                break
+        found = self.writer.add(spider.name, key, adapter.get('required_skills'), region,
+                                adapter.get('salary_annual'))
+        self.stats.inc_value('skills_index/%s' % found, spider=spider)
         return item
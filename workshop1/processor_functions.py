@@ -1,3 +1,8 @@
+import datetime
+import re
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
 def cleanText(text):
     """Function that cleans the text that the Crawler will extract
 
@@ -28,4 +33,83 @@ def clean_id(text):
     :return: Number of reference corresponding to the id of the job_posting
     :rtype: int
     """
-    return int(text.strip("Reference: "))
\ No newline at end of file
+    return int(text.strip("Reference: "))
+
+
+AGO_RE = re.compile(r'\b(\d+|an?|one)\+?\s+(minute|hour|day|week|month)s?\s+ago', re.IGNORECASE)
+# ! Days of every unit, the boards round the old postings to whole months
+AGO_DAYS = {'minute': 0, 'hour': 0, 'day': 1, 'week': 7, 'month': 30}
+DAY_MONTH_RE = re.compile(r'(\d{1,2})\s+([A-Za-z]{3})[a-z]*(?:\s+(\d{4}))?')
+MONTHS = {month: i for i, month in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+
+
+@lru_cache(maxsize=1024)
+def _resolve_date(text, fetched_on):
+    lowered = text.lower()
+    if 'today' in lowered or 'just now' in lowered or 'just posted' in lowered:
+        return fetched_on.isoformat()
+    if 'yesterday' in lowered:
+        return (fetched_on - datetime.timedelta(days=1)).isoformat()
+
+    match = AGO_RE.search(text)
+    if match:
+        number = int(match.group(1)) if match.group(1).isdigit() else 1
+        days = number * AGO_DAYS[match.group(2).lower()]
+        # * Some hours or minutes ago is the day of the fetch
+        return (fetched_on - datetime.timedelta(days=days)).isoformat()
+
+    match = DAY_MONTH_RE.search(text)
+    if match and match.group(2).lower() in MONTHS:
+        day, month = int(match.group(1)), MONTHS[match.group(2).lower()]
+        year = int(match.group(3)) if match.group(3) else fetched_on.year
+        try:
+            date = datetime.date(year, month, day)
+        except ValueError:
+            return text
+        if not match.group(3) and date > fetched_on:
+            # * A date without year later than the fetch belongs to last year
+            date = date.replace(year=year - 1)
+        return date.isoformat()
+    return text
+
+
+def resolve_posting_date(text, loader_context):
+    """Function that turns the relative posting dates of the job boards
+    ("Posted 10 May", "Posted Yesterday", "Posted 3 days ago", "Posted 1 week
+    ago", "5 hours ago", "30+ days ago") into ISO dates, relative
+    to the day when the page was downloaded. The same few hundred strings
+    repeat on every crawl, so the results are memoized.
+
+    :param text: cleaned text of the posting date
+    :type text: str
+    :param loader_context: context of the ItemLoader, the date of the download
+        is taken from its 'fetched_on' key (today if it is missing)
+    :type loader_context: dict
+    :return: ISO date, or the same text if it does not contain a posting date
+        (e.g. "Recently" or "Expires in 2 days")
+    :rtype: str
+    """
+    fetched_on = loader_context.get('fetched_on') or datetime.date.today()
+    return _resolve_date(text, fetched_on)
+
+
+def response_fetch_date(response):
+    """Function that returns the day when a response was downloaded, taken from
+    the 'fetched_at' meta set by Workshop1DownloaderMiddleware, or the Date
+    header sent by the server, or today if none of them is available
+
+    :param response: response whose download date is needed
+    :type response: scrapy.http.Response
+    :rtype: datetime.date
+    """
+    fetched_at = response.meta.get('fetched_at') if response.request is not None else None
+    if fetched_at:
+        return datetime.date.fromtimestamp(fetched_at)
+    header = response.headers.get('Date')
+    if header:
+        try:
+            return parsedate_to_datetime(header.decode('latin1')).date()
+        except (TypeError, ValueError):
+            pass
+    return datetime.date.today()
@@ -0,0 +1,380 @@
+"""Opt-in instrumentation of the hot paths of a crawl, enabled with:
+
+    scrapy crawl reed_uk -s PROFILING_ENABLED=True
+
+It records timing histograms of every spider callback, of the XPath/CSS
+selection and the input processors of every item field, of every processor
+function and of the downloads, and samples the number of requests waiting on
+the scheduler and in flight on the downloader. The summaries are added to the
+crawler stats (profile/...) and the full histograms are written as json to
+PROFILING_REPORT when the spider closes.
+"""
+import json
+import time
+import weakref
+from functools import wraps
+
+from itemloaders import ItemLoader
+from itemloaders.processors import MapCompose
+from itemloaders.utils import get_func_args
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+from .extractors import CompiledField
+
+
+class Histogram:
+    """Histogram with power of two buckets, cheap enough to be updated on
+    every call of a hot function
+
+    :param scale: factor applied to the recorded values before bucketing,
+        1e6 records seconds as microseconds
+    :type scale: float
+    """
+
+    def __init__(self, scale=1e6):
+        self.scale = scale
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        # * Bucket i holds the values in [2 ** (i - 1), 2 ** i) after scaling
+        bucket = int(value * self.scale).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, q):
+        """Upper bound of the bucket that holds the q percentile, unscaled"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / self.scale, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'buckets': {str(2 ** bucket / self.scale): n for bucket, n in sorted(self.buckets.items())},
+        }
+
+
+class Profiler:
+    """Histograms of one crawl, grouped by kind (callback, field, xpath,
+    processor, download) and name, plus the sampled gauges"""
+
+    def __init__(self):
+        self.timings = {}
+        self.gauges = {}
+
+    def record(self, kind, name, seconds):
+        histogram = self.timings.setdefault(kind, {}).get(name)
+        if histogram is None:
+            histogram = self.timings[kind][name] = Histogram()
+        histogram.record(seconds)
+
+    def sample(self, name, value):
+        histogram = self.gauges.get(name)
+        if histogram is None:
+            histogram = self.gauges[name] = Histogram(scale=1)
+        histogram.record(value)
+
+    def timed(self, kind, name, function):
+        """Returns the function wrapped so every call is recorded. Functions
+        with a loader_context argument keep it, so the ItemLoaders still pass
+        them their context"""
+        record = self.record
+        perf_counter = time.perf_counter
+
+        if 'loader_context' in get_func_args(function):
+            @wraps(function)
+            def wrapper(value, loader_context):
+                start = perf_counter()
+                try:
+                    return function(value, loader_context=loader_context)
+                finally:
+                    record(kind, name, perf_counter() - start)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    record(kind, name, perf_counter() - start)
+        return wrapper
+
+    def report(self):
+        return {
+            'timings': {kind: {name: h.as_dict() for name, h in names.items()}
+                        for kind, names in self.timings.items()},
+            'gauges': {name: h.as_dict() for name, h in self.gauges.items()},
+        }
+
+
+_PROFILERS = weakref.WeakKeyDictionary()
+
+
+def profiler_for(crawler):
+    """Profiler shared by the extension and the spider middleware of a crawler"""
+    profiler = _PROFILERS.get(crawler)
+    if profiler is None:
+        profiler = _PROFILERS[crawler] = Profiler()
+    return profiler
+
+
+def _function_name(function):
+    return getattr(function, '__qualname__', None) or type(function).__name__
+
+
+class _LoaderInstrumentation:
+    """Patches ItemLoader and CompiledField so the fields and the processor
+    functions of both extraction paths are timed. Only one profiler can own
+    the patches at a time, as they are global to the process."""
+
+    owner = None
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.originals = []
+        self.processors = {}
+        self.compiled_functions = {}
+
+    def _patch(self, cls, name, method):
+        self.originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, method)
+
+    def install(self):
+        if _LoaderInstrumentation.owner is not None:
+            return False
+        _LoaderInstrumentation.owner = self
+        profiler = self.profiler
+        record = profiler.record
+        perf_counter = time.perf_counter
+
+        original_get_xpathvalues = ItemLoader._get_xpathvalues
+        original_get_cssvalues = ItemLoader._get_cssvalues
+        original_add_value = ItemLoader.add_value
+        original_get_input_processor = ItemLoader.get_input_processor
+        original_extract = CompiledField.extract
+        original_process = CompiledField._process
+
+        def add_xpath(loader, field_name, xpath, *processors, re=None, **kw):
+            start = perf_counter()
+            values = original_get_xpathvalues(loader, xpath, **kw)
+            selected = perf_counter()
+            original_add_value(loader, field_name, values, *processors, re=re, **kw)
+            end = perf_counter()
+            record('xpath', field_name, selected - start)
+            record('processors', field_name, end - selected)
+            record('field', field_name, end - start)
+
+        def add_css(loader, field_name, css, *processors, re=None, **kw):
+            start = perf_counter()
+            values = original_get_cssvalues(loader, css, **kw)
+            selected = perf_counter()
+            original_add_value(loader, field_name, values, *processors, re=re, **kw)
+            end = perf_counter()
+            record('xpath', field_name, selected - start)
+            record('processors', field_name, end - selected)
+            record('field', field_name, end - start)
+
+        def add_value(loader, field_name, value, *processors, re=None, **kw):
+            start = perf_counter()
+            original_add_value(loader, field_name, value, *processors, re=re, **kw)
+            elapsed = perf_counter() - start
+            record('processors', field_name, elapsed)
+            record('field', field_name, elapsed)
+
+        def get_input_processor(loader, field_name):
+            proc = original_get_input_processor(loader, field_name)
+            if not isinstance(proc, MapCompose):
+                return proc
+            timed = self.processors.get(id(proc))
+            if timed is None:
+                timed = MapCompose(*[
+                    profiler.timed('processor', _function_name(f), f) for f in proc.functions
+                ], **proc.default_loader_context)
+                # * Keep the original alive so its id is not reused
+                self.processors[id(proc)] = timed, proc
+            else:
+                timed = timed[0]
+            return timed
+
+        def extract(field, node, context):
+            start = perf_counter()
+            try:
+                return original_extract(field, node, context)
+            finally:
+                record('field', field.name, perf_counter() - start)
+
+        def _process(field, values, context):
+            functions = self.compiled_functions.get(id(field))
+            if functions is None:
+                functions = tuple(
+                    (profiler.timed('processor', _function_name(f), f), wants_context)
+                    for f, wants_context in field.functions)
+                self.compiled_functions[id(field)] = functions, field
+            else:
+                functions = functions[0]
+            original_functions = field.functions
+            field.functions = functions
+            try:
+                return original_process(field, values, context)
+            finally:
+                field.functions = original_functions
+
+        self._patch(ItemLoader, 'add_xpath', add_xpath)
+        self._patch(ItemLoader, 'add_css', add_css)
+        self._patch(ItemLoader, 'add_value', add_value)
+        self._patch(ItemLoader, 'get_input_processor', get_input_processor)
+        self._patch(CompiledField, 'extract', extract)
+        self._patch(CompiledField, '_process', _process)
+        return True
+
+    def uninstall(self):
+        for cls, name, method in reversed(self.originals):
+            setattr(cls, name, method)
+        self.originals = []
+        if _LoaderInstrumentation.owner is self:
+            _LoaderInstrumentation.owner = None
+
+
+class ProfilingExtension:
+    """Extension that samples the queues, times the downloads and the item
+    fields, and publishes the results on spider_closed. Callbacks are timed
+    by ProfilingSpiderMiddleware."""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PROFILING_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = settings.getfloat('PROFILING_INTERVAL', 1.0)
+        self.report_path = settings.get('PROFILING_REPORT')
+        self.profiler = profiler_for(crawler)
+        self.instrumentation = _LoaderInstrumentation(self.profiler)
+        self.sampler = None
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+        if not self.instrumentation.install():
+            spider.logger.warning(
+                'Another spider is profiling the item fields of this process, '
+                'only the callbacks and downloads of %s are profiled', spider.name)
+        self.sampler = task.LoopingCall(self.sample)
+        self.sampler.start(self.interval, now=False)
+
+    def sample(self):
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return
+        self.profiler.sample('scheduler_pending', len(engine.slot.scheduler))
+        self.profiler.sample('engine_in_progress', len(engine.slot.inprogress))
+        self.profiler.sample('downloader_active', len(engine.downloader.active))
+        self.profiler.sample('scraper_active', len(engine.scraper.slot.active))
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.profiler.record('download', spider.name, latency)
+
+    def spider_closed(self, spider, reason):
+        if self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+        self.instrumentation.uninstall()
+
+        report = self.profiler.report()
+        for kind, names in report['timings'].items():
+            for name, summary in names.items():
+                prefix = 'profile/%s/%s' % (kind, name)
+                self.stats.set_value(prefix + '/count', summary['count'], spider=spider)
+                self.stats.set_value(prefix + '/total_ms', round(summary['total'] * 1000, 3), spider=spider)
+                self.stats.set_value(prefix + '/p95_ms', round(summary['p95'] * 1000, 3), spider=spider)
+                self.stats.set_value(prefix + '/max_ms', round(summary['max'] * 1000, 3), spider=spider)
+        for name, summary in report['gauges'].items():
+            self.stats.set_value('profile/gauge/%s/mean' % name, round(summary['mean'], 2), spider=spider)
+            self.stats.set_value('profile/gauge/%s/max' % name, summary['max'], spider=spider)
+
+        if self.report_path:
+            report.update({
+                'spider': spider.name,
+                'reason': reason,
+                'elapsed': time.time() - self.started,
+            })
+            with open(self.report_path % {'name': spider.name}, 'w', encoding='utf8') as f:
+                json.dump(report, f, indent=2)
+
+
+class ProfilingSpiderMiddleware:
+    """Spider middleware that times the callbacks. Set it as the closest one
+    to the spider, so the time spent on the other middlewares is not counted"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PROFILING_ENABLED'):
+            raise NotConfigured
+        return cls(profiler_for(crawler))
+
+    @staticmethod
+    def _callback_name(response, spider):
+        # * CrawlSpider sends all the rule requests to _callback, the name of
+        # * the rule callback is taken from the rule index in the meta
+        rule = response.meta.get('rule')
+        rules = getattr(spider, '_rules', None)
+        if rule is not None and rules is not None and rules[rule].callback is not None:
+            return rules[rule].callback.__name__
+        callback = response.request.callback if response.request is not None else None
+        return getattr(callback, '__name__', 'parse')
+
+    def process_spider_output(self, response, result, spider):
+        # ! Callbacks are generators, their code runs while the results are
+        # ! consumed, so every step of the iteration is timed
+        name = '%s.%s' % (spider.name, self._callback_name(response, spider))
+        perf_counter = time.perf_counter
+        elapsed = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    elapsed += perf_counter() - start
+                    break
+                elapsed += perf_counter() - start
+                yield value
+        finally:
+            self.profiler.record('callback', name, elapsed)
@@ -0,0 +1,137 @@
+"""Projection pushdown: the spiders only run the XPaths and the processors of
+the fields that something reads.
+
+The fields read are:
+
+- the 'fields' of the FEEDS of the spider, or EXTRACT_FIELDS for a run
+- the item_fields of the enabled item pipelines
+- the required_fields of the spider, e.g. the ids of its seen id store
+
+A feed or a pipeline without a list of fields reads all of them, and so does
+any run with EXTRACT_ALL_FIELDS. A spider opts in with ProjectionMixin and
+loads its items with ProjectedItemLoader or CompiledExtractor.project. An
+id-only refresh of reed, without the pipelines that read more fields:
+
+    scrapy crawl reed_uk -s EXTRACT_FIELDS=id -s FEEDS={} \\
+        -s 'ITEM_PIPELINES={"workshop1.pipelines.JobDedupPipeline": 300}'
+"""
+from itemloaders import ItemLoader
+from scrapy.utils.conf import build_component_list
+from scrapy.utils.misc import load_object
+
+
+def extract_fields(settings, spider_cls):
+    """Function that returns the fields that a spider has to extract
+
+    :param settings: settings of the crawler of the spider
+    :type settings: scrapy.settings.Settings
+    :param spider_cls: class of the spider
+    :type spider_cls: type
+    :return: names of the fields, or None if all of them are read (all the
+        fields of the item_class of the spider, if it has one)
+    :rtype: frozenset
+    """
+    fields = {field for field in settings.getlist('EXTRACT_FIELDS') if field}
+    if not fields:
+        if settings.getbool('EXTRACT_ALL_FIELDS'):
+            return None
+        feeds = settings.getdict('FEEDS')
+        if not feeds:
+            return None
+        for options in feeds.values():
+            if not options.get('fields'):
+                return None
+            fields.update(options['fields'])
+
+    for path in build_component_list(settings.getwithbase('ITEM_PIPELINES')):
+        item_fields = getattr(load_object(path), 'item_fields', None)
+        if item_fields is None:
+            return None
+        fields.update(item_fields)
+
+    fields.update(getattr(spider_cls, 'required_fields', ()))
+    # * The fields computed from another one need that one too
+    for field, source in getattr(spider_cls, 'field_sources', {}).items():
+        if field in fields:
+            fields.add(source)
+    # ! A projection with every field is not narrow, the stores of the spider
+    # ! (revalidation, dedup) treat its items as whole ones
+    item_class = getattr(spider_cls, 'item_class', None)
+    if item_class is not None and fields.issuperset(item_class.fields):
+        return None
+    return frozenset(fields)
+
+
+class ProjectionMixin:
+    """Mixin for the spiders that only extract the fields that are read. It
+    sets extract_fields (None when all the fields are read) on from_crawler.
+    """
+
+    # ! Fields the spider itself reads from its items
+    required_fields = ()
+    # ! Field -> field it is computed from, e.g. salary_min -> salary
+    field_sources = {}
+    # ! Item class whose fields are extracted
+    item_class = None
+    extract_fields = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.extract_fields = extract_fields(crawler.settings, cls)
+        if spider.extract_fields is not None:
+            spider.logger.info('Extracting only the fields: %s',
+                               ', '.join(sorted(spider.extract_fields)))
+        return spider
+
+    def wants(self, field_name):
+        """True if the field has to be extracted"""
+        return self.extract_fields is None or field_name in self.extract_fields
+
+
+class ProjectedItemLoader(ItemLoader):
+    """ItemLoader that ignores the fields that are not on its fields, so their
+    selectors and input processors never run
+
+    :param fields: names of the fields to load, None loads all of them
+    :type fields: frozenset
+    """
+
+    def __init__(self, item=None, selector=None, parent=None, fields=None, **context):
+        if fields is None and parent is not None:
+            fields = parent.fields
+        self.fields = fields
+        super().__init__(item, selector, parent, **context)
+        if parent is None:
+            # ! The fields of a compact item that were never loaded are None,
+            # ! they are not values (load_item would set them to [])
+            for field_name in [name for name, values in self._values.items() if not values]:
+                del self._values[field_name]
+
+    def wants(self, field_name):
+        """True if the field has to be loaded"""
+        return self.fields is None or field_name is None or field_name in self.fields
+
+    def add_value(self, field_name, value, *processors, **kw):
+        if self.wants(field_name):
+            super().add_value(field_name, value, *processors, **kw)
+
+    def replace_value(self, field_name, value, *processors, **kw):
+        if self.wants(field_name):
+            super().replace_value(field_name, value, *processors, **kw)
+
+    def add_xpath(self, field_name, xpath, *processors, **kw):
+        if self.wants(field_name):
+            super().add_xpath(field_name, xpath, *processors, **kw)
+
+    def replace_xpath(self, field_name, xpath, *processors, **kw):
+        if self.wants(field_name):
+            super().replace_xpath(field_name, xpath, *processors, **kw)
+
+    def add_css(self, field_name, css, *processors, **kw):
+        if self.wants(field_name):
+            super().add_css(field_name, css, *processors, **kw)
+
+    def replace_css(self, field_name, css, *processors, **kw):
+        if self.wants(field_name):
+            super().replace_css(field_name, css, *processors, **kw)
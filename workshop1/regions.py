@@ -0,0 +1,184 @@
+"""Population and GDP per head of the UK countries and regions, read from the
+ONS summary table that ships with the repo (gdp_uk_2019.csv), and an index
+to look them up by the place names that the job boards use.
+
+The table has a title, headers that span several lines and names broken in
+two lines ("Yorkshire and \\nThe Humber"), with footnote marks on the
+headers and on some names. The reed postings use the ITL1 regions ("South
+East England"), counties ("Lancashire", "Avon") or towns, so the index also
+has aliases, the English counties of every region and the London boroughs.
+"""
+import csv
+import re
+import unicodedata
+
+from .minhash import normalise_text
+
+# * Countries of the table, any other row is a region of England
+COUNTRIES = ('UK', 'England', 'Wales', 'Scotland', 'Northern Ireland')
+
+REGION_ALIASES = {
+    'United Kingdom': 'UK',
+    'Great Britain': 'UK',
+    'North East England': 'North East',
+    'North West England': 'North West',
+    'Yorkshire': 'Yorkshire and The Humber',
+    'Yorkshire and Humber': 'Yorkshire and The Humber',
+    'Yorkshire and Humberside': 'Yorkshire and The Humber',
+    'East England': 'East of England',
+    'Greater London': 'London',
+    'City of London': 'London',
+    'South East England': 'South East',
+    'South West England': 'South West',
+}
+
+# * Ceremonial (and some historic) counties of England by region
+COUNTY_REGIONS = {
+    'North East': ('Northumberland', 'Tyne and Wear', 'County Durham', 'Durham', 'Cleveland',
+                   'Teesside'),
+    'North West': ('Cumbria', 'Lancashire', 'Greater Manchester', 'Merseyside', 'Cheshire'),
+    'Yorkshire and The Humber': ('North Yorkshire', 'West Yorkshire', 'South Yorkshire',
+                                 'East Riding of Yorkshire', 'East Yorkshire', 'Humberside'),
+    'East Midlands': ('Derbyshire', 'Nottinghamshire', 'Lincolnshire', 'Leicestershire',
+                      'Rutland', 'Northamptonshire'),
+    'West Midlands': ('Herefordshire', 'Shropshire', 'Staffordshire', 'Warwickshire',
+                      'Worcestershire'),
+    'East of England': ('Bedfordshire', 'Cambridgeshire', 'Essex', 'Hertfordshire', 'Norfolk',
+                        'Suffolk', 'East Anglia'),
+    'London': ('Middlesex',),
+    'South East': ('Berkshire', 'Buckinghamshire', 'East Sussex', 'West Sussex', 'Sussex',
+                   'Hampshire', 'Isle of Wight', 'Kent', 'Oxfordshire', 'Surrey'),
+    'South West': ('Bristol', 'Avon', 'Cornwall', 'Devon', 'Dorset', 'Gloucestershire',
+                   'Somerset', 'Wiltshire'),
+}
+
+# * reed puts most of London on the South East England region, with the
+# * borough or the area as the locality
+LONDON_AREAS = (
+    'Barking and Dagenham', 'Barnet', 'Bexley', 'Brent', 'Bromley', 'Camden', 'Croydon',
+    'Ealing', 'Enfield', 'Greenwich', 'Hackney', 'Hammersmith and Fulham', 'Hammersmith',
+    'Fulham', 'Haringey', 'Harrow', 'Havering', 'Hillingdon', 'Hounslow', 'Islington',
+    'Kensington and Chelsea', 'Kensington', 'Chelsea', 'Kingston upon Thames', 'Lambeth',
+    'Lewisham', 'Merton', 'Newham', 'Redbridge', 'Richmond upon Thames', 'Southwark',
+    'Sutton', 'Tower Hamlets', 'Waltham Forest', 'Wandsworth', 'Westminster',
+    'Canary Wharf', 'Shoreditch', 'Holborn', 'Soho', 'Mayfair', 'Twickenham', 'Wimbledon',
+    'Stratford', 'Paddington', 'Kings Cross',
+)
+
+_NUMBER_RE = re.compile(r'^-?[\d,]+(\.\d+)?$')
+
+
+def clean_cell(text):
+    """Function that joins the lines of a cell and removes its footnote marks
+    (the superscript numbers)
+
+    :rtype: str
+    """
+    text = ''.join(char for char in text if unicodedata.category(char) != 'No')
+    return ' '.join(text.split())
+
+
+def _number(text):
+    text = text.strip()
+    if not _NUMBER_RE.match(text):
+        return None
+    return int(text.replace(',', '')) if '.' not in text else float(text.replace(',', ''))
+
+
+def read_gdp_table(path):
+    """Function that reads the rows of the ONS summary table
+
+    :param path: path of the csv file
+    :type path: str
+    :return: dict with the population, total_gdp (millions of pounds) and
+        gdp_per_head (pounds) of every country and region, by its name
+    :rtype: dict
+    """
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+
+    columns = None
+    table = {}
+    for row in rows:
+        cells = [clean_cell(cell) for cell in row]
+        if columns is None:
+            # * The header is the first row with the Population column
+            if any(cell.startswith('Population') for cell in cells):
+                columns = {}
+                for index, cell in enumerate(cells):
+                    if cell.startswith('Population'):
+                        columns['population'] = index
+                    elif cell.startswith('Total GDP'):
+                        columns['total_gdp'] = index
+                    elif cell.startswith('GDP per head'):
+                        columns['gdp_per_head'] = index
+            continue
+        if not cells or not cells[0] or cells[0].startswith('Source'):
+            continue
+        values = {name: _number(cells[index]) if index < len(cells) else None
+                  for name, index in columns.items()}
+        # ! Extra-Regio has no population, it is not a place
+        if values.get('population') is not None:
+            table[cells[0]] = values
+    if columns is None:
+        raise ValueError('No header with a Population column on %s' % path)
+    return table
+
+
+class RegionIndex:
+    """Index of the rows of the GDP table by normalised place name
+
+    :param table: rows of the table, as returned by read_gdp_table
+    :type table: dict
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.index = {}
+        for name in table:
+            self.index[normalise_text(name)] = name
+        for alias, name in REGION_ALIASES.items():
+            if name in table:
+                self.index.setdefault(normalise_text(alias), name)
+        for name, counties in COUNTY_REGIONS.items():
+            if name in table:
+                for county in counties:
+                    self.index.setdefault(normalise_text(county), name)
+        # * Names of the London areas that are not a row, alias or county too
+        self.london_areas = set()
+        if 'London' in table:
+            for area in LONDON_AREAS:
+                if self.index.setdefault(normalise_text(area), 'London') == 'London':
+                    self.london_areas.add(normalise_text(area))
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(read_gdp_table(path))
+
+    def find(self, name):
+        """Returns the name of the row of a place, or None"""
+        return self.index.get(normalise_text(name)) if name else None
+
+    def match(self, region=None, locality=None, country=None):
+        """Returns the name of the row that best matches a location, a region
+        of England over a whole country and the locality over the region (a
+        London borough is on the South East England region), or None if
+        nothing matches. A London area only overrides a South East, London or
+        unmatched region, as there are towns with the same name elsewhere
+        (Sutton, Stratford). A posting of another country is never matched,
+        even if its locality has the name of a UK place (Durham, Cambridge)
+
+        :rtype: str
+        """
+        country_name = self.find(country)
+        if country and country_name not in COUNTRIES:
+            return None
+        region_name = self.find(region)
+        name = self.find(locality)
+        if name is not None and name not in COUNTRIES:
+            if (normalise_text(locality) not in self.london_areas or region_name is None or
+                    region_name in COUNTRIES or region_name in ('South East', 'London')):
+                return name
+        if region_name is not None and region_name not in COUNTRIES:
+            return region_name
+        return name or region_name or country_name
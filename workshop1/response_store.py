@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from scrapy.http import Headers, Request
+from scrapy.responsetypes import responsetypes
+
+
+class ResponseStore:
+    """Compressed, content-addressed store of the responses downloaded by a spider.
+
+    Every body is gzipped and saved once under ``objects/`` using the sha1 of
+    its content as file name, so pages with the same body share the same file.
+    ``index.jsonl`` maps each request fingerprint to the url, status, headers,
+    body hash and download time of its response, one json object per line.
+
+    :param basedir: directory where the responses of one spider are stored
+    :type basedir: str
+    """
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.objects_dir = os.path.join(basedir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = {}
+        index_path = os.path.join(basedir, 'index.jsonl')
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.index[entry['fingerprint']] = entry
+        self.index_file = open(index_path, 'a', encoding='utf8')
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _object_path(self, body_hash):
+        return os.path.join(self.objects_dir, body_hash[:2], body_hash[2:] + '.gz')
+
+    def store(self, fingerprint, response, fetched_at=None):
+        """Saves a response, writing its body only if it is not already stored
+
+        :param fingerprint: fingerprint of the request of the response
+        :type fingerprint: str
+        :param response: response returned by the downloader
+        :type response: scrapy.http.Response
+        :param fetched_at: timestamp of the download
+        :type fetched_at: float
+        """
+        body_hash = hashlib.sha1(response.body).hexdigest()
+        path = self._object_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(response.body)
+            os.replace(tmp_path, path)
+
+        entry = {
+            'fingerprint': fingerprint,
+            'url': response.url,
+            'status': response.status,
+            'headers': {
+                k.decode('latin1'): [v.decode('latin1') for v in values]
+                for k, values in response.headers.items()
+            },
+            'body': body_hash,
+            'fetched_at': fetched_at,
+        }
+        self.index_file.write(json.dumps(entry) + '\n')
+        self.index[fingerprint] = entry
+
+    def _build_response(self, entry, request=None):
+        with gzip.open(self._object_path(entry['body']), 'rb') as f:
+            body = f.read()
+        headers = Headers(entry['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=entry['url'], body=body)
+        if request is None:
+            request = Request(entry['url'])
+        if entry.get('fetched_at'):
+            request.meta['fetched_at'] = entry['fetched_at']
+        return respcls(url=entry['url'], status=entry['status'], headers=headers,
+                       body=body, request=request, flags=['stored'])
+
+    def retrieve(self, fingerprint, request=None):
+        """Returns the stored response of a request, or None if it is not stored
+
+        :param fingerprint: fingerprint of the request
+        :type fingerprint: str
+        :param request: request to attach to the response
+        :type request: scrapy.http.Request
+        :rtype: scrapy.http.Response
+        """
+        entry = self.index.get(fingerprint)
+        if entry is None:
+            return None
+        return self._build_response(entry, request)
+
+    def iter_responses(self, url_regex=None):
+        """Yields every stored response, optionally only the ones whose url
+        matches a regular expression
+
+        :param url_regex: pattern that the url of the responses must match
+        :type url_regex: str
+        """
+        pattern = re.compile(url_regex) if url_regex else None
+        for entry in list(self.index.values()):
+            if pattern is None or pattern.search(entry['url']):
+                yield self._build_response(entry)
+
+    def close(self):
+        self.index_file.close()
+
+
+def replay_callback(callback, store, url_regex=None):
+    """Runs a spider callback over the stored responses without any network,
+    yielding only the items it returns (requests are ignored)
+
+    For example, to re-parse all the stored Reed job pages::
+
+        store = ResponseStore('responsestore/reed_uk')
+        items = list(replay_callback(ReedUKCrawlSpider().parse_job, store, r'/jobs/.*/\\d+'))
+
+    :param callback: bound callback of the spider, e.g. spider.parse_job
+    :param store: store that holds the responses of the spider
+    :type store: ResponseStore
+    :param url_regex: pattern that the url of the responses must match
+    :type url_regex: str
+    """
+    for response in store.iter_responses(url_regex):
+        for result in callback(response) or ():
+            if not isinstance(result, Request):
+                yield result
@@ -0,0 +1,254 @@
+"""Conditional revalidation of the pages that were already scraped.
+
+To catch the edits of the known postings (e.g. a new salary) a refresh crawl
+has to download their pages again, but most of them have not changed. A
+spider opts in with the names of the callbacks whose pages are revalidated:
+
+    revalidate_callbacks = ('parse_job',)
+
+For every page of those callbacks the ETag, the Last-Modified, a hash of the
+body and the output of the callback (items and requests) are kept on
+REVALIDATION_STORE. The next time the page is requested:
+
+- RevalidationDownloaderMiddleware sends it with If-None-Match and
+  If-Modified-Since, and a 304 answer is passed on as an empty 200 response,
+  so the body is not downloaded again. A 200 answer whose body has the same
+  hash as the stored one (a server without validators) is passed on too.
+- RevalidationSpiderMiddleware sees either of them and yields the stored
+  output of the page instead of the output of the callback, which is never
+  iterated, so the page is not parsed. Any other page of the callbacks has
+  its new output recorded.
+
+The requests are replayed as well, so the pagination of a listing page that
+did not change is still followed.
+"""
+import hashlib
+import pickle
+import sqlite3
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+from scrapy.utils.request import request_fingerprint
+
+# * States of the 'revalidation' meta of the responses whose stored output is used
+REPLAYED = ('not_modified', 'unchanged')
+
+
+def callback_name(request, spider):
+    """Function that returns the name of the callback of a request, the one of
+    its Rule for the requests of a CrawlSpider
+
+    :rtype: str
+    """
+    callback = request.callback
+    rule = request.meta.get('rule')
+    rules = getattr(spider, '_rules', None)
+    if rule is not None and rules and getattr(callback, '__name__', None) == '_callback':
+        callback = rules[rule].callback
+    return getattr(callback, '__name__', None)
+
+
+def body_hash(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class RevalidationStore:
+    """Validators and output of the revalidated pages, on a sqlite database
+
+    :param path: path of the sqlite database
+    :type path: str
+    """
+
+    COMMIT_EVERY = 100
+
+    # * path -> [store, middlewares using it], the spiders of a process share it
+    _stores = {}
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'spider TEXT NOT NULL, key TEXT NOT NULL, etag TEXT, last_modified TEXT, '
+            'body_hash BLOB NOT NULL, body_size INTEGER NOT NULL, outputs BLOB NOT NULL, '
+            'PRIMARY KEY (spider, key)) WITHOUT ROWID')
+        self.pending = 0
+
+    @classmethod
+    def open(cls, path):
+        if path not in cls._stores:
+            cls._stores[path] = [cls(path), 0]
+        cls._stores[path][1] += 1
+        return cls._stores[path][0]
+
+    @classmethod
+    def release(cls, path):
+        shared = cls._stores[path]
+        shared[1] -= 1
+        if not shared[1]:
+            shared[0].close()
+            del cls._stores[path]
+
+    def validators(self, spider, key):
+        """Returns the (etag, last_modified, body_hash, body_size) of a page,
+        or None if it was never stored"""
+        return self.db.execute(
+            'SELECT etag, last_modified, body_hash, body_size FROM pages '
+            'WHERE spider = ? AND key = ?', (spider, key)).fetchone()
+
+    def outputs(self, spider, key):
+        """Returns the pickled outputs of the callback of a page, or None"""
+        row = self.db.execute('SELECT outputs FROM pages WHERE spider = ? AND key = ?',
+                              (spider, key)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save(self, spider, key, validators, outputs):
+        self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (spider, key, *validators, pickle.dumps(outputs, protocol=4)))
+        self.pending += 1
+        if self.pending >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class _RevalidationMiddleware:
+
+    def __init__(self, store_path, stats):
+        self.store_path = store_path
+        self.stats = stats
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('REVALIDATION_ENABLED'):
+            raise NotConfigured
+        middleware = cls(crawler.settings.get('REVALIDATION_STORE', 'revalidation.sqlite'),
+                         crawler.stats)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        if getattr(spider, 'revalidate_callbacks', None):
+            self.store = RevalidationStore.open(self.store_path)
+
+    def spider_closed(self, spider):
+        if self.store is not None:
+            RevalidationStore.release(self.store_path)
+            self.store = None
+
+    def _revalidated(self, request, spider):
+        return (self.store is not None and
+                callback_name(request, spider) in spider.revalidate_callbacks)
+
+
+class RevalidationDownloaderMiddleware(_RevalidationMiddleware):
+    """Downloader middleware that makes the requests of the revalidated pages
+    conditional, and sets on their 'revalidation' meta whether the page is
+    'not_modified' (304), 'unchanged' (same body hash) or 'modified'
+    """
+
+    def process_request(self, request, spider):
+        if not self._revalidated(request, spider):
+            return None
+        stored = self.store.validators(spider.name, request_fingerprint(request))
+        if stored is None:
+            return None
+        etag, last_modified, _, _ = stored
+        if etag:
+            request.headers.setdefault('If-None-Match', etag)
+        if last_modified:
+            request.headers.setdefault('If-Modified-Since', last_modified)
+        if etag or last_modified:
+            self.stats.inc_value('revalidation/conditional', spider=spider)
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self._revalidated(request, spider):
+            return response
+        key = request_fingerprint(request)
+        stored = self.store.validators(spider.name, key)
+
+        if response.status == 304 and stored is not None:
+            request.meta['revalidation'] = 'not_modified'
+            self.stats.inc_value('revalidation/not_modified', spider=spider)
+            self.stats.inc_value('revalidation/bytes_saved', stored[3], spider=spider)
+            # ! HttpErrorMiddleware would drop the 304 before the spider middleware
+            return response.replace(status=200, body=b'', flags=response.flags + ['revalidated'])
+        if response.status != 200:
+            return response
+
+        digest = body_hash(response.body)
+        if stored is not None and stored[2] == digest:
+            request.meta['revalidation'] = 'unchanged'
+            self.stats.inc_value('revalidation/unchanged', spider=spider)
+            return response
+        request.meta['revalidation'] = 'modified'
+        request.meta['revalidation_validators'] = (
+            self._header(response, 'ETag'), self._header(response, 'Last-Modified'),
+            digest, len(response.body))
+        self.stats.inc_value('revalidation/modified', spider=spider)
+        return response
+
+    @staticmethod
+    def _header(response, name):
+        value = response.headers.get(name)
+        return value.decode('latin1') if value else None
+
+
+class RevalidationSpiderMiddleware(_RevalidationMiddleware):
+    """Spider middleware that replays the stored output of the pages that did
+    not change, and records the output of the ones that did. It has to be
+    closer to the spider than the middlewares that filter or change the
+    requests, so what it records is the plain output of the callback.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        state = response.meta.get('revalidation')
+        if self.store is None or state is None:
+            yield from result
+            return
+        key = request_fingerprint(response.request)
+
+        if state in REPLAYED:
+            outputs = self.store.outputs(spider.name, key)
+            if outputs is not None:
+                # * The result is never iterated, so the callback does not run
+                self.stats.inc_value('revalidation/skipped_callbacks', spider=spider)
+                yield from self._replay(outputs, spider)
+                return
+
+        # ! The output of a spider that only extracts some fields is not recorded
+        outputs = [] if getattr(spider, 'extract_fields', None) is None else None
+        for element in result:
+            if outputs is not None:
+                outputs.append(self._record(element, spider))
+                if outputs[-1] is None:
+                    # ! A request whose callback is not a method of the spider
+                    outputs = None
+            yield element
+        if outputs is not None and 'revalidation_validators' in response.meta:
+            self.store.save(spider.name, key, response.meta['revalidation_validators'], outputs)
+            self.stats.inc_value('revalidation/stored', spider=spider)
+
+    def _record(self, element, spider):
+        # * Pickled right away, the pipelines may change the items later
+        if isinstance(element, Request):
+            try:
+                return (True, pickle.dumps(request_to_dict(element, spider), protocol=4))
+            except ValueError:
+                return None
+        return (False, pickle.dumps(element, protocol=4))
+
+    def _replay(self, outputs, spider):
+        for is_request, data in outputs:
+            if is_request:
+                yield request_from_dict(pickle.loads(data), spider)
+            else:
+                self.stats.inc_value('revalidation/replayed_items', spider=spider)
+                yield pickle.loads(data)
@@ -0,0 +1,205 @@
+"""Normalisation of the free text salaries scraped from the job boards, e.g.
+"£600.00 - £700.00 per day" or "From £40,000 to £40,000 per annum", into
+min/max/currency/period and an annualised value.
+
+Only the amount or range at the start of the text is read, the rest is
+usually about the benefits ("+ 15% bonus", "30 Days Holiday") and its numbers
+are not the salary.
+
+A whole column of an existing export can be normalised with:
+
+    python -m workshop1.salary reed_uk.csv reed_uk_salaries.csv
+"""
+import csv
+import json
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+Salary = namedtuple('Salary', ['min', 'max', 'currency', 'period', 'annual'])
+
+EMPTY_SALARY = Salary(None, None, None, None, None)
+
+CURRENCIES = {'£': 'GBP', '€': 'EUR', '$': 'USD'}
+
+# * Letters before a $ ("AUD$90,000", "US$", "CA$"), the ones with 3 letters
+# * are already the ISO code
+DOLLAR_PREFIXES = {'US': 'USD', 'A': 'AUD', 'AU': 'AUD', 'C': 'CAD', 'CA': 'CAD',
+                   'NZ': 'NZD', 'HK': 'HKD', 'S': 'SGD'}
+
+# ! Times that a salary is paid on a year, assuming 46 working weeks of 5 days
+# ! and 7.5 hours per day
+PERIOD_MULTIPLIERS = {
+    'annum': 1,
+    'month': 12,
+    'week': 46,
+    'day': 230,
+    'hour': 1725,
+}
+
+PERIOD_ALIASES = {'year': 'annum', 'annum': 'annum', 'month': 'month',
+                  'week': 'week', 'day': 'day', 'hour': 'hour'}
+
+# ! Annualised salaries out of this range are a typo or a placeholder
+# ! ("£0 per annum", "€100 - €110 per annum"), not a salary
+MIN_ANNUAL = 1000.0
+MAX_ANNUAL = 1000000.0
+
+_AMOUNT = r'(?:((?-i:[A-Z]{1,3}))?([£€$]))?\s*(\d[\d,]*(?:\.\d+)?)(?:\s*(k)\b)?'
+# * An amount or a range at the start of the text, e.g. "From £22,000 to
+# * £27,000", "Up to £200", "£30k - 35k" or "AUD$90,000 - AUD$115,000"
+RANGE_RE = re.compile(r'\s*(?:(?:from|up\s*to|circa|c\.|around)\s+)?' + _AMOUNT +
+                      r'(?:\s*(?:-|–|to)\s*' + _AMOUNT + r')?', re.IGNORECASE)
+PERIOD_RE = re.compile(r'\bper\s+(annum|year|month|week|day|hour)\b', re.IGNORECASE)
+
+# Names of the item fields filled by salary_fields
+SALARY_FIELDS = ('salary_min', 'salary_max', 'salary_currency', 'salary_period', 'salary_annual')
+
+
+def _guess_period(amount):
+    """Period of a salary that does not say it, guessed from its amount"""
+    if amount >= 10000:
+        return 'annum'
+    if amount >= 100:
+        return 'day'
+    return 'hour'
+
+
+def _currency(prefix, symbol):
+    """ISO code of a currency symbol and the letters before it"""
+    if symbol == '$' and prefix:
+        return prefix if len(prefix) == 3 else DOLLAR_PREFIXES.get(prefix, 'USD')
+    return CURRENCIES[symbol]
+
+
+@lru_cache(maxsize=4096)
+def parse_salary(text):
+    """Function that parses the salary text of a job posting
+
+    :param text: salary as it was scraped, e.g. "£50,000 - £60,000 per annum"
+    :type text: str
+    :return: Salary with min, max, currency (ISO code), period (annum, month,
+        week, day or hour) and the annualised middle of the range. All of them
+        are None when the text does not start with an amount, e.g. "Salary
+        negotiable", or when the amount is not a plausible salary
+    :rtype: Salary
+    """
+    if not text:
+        return EMPTY_SALARY
+    match = RANGE_RE.match(text)
+    if match is None:
+        return EMPTY_SALARY
+
+    groups = match.groups()
+    amounts = []
+    currency = None
+    for prefix, symbol, number, thousands in (groups[:4], groups[4:]):
+        if number is None:
+            continue
+        amount = float(number.replace(',', ''))
+        if thousands:
+            amount *= 1000
+        if symbol and currency is None:
+            currency = _currency(prefix, symbol)
+        amounts.append(amount)
+    # * "£33 - £40k", the k of the range is applied to both ends
+    if len(amounts) == 2 and groups[7] and not groups[3] and amounts[0] < 1000:
+        amounts[0] *= 1000
+
+    # * A 0 is a placeholder, "£0 - £60000" is up to £60000
+    amounts = [amount for amount in amounts if amount > 0]
+    if not amounts:
+        return EMPTY_SALARY
+    low, high = min(amounts), max(amounts)
+    period_match = PERIOD_RE.search(text)
+    period = PERIOD_ALIASES[period_match.group(1).lower()] if period_match else _guess_period(high)
+    annual = (low + high) / 2 * PERIOD_MULTIPLIERS[period]
+    if not MIN_ANNUAL <= annual <= MAX_ANNUAL:
+        return EMPTY_SALARY
+    return Salary(low, high, currency, period, annual)
+
+
+def salary_fields(text):
+    """Function that returns the normalised salary as item fields, ready to be
+    added to the items of ReedUKCrawlSpider and TotalJobsCrawlSpider
+
+    :param text: salary as it was scraped, or the list loaded by an ItemLoader
+    :type text: str or list
+    :return: dict with the salary_* fields that have a value
+    :rtype: dict
+    """
+    if isinstance(text, (list, tuple)):
+        text = text[0] if text else None
+    if text is None:
+        return {}
+    salary = parse_salary(text.strip())
+    return {name: value for name, value in zip(SALARY_FIELDS, salary) if value is not None}
+
+
+def parse_salary_column(values):
+    """Function that normalises a whole column of salaries at once.
+
+    Every distinct text is parsed only once and the results are spread back
+    to the rows with NumPy fancy indexing, so the cost depends on the number
+    of distinct salaries instead of the number of rows.
+
+    :param values: salaries of every row, None for the missing ones
+    :type values: iterable of str
+    :return: dict with the arrays salary_min, salary_max, salary_annual
+        (float64, nan when missing), salary_currency and salary_period (object)
+    :rtype: dict
+    """
+    import numpy as np
+
+    texts = np.array(['' if v is None else v for v in values], dtype=object)
+    uniques, inverse = np.unique(texts.astype(str), return_inverse=True)
+    parsed = [parse_salary(text.strip()) for text in uniques]
+
+    def column(index, dtype, missing):
+        return np.array([missing if s[index] is None else s[index] for s in parsed], dtype=dtype)[inverse]
+
+    return {
+        'salary_min': column(0, np.float64, np.nan),
+        'salary_max': column(1, np.float64, np.nan),
+        'salary_currency': column(2, object, None),
+        'salary_period': column(3, object, None),
+        'salary_annual': column(4, np.float64, np.nan),
+    }
+
+
+def normalise_export(path, output, column='salary'):
+    """Function that adds the salary_* columns to an existing csv or json export
+
+    :param path: csv or json file exported by the crawler
+    :type path: str
+    :param output: csv file where the rows are written with the new columns
+    :type output: str
+    :param column: name of the column that holds the salaries
+    :type column: str
+    """
+    import numpy as np
+
+    with open(path, encoding='utf8', newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    columns = parse_salary_column(
+        v[0] if isinstance(v, list) and v else (v or None)
+        for v in (row.get(column) for row in rows))
+
+    fieldnames = list(rows[0]) + list(SALARY_FIELDS) if rows else list(SALARY_FIELDS)
+    with open(output, 'w', encoding='utf8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for i, row in enumerate(rows):
+            row = {k: v[0] if isinstance(v, list) and len(v) == 1 else v for k, v in row.items()}
+            for name in SALARY_FIELDS:
+                value = columns[name][i]
+                row[name] = '' if value is None or (isinstance(value, float) and np.isnan(value)) else value
+            writer.writerow(row)
+
+
+if __name__ == '__main__':
+    normalise_export(sys.argv[1], sys.argv[2])
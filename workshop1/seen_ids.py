@@ -0,0 +1,85 @@
+import csv
+import os
+
+
+class SeenIdStore:
+    """Persistent set of the job ids that were already scraped in previous runs.
+
+    The ids are kept in memory as integers and every new id is appended to a
+    plain text file (one id per line), so the store survives between runs
+    without rewriting the whole file. The file is flushed every FLUSH_EVERY
+    new ids, so a crawl that is killed only loses the last few of them.
+
+    :param path: path of the file where the ids are persisted
+    :type path: str
+    """
+
+    FLUSH_EVERY = 100
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = set()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            # ! A line without its newline was cut by a crash, its id may be
+            # ! wrong, so it is dropped before appending after it
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                os.truncate(path, end)
+            self.ids.update(int(line) for line in data[:end].splitlines() if line.strip())
+        self.file = open(path, 'a', encoding='utf8')
+        self.pending = 0
+
+    def __contains__(self, job_id):
+        return int(job_id) in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, job_id):
+        """Adds an id to the store and persists it if it was not already known
+
+        :param job_id: id of the job posting
+        :type job_id: int or str
+        :return: True if the id was new, False otherwise
+        :rtype: bool
+        """
+        job_id = int(job_id)
+        if job_id in self.ids:
+            return False
+        self.ids.add(job_id)
+        self.file.write('%d\n' % job_id)
+        self.pending += 1
+        if self.pending >= self.FLUSH_EVERY:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Writes the new ids to the file"""
+        self.file.flush()
+        self.pending = 0
+
+    def seed_from_csv(self, path, field='id'):
+        """Adds to the store the ids found on a previous csv export
+
+        :param path: path of the csv file exported by the crawler
+        :type path: str
+        :param field: name of the column that holds the ids
+        :type field: str
+        :return: number of ids added to the store
+        :rtype: int
+        """
+        if not os.path.exists(path):
+            return 0
+        added = 0
+        with open(path, encoding='utf8', newline='') as f:
+            for row in csv.DictReader(f):
+                value = (row.get(field) or '').strip()
+                if value.isdigit() and self.add(value):
+                    added += 1
+        self.flush()
+        return added
+
+    def close(self):
+        self.file.close()
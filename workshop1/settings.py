@@ -44,27 +44,166 @@ ROBOTSTXT_OBEY = True
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    'workshop1.middlewares.Workshop1SpiderMiddleware': 543,
-#}
+    'workshop1.profiling.ProfilingSpiderMiddleware': 950,
+    'workshop1.early_stop.EarlyStopMiddleware': 150,
+    'workshop1.pacing.RulePacingMiddleware': 100,
+    'workshop1.revalidation.RevalidationSpiderMiddleware': 925,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    'workshop1.middlewares.Workshop1DownloaderMiddleware': 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+    'workshop1.middlewares.BackoffRetryMiddleware': 500,
+    'workshop1.revalidation.RevalidationDownloaderMiddleware': 520,
+    'workshop1.middlewares.Workshop1DownloaderMiddleware': 543,
+    'workshop1.middlewares.AdaptiveThrottleMiddleware': 550,
+    # * Only acts with workshop1.frontier.SharedFrontierScheduler
+    'workshop1.frontier.FrontierAckMiddleware': 990,
+}
+
+# Maximum downloads in flight shared by all the spiders of the process, used
+# when they run together with: python -m workshop1.orchestrator. The tokens
+# are taken by the download handler when the transfer starts, so the requests
+# waiting on the delay of their site do not hold them
+GLOBAL_CONCURRENT_REQUESTS = 48
+DOWNLOAD_HANDLERS = {
+    'http': 'workshop1.download_handlers.GlobalConcurrencyDownloadHandler',
+    'https': 'workshop1.download_handlers.GlobalConcurrencyDownloadHandler',
+}
+
+# Save every downloaded response on RESPONSE_STORE_DIR/<spider name>, and
+# with RESPONSE_STORE_REPLAY re-run a spider only over the saved responses:
+#     scrapy crawl reed_uk -s RESPONSE_STORE_REPLAY=True
+RESPONSE_STORE_ENABLED = False
+RESPONSE_STORE_DIR = 'responsestore'
+RESPONSE_STORE_REPLAY = False
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+    'workshop1.profiling.ProfilingExtension': 500,
+}
+
+# Timing histograms of the callbacks, item fields, processors and downloads,
+# and samples of the queues every PROFILING_INTERVAL seconds. They are added
+# to the stats and written to PROFILING_REPORT (%(name)s is the spider name):
+#     scrapy crawl reed_uk -s PROFILING_ENABLED=True
+PROFILING_ENABLED = False
+PROFILING_INTERVAL = 1.0
+PROFILING_REPORT = 'profile_%(name)s.json'
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'workshop1.pipelines.Workshop1Pipeline': 300,
-#}
+ITEM_PIPELINES = {
+    'workshop1.pipelines.RegionalGDPPipeline': 250,
+    'workshop1.pipelines.JobDedupPipeline': 300,
+    'workshop1.pipelines.CrossBoardDedupPipeline': 400,
+    'workshop1.pipelines.SkillIndexPipeline': 500,
+}
+
+# Last version of every job posting, and the jsonl file where the new or
+# changed postings of each run are appended (%(name)s is the spider name)
+DEDUP_STORE = 'jobs.sqlite'
+DEDUP_OUTPUT = '%(name)s.jsonl'
+
+# Canonical postings of the jobs found on every board. A posting joins a
+# cluster with the same normalised title, company, location and salary, or
+# one whose title has at least CROSSBOARD_TITLE_THRESHOLD (MinHash estimated
+# Jaccard) with compatible fields; every LSH bucket reads at most
+# CROSSBOARD_MAX_CANDIDATES clusters
+CROSSBOARD_STORE = 'crossboard.sqlite'
+CROSSBOARD_TITLE_THRESHOLD = 0.7
+CROSSBOARD_MAX_CANDIDATES = 50
+
+# ONS table with the population and GDP per head of the UK countries and
+# regions, joined to the job postings by RegionalGDPPipeline
+GDP_TABLE = 'gdp_uk_2019.csv'
+
+# Inverted index of the required_skills, region and salary of the postings,
+# queried with python -m workshop1.skills_index (see workshop1.skills_index)
+SKILLS_INDEX = 'skills_index.sqlite'
+
+# The spiders only extract the fields that their FEEDS export and the item
+# pipelines read. EXTRACT_FIELDS replaces the fields of the FEEDS for a run, e.g.
+#     scrapy crawl indeed -s EXTRACT_FIELDS=id
+# and EXTRACT_ALL_FIELDS extracts all of them (see workshop1.projection)
+EXTRACT_FIELDS = []
+EXTRACT_ALL_FIELDS = False
+
+# Stop following the pagination of the job boards after this many listing
+# pages in a row with only jobs already on DEDUP_STORE (0 follows all of it)
+EARLY_STOP_PAGES = 3
+
+# Validators (ETag, Last-Modified and body hash) and output of the pages of the
+# revalidate_callbacks of every spider. Known pages are requested again with
+# If-None-Match/If-Modified-Since, and when they did not change the stored
+# items are emitted again without parsing them (see workshop1.revalidation)
+REVALIDATION_ENABLED = True
+REVALIDATION_STORE = 'revalidation.sqlite'
+
+# Extra formats that can be used on the FEEDS setting
+# See https://docs.scrapy.org/en/latest/topics/feed-exports.html#feed-exporters
+FEED_EXPORTERS = {
+    'csv_append': 'workshop1.exporters.AppendCsvItemExporter',
+    'parquet': 'workshop1.exporters.ParquetItemExporter',
+}
+
+# Per domain rate controller that ramps up the concurrency until the site
+# answers with 429/503 or gets slower, and then backs off. It replaces the
+# fixed download delays of the spiders, so do not enable AutoThrottle with it
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_START_DELAY = 1.0
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.0
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 16
+# Back off when the latency goes over this many times the best one
+ADAPTIVE_THROTTLE_LATENCY_FACTOR = 2.0
+ADAPTIVE_THROTTLE_BACKOFF_HTTP_CODES = [429, 503]
+
+# Retries wait with exponential backoff and jitter (or the Retry-After of the
+# server), each domain can only retry a share of its requests, and a domain
+# with too many failures is paused for a while
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 120.0
+RETRY_BUDGET_MIN = 10
+RETRY_BUDGET_RATIO = 0.2
+CIRCUIT_BREAKER_WINDOW = 20
+CIRCUIT_BREAKER_THRESHOLD = 0.5
+CIRCUIT_BREAKER_PAUSE = 60.0
+
+# Frontier shared by several workers of the same host crawling the same
+# spider (sqlite does not work on network filesystems), used with:
+#     scrapy crawl reed_uk -s SCHEDULER=workshop1.frontier.SharedFrontierScheduler
+# Every worker leases FRONTIER_BATCH_SIZE requests at a time, and the requests
+# of a worker that stops renewing its leases go back to the others after
+# FRONTIER_LEASE seconds. FRONTIER_WORKER_ID defaults to <hostname>:<pid>
+FRONTIER_BACKEND = 'workshop1.frontier.SqliteFrontier'
+FRONTIER_DB = 'frontier.sqlite'
+FRONTIER_LEASE = 300
+FRONTIER_BATCH_SIZE = 16
+#FRONTIER_WORKER_ID = 'worker-1'
+
+# Resumable crawls, the pending requests and the seen fingerprints are kept on
+# CHECKPOINT_DIR and a checkpoint is written every CHECKPOINT_INTERVAL seconds:
+#     scrapy crawl reed_uk -s SCHEDULER=workshop1.checkpoint.CheckpointScheduler
+# Run the same command again to resume a crawl that died. Only local jsonlines
+# and csv_append feeds can be resumed, any other feed (e.g. the parquet one of
+# reed_uk) starts again on a resume with a warning
+CHECKPOINT_DIR = 'checkpoint'
+CHECKPOINT_INTERVAL = 60
+
+# Dupefilter that keeps the request fingerprints as raw 8 or 16 byte digests
+# instead of hex strings. For huge crawls, 'workshop1.dupefilters.BloomDupeFilter'
+# uses a few bits per request but drops DUPEFILTER_BLOOM_ERROR_RATE of the new
+# ones. Compare them with: python -m benchmarks.bench_dupefilters
+DUPEFILTER_CLASS = 'workshop1.dupefilters.CompactDupeFilter'
+DUPEFILTER_DIGEST_SIZE = 8
+DUPEFILTER_BLOOM_CAPACITY = 100000
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -0,0 +1,312 @@
+"""Inverted index of the required_skills of the job postings, with their region
+and annual salary, to answer queries like "the jobs that need Python and SQL
+in London paying at least 50k" without scanning the scraped files.
+
+SkillIndexPipeline adds the postings to the index as they are scraped. Every
+posting gets a document number, and every skill keeps the sorted numbers of
+its postings as a packed array of 32 bit integers (4 bytes per posting). The
+region code (4 bytes) and the salary (4 bytes) of every posting are packed
+arrays indexed by the document number too. Every FLUSH_EVERY postings the
+new numbers are written as one more segment of each array, and the segments
+are merged when a spider closes. A posting whose skills, region or salary
+changed gets a new number and the old one is marked as deleted.
+
+The queries load the arrays with numpy and combine them as boolean masks, so
+they take a few milliseconds with millions of postings:
+
+    python -m workshop1.skills_index python sql --region London --min-salary 50000
+    python -m workshop1.skills_index --any pytorch tensorflow --not java --limit 20
+"""
+import argparse
+import hashlib
+import json
+import math
+import sqlite3
+import time
+from array import array
+
+from .minhash import normalise_text
+
+
+def normalise_skill(skill):
+    """Function that lowercases a skill and removes the punctuation around it
+    (": SQL" is "sql"), keeping the one inside ("c++", "c#")
+
+    :rtype: str
+    """
+    return ' '.join(str(skill).lower().split()).strip(' :;,.-/|*')
+
+
+# * Version of the layout of the arrays, on the user_version of the database
+FORMAT_VERSION = 2
+
+
+def check_version(db, path):
+    """Function that raises a ValueError if an index was written with another
+    layout of the arrays (the version 1 had 2 byte region codes), instead of
+    reading its columns misaligned
+
+    :param db: connection to the index
+    :type db: sqlite3.Connection
+    :param path: path of the index, for the message
+    :type path: str
+    """
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    written = db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'columns'").fetchone()[0]
+    if written and version != FORMAT_VERSION:
+        raise ValueError('%s has the format %d of the skills index instead of %d, '
+                         'delete it and scrape again' % (path, version or 1, FORMAT_VERSION))
+
+
+class SkillIndexWriter:
+    """Incremental writer of the skills index, on a sqlite database
+
+    :param path: path of the sqlite database
+    :type path: str
+    """
+
+    FLUSH_EVERY = 5000
+    MAX_SEGMENTS = 16
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        check_version(self.db, path)
+        self.db.executescript(
+            'CREATE TABLE IF NOT EXISTS docs ('
+            'spider TEXT NOT NULL, id INTEGER NOT NULL, docno INTEGER NOT NULL, '
+            'digest BLOB NOT NULL, PRIMARY KEY (spider, id)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS docs_docno ON docs (docno);'
+            'CREATE TABLE IF NOT EXISTS postings ('
+            'skill TEXT NOT NULL, segment INTEGER NOT NULL, docs BLOB NOT NULL, '
+            'PRIMARY KEY (skill, segment)) WITHOUT ROWID;'
+            # * region (uint32 codes), salary (float32) and deleted (uint32 docnos)
+            'CREATE TABLE IF NOT EXISTS columns ('
+            'name TEXT NOT NULL, segment INTEGER NOT NULL, data BLOB NOT NULL, '
+            'PRIMARY KEY (name, segment)) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS regions ('
+            'code INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);'
+            'PRAGMA user_version = %d;' % FORMAT_VERSION)
+        # ! A changed posting always gets a bigger number, so the biggest one is live
+        self.next_doc = self.db.execute('SELECT COALESCE(MAX(docno) + 1, 0) FROM docs').fetchone()[0]
+        self.regions = dict(self.db.execute('SELECT name, code FROM regions'))
+        self._reset()
+
+    def _reset(self):
+        self.first_doc = self.next_doc
+        self.pending = {}
+        self.region_codes = array('I')
+        self.salaries = array('f')
+        self.deleted = array('I')
+
+    def _region_code(self, region):
+        if not region:
+            return 0
+        if region not in self.regions:
+            # ! Code 0 is a posting without region
+            self.regions[region] = len(self.regions) + 1
+            self.db.execute('INSERT INTO regions VALUES (?, ?)', (self.regions[region], region))
+        return self.regions[region]
+
+    def add(self, spider, job_id, skills, region=None, salary=None):
+        """Adds a posting to the index, or updates it
+
+        :param spider: name of the spider of the posting
+        :type spider: str
+        :param job_id: integer id of the posting on its board
+        :type job_id: int
+        :param skills: skills required by the posting
+        :type skills: list
+        :param region: region or locality of the posting
+        :type region: str
+        :param salary: annual salary of the posting
+        :type salary: float
+        :return: 'new', 'updated' or 'unchanged'
+        :rtype: str
+        """
+        skills = sorted({skill for skill in map(normalise_skill, skills or ()) if skill})
+        region = normalise_text(region)
+        salary = float(salary) if salary is not None else None
+        digest = hashlib.blake2b(json.dumps([skills, region, salary]).encode('utf8'),
+                                 digest_size=8).digest()
+        row = self.db.execute('SELECT docno, digest FROM docs WHERE spider = ? AND id = ?',
+                              (spider, job_id)).fetchone()
+        if row is not None and row[1] == digest:
+            return 'unchanged'
+
+        docno = self.next_doc
+        code = self._region_code(region)
+        appended = []
+        try:
+            for values, value in ((self.region_codes, code),
+                                  (self.salaries, math.nan if salary is None else salary)):
+                values.append(value)
+                appended.append(values)
+            for skill in skills:
+                values = self.pending.setdefault(skill, array('I'))
+                values.append(docno)
+                appended.append(values)
+            if row is not None:
+                self.deleted.append(row[0])
+                appended.append(self.deleted)
+            self.db.execute('INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)',
+                            (spider, job_id, docno, digest))
+        except Exception:
+            # ! A failed posting leaves no value behind, every column and
+            # ! posting list has to stay aligned with the document numbers
+            for values in appended:
+                values.pop()
+            for skill in skills:
+                if not self.pending.get(skill, True):
+                    del self.pending[skill]
+            raise
+        self.next_doc += 1
+        if self.next_doc - self.first_doc >= self.FLUSH_EVERY:
+            self.flush()
+        return 'updated' if row is not None else 'new'
+
+    def flush(self):
+        """Writes the postings added since the last flush as new segments"""
+        if self.next_doc == self.first_doc:
+            return
+        segment = self.first_doc
+        self.db.executemany('INSERT INTO postings VALUES (?, ?, ?)', [
+            (skill, segment, docs.tobytes()) for skill, docs in self.pending.items()])
+        columns = [('region', self.region_codes), ('salary', self.salaries)]
+        if self.deleted:
+            columns.append(('deleted', self.deleted))
+        self.db.executemany('INSERT INTO columns VALUES (?, ?, ?)', [
+            (name, segment, values.tobytes()) for name, values in columns])
+        self.db.commit()
+        self._reset()
+
+    def merge(self):
+        """Joins the segments of the skills and columns that have more than
+        MAX_SEGMENTS, so a query reads a few rows for each of them"""
+        for table, key, data in (('postings', 'skill', 'docs'), ('columns', 'name', 'data')):
+            names = [name for name, in self.db.execute(
+                'SELECT %s FROM %s GROUP BY %s HAVING COUNT(*) > ?' % (key, table, key),
+                (self.MAX_SEGMENTS,))]
+            for name in names:
+                rows = self.db.execute(
+                    'SELECT segment, %s FROM %s WHERE %s = ? ORDER BY segment' % (data, table, key),
+                    (name,)).fetchall()
+                self.db.execute('DELETE FROM %s WHERE %s = ?' % (table, key), (name,))
+                self.db.execute('INSERT INTO %s VALUES (?, ?, ?)' % table,
+                                (name, rows[0][0], b''.join(row[1] for row in rows)))
+        self.db.commit()
+
+    def close(self):
+        self.flush()
+        self.merge()
+        self.db.close()
+
+
+class SkillIndex:
+    """Read only view of the skills index, for the queries
+
+    :param path: path of the sqlite database
+    :type path: str
+    """
+
+    def __init__(self, path):
+        import numpy as np
+        self._np = np
+        self.db = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        check_version(self.db, path)
+        self.regions = dict(self.db.execute('SELECT name, code FROM regions'))
+        self.region_codes = self._column('region', np.uint32)
+        self.salaries = self._column('salary', np.float32)
+        self.size = len(self.region_codes)
+        self.live = np.ones(self.size, dtype=bool)
+        self.live[self._column('deleted', np.uint32)] = False
+
+    def _column(self, name, dtype):
+        rows = self.db.execute('SELECT data FROM columns WHERE name = ? ORDER BY segment', (name,))
+        return self._np.frombuffer(b''.join(data for data, in rows), dtype=dtype)
+
+    def postings(self, skill):
+        """Returns the document numbers of the postings of a skill, the deleted
+        ones included
+
+        :rtype: numpy.ndarray
+        """
+        rows = self.db.execute('SELECT docs FROM postings WHERE skill = ? ORDER BY segment',
+                               (normalise_skill(skill),))
+        return self._np.frombuffer(b''.join(docs for docs, in rows), dtype=self._np.uint32)
+
+    def _mask(self, skills):
+        mask = self._np.zeros(self.size, dtype=bool)
+        for skill in skills:
+            mask[self.postings(skill)] = True
+        return mask
+
+    def query(self, all_skills=(), any_skills=(), not_skills=(), region=None,
+              min_salary=None, max_salary=None):
+        """Returns the document numbers of the live postings that match every filter
+
+        :param all_skills: skills that the postings need all of
+        :type all_skills: list
+        :param any_skills: skills that the postings need at least one of
+        :type any_skills: list
+        :param not_skills: skills that the postings can not need
+        :type not_skills: list
+        :param region: region of the postings, the gdp_region for reed
+        :type region: str
+        :param min_salary: minimum annual salary, the postings without salary
+            do not match it
+        :type min_salary: float
+        :param max_salary: maximum annual salary
+        :type max_salary: float
+        :rtype: numpy.ndarray
+        """
+        mask = self.live.copy()
+        for skill in all_skills:
+            mask &= self._mask([skill])
+        if any_skills:
+            mask &= self._mask(any_skills)
+        for skill in not_skills:
+            mask[self.postings(skill)] = False
+        if region is not None:
+            mask &= self.region_codes == self.regions.get(normalise_text(region), -1)
+        # * The comparisons with NaN are False
+        if min_salary is not None:
+            mask &= self.salaries >= min_salary
+        if max_salary is not None:
+            mask &= self.salaries <= max_salary
+        return self._np.flatnonzero(mask)
+
+    def jobs(self, docnos):
+        """Returns the (spider, id) of some document numbers"""
+        docnos = [int(docno) for docno in docnos]
+        found = {docno: (spider, job_id) for docno, spider, job_id in self.db.execute(
+            'SELECT docno, spider, id FROM docs WHERE docno IN (%s)'
+            % ','.join('?' * len(docnos)), docnos)}
+        return [found[docno] for docno in docnos if docno in found]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Finds the job postings by skills, region and salary')
+    parser.add_argument('skills', nargs='*', help='skills that the jobs need all of')
+    parser.add_argument('--any', nargs='+', default=[], metavar='SKILL',
+                        help='skills that the jobs need at least one of')
+    parser.add_argument('--not', nargs='+', default=[], metavar='SKILL', dest='not_skills',
+                        help='skills that the jobs can not need')
+    parser.add_argument('--region', help='region of the jobs, e.g. London or "South East"')
+    parser.add_argument('--min-salary', type=float, help='minimum annual salary')
+    parser.add_argument('--max-salary', type=float, help='maximum annual salary')
+    parser.add_argument('--limit', type=int, default=10, help='jobs to print (default: 10)')
+    parser.add_argument('--index', default='skills_index.sqlite', help='path of the index')
+    args = parser.parse_args(argv)
+
+    index = SkillIndex(args.index)
+    start = time.perf_counter()
+    docnos = index.query(args.skills, args.any, args.not_skills, args.region,
+                         args.min_salary, args.max_salary)
+    elapsed = time.perf_counter() - start
+    print('%d of %d jobs match (%.1f ms)' % (len(docnos), int(index.live.sum()), elapsed * 1000))
+    for spider, job_id in index.jobs(docnos[:args.limit]):
+        print('%s\t%s' % (spider, job_id))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,9 @@ from scrapy.linkextractors.lxmlhtml import LxmlLinkExtractor
 from scrapy.spiders import Rule, CrawlSpider
 from scrapy.crawler import CrawlerProcess
 from itemloaders.processors import MapCompose, TakeFirst
-from itemloaders import ItemLoader
+from ..items import compact_item
+from ..linkrules import CombinedRulesMixin
+from ..projection import ProjectedItemLoader, ProjectionMixin
 
 # * XPATHS
 TITLE_XPATH = '//div[contains(@class,"product_main")]/h1/text()'
@@ -34,7 +36,16 @@ class BookItem(Item):
     )
 
 
-class CrawlerTaller(CrawlSpider):
+# * Slotted version of BookItem, with less memory per item (-a item_type=compact)
+CompactBookItem = compact_item(BookItem, {
+    'title': str,
+    'tax': str,
+    'price': str,
+    'availability': int,
+})
+
+
+class CrawlerTaller(CombinedRulesMixin, ProjectionMixin, CrawlSpider):
     """
     This CrawlSpider will get information about books. It will navigate through the links of the page
     """
@@ -54,6 +65,11 @@ class CrawlerTaller(CrawlSpider):
         'CLOSESPIDER_ITEMCOUNT': '5'
     }
 
+    # ! 'item' or 'compact' (slotted), e.g. scrapy crawl books -a item_type=compact
+    item_type = 'item'
+    # * Item class of the spider, all its fields are extracted when all are read
+    item_class = BookItem
+
     start_urls = ['https://books.toscrape.com/']
 
     rules = [
@@ -86,7 +102,8 @@ class CrawlerTaller(CrawlSpider):
         """
         self.logger.info('Now we are crawling: %s', response.url)
         sel = Selector(response)
-        item = ItemLoader(BookItem(), sel)
+        book = CompactBookItem() if self.item_type == 'compact' else BookItem()
+        item = ProjectedItemLoader(book, sel, fields=self.extract_fields)
         item.add_xpath('title', TITLE_XPATH)
         item.add_xpath('tax', TAX_XPATH)
         item.add_xpath('price', PRICE_XPATH)
@@ -1,12 +1,16 @@
+from typing import List
+
 from scrapy.item import Field, Item
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.selector import Selector
-from scrapy.loader.processors import MapCompose, TakeFirst
+from itemloaders.processors import MapCompose, TakeFirst
 from scrapy.linkextractors import LinkExtractor
 # from scrapy.crawler import CrawlerProcess
 
-from itemloaders import ItemLoader
+from ..extractors import CompiledExtractor
+from ..items import compact_item
 from ..processor_functions import cleanText
+from ..projection import ProjectedItemLoader, ProjectionMixin
 
 # * XPATHS
 DIV_JOBS_XPATH = '//div[@data-jk]'
@@ -34,9 +38,22 @@ class Job(Item):
     # )
 
 
+# * Slotted version of Job, with less memory per item (-a item_type=compact)
+CompactJob = compact_item(Job, {
+    'id': List[str],
+    'title': List[str],
+})
+
+# * Precompiled alternative to the ItemLoader of parse_job (-a extractor=compiled)
+JOB_EXTRACTOR = CompiledExtractor.from_item(Job, {
+    'id': ID_XPATH,
+    'title': TITLE_XPATH,
+}, rows_xpath=DIV_JOBS_XPATH)
+
+
 # * 2 Define the CrawlSpider
 
-class IndeedCrawlSpider(CrawlSpider):
+class IndeedCrawlSpider(ProjectionMixin, CrawlSpider):
     #  * 3 Configuration (headers, limitations, etc)
     name = "indeed"
 
@@ -53,7 +70,15 @@ class IndeedCrawlSpider(CrawlSpider):
         }
     }
 
-    download_delay = 2
+    # ! The delay between requests is handled by AdaptiveThrottleMiddleware
+
+    # ! 'itemloader' or 'compiled', e.g. scrapy crawl indeed -a extractor=compiled
+    extractor = 'itemloader'
+
+    # ! 'item' or 'compact' (slotted), e.g. scrapy crawl indeed -a item_type=compact
+    item_type = 'item'
+    # * Item class of the spider, all its fields are extracted when all are read
+    item_class = Job
 
     allowed_domains = ['uk.indeed.com']
 
@@ -71,12 +96,28 @@ class IndeedCrawlSpider(CrawlSpider):
         ),
     )
 
+    # ! Index of the pagination rule, it is not followed anymore after
+    # ! EARLY_STOP_PAGES listing pages with only known jobs (workshop1.early_stop)
+    pagination_rule = 0
+
+    def listing_job_ids(self, response):
+        """
+        Function that returns the ids of the job postings shown on a listing page
+        """
+        return response.xpath(DIV_JOBS_XPATH).xpath(ID_XPATH).getall()
+
     def parse_job(self, response):
+        if self.extractor == 'compiled':
+            yield from JOB_EXTRACTOR.project(self.extract_fields).extract_response(
+                response, item_cls=CompactJob if self.item_type == 'compact' else None)
+            return
+
         sel = Selector(response)
         div_jobs = sel.xpath(DIV_JOBS_XPATH)
 
         for div in div_jobs:
-            item = ItemLoader(Job(), div)
+            job = CompactJob() if self.item_type == 'compact' else Job()
+            item = ProjectedItemLoader(job, div, fields=self.extract_fields)
             item.add_xpath('id', ID_XPATH)
             item.add_xpath('title', TITLE_XPATH)
 
@@ -92,6 +133,7 @@ class IndeedCrawlSpider(CrawlSpider):
 
 
 # * RUN SCRAPY PROCCESS
+# ! To run it together with the other job boards use $ python -m workshop1.orchestrator
 # process = CrawlerProcess()
 # process.crawl(IndeedCrawlSpider)
 # process.start()
@@ -1,12 +1,25 @@
+import re
+from typing import List
+
+from scrapy import signals
 from scrapy.item import Field, Item
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.selector import Selector
 from scrapy.linkextractors import LinkExtractor
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from itemadapter import ItemAdapter
 
 from itemloaders.processors import MapCompose, TakeFirst
-from itemloaders import ItemLoader
-from ..processor_functions import cleanText, clean_posting_date, clean_id
+from ..extractors import CompiledExtractor
+from ..items import compact_item
+from ..linkrules import CombinedRulesMixin
+from ..pacing import PrioritisedRule
+from ..parse_pool import ParsePool
+from ..processor_functions import (cleanText, clean_posting_date, clean_id,
+                                   resolve_posting_date, response_fetch_date)
+from ..projection import ProjectedItemLoader, ProjectionMixin
+from ..salary import SALARY_FIELDS, salary_fields
+from ..seen_ids import SeenIdStore
 
 # * XPATHS
 # ? XPATH FROM SEARCH PAGE
@@ -27,6 +40,9 @@ REQUIRED_SKILLS_XPATH   = '//ul[@class="list-unstyled skills-list"]/li/text()'
 IS_REMOTE_XPATH         = '//i[contains(@class,"remote")]'
 BE_IN_FIRST_TEN_XPATH   = '//i[contains(@class,"applicants")]'
 
+# ? NUMERIC JOB ID AT THE END OF A DETAIL PAGE URL
+JOB_URL_ID_RE = re.compile(r'/jobs/.*/(\d+)')
+
 
 # * 1 Job abraction gets defined
 class Job(Item):
@@ -44,13 +60,29 @@ class Job(Item):
         output_processor=TakeFirst()
     )
     posting_date = Field(
-        input_processor=MapCompose(cleanText, clean_posting_date),
+        input_processor=MapCompose(cleanText, clean_posting_date, resolve_posting_date),
         output_processor=TakeFirst()
     )
     salary = Field(
         input_processor=MapCompose(cleanText),
         output_processor=TakeFirst()
     )
+    # * Normalised salary, see workshop1.salary
+    salary_min = Field(
+        output_processor=TakeFirst()
+    )
+    salary_max = Field(
+        output_processor=TakeFirst()
+    )
+    salary_currency = Field(
+        output_processor=TakeFirst()
+    )
+    salary_period = Field(
+        output_processor=TakeFirst()
+    )
+    salary_annual = Field(
+        output_processor=TakeFirst()
+    )
     country = Field(
         input_processor=MapCompose(cleanText),
         output_processor=TakeFirst()
@@ -76,11 +108,64 @@ class Job(Item):
     be_in_first_ten = Field(
         output_processor=TakeFirst()
     )
+    # * Filled by RegionalGDPPipeline
+    gdp_region = Field()
+    region_population = Field()
+    region_gdp_per_head = Field()
+
+
+# * Slotted version of Job, with less memory per item (-a item_type=compact)
+CompactJob = compact_item(Job, {
+    'id': int,
+    'title': str,
+    'employer': str,
+    'posting_date': str,
+    'salary': str,
+    'salary_min': float,
+    'salary_max': float,
+    'salary_currency': str,
+    'salary_period': str,
+    'salary_annual': float,
+    'country': str,
+    'region': str,
+    'locality': str,
+    'employment_type': str,
+    'required_skills': List[str],
+    'is_remote': bool,
+    'be_in_first_ten': bool,
+    'gdp_region': str,
+    'region_population': int,
+    'region_gdp_per_head': int,
+})
+
+
+# * Precompiled alternative to the ItemLoader of parse_job (-a extractor=compiled)
+JOB_EXTRACTOR = CompiledExtractor.from_item(Job, {
+    'id': ID_XPATH,
+    'title': (TITLE_XPATH, ALTERNATIVE_TITLE_XPATH),
+    'employer': EMPLOYER_XPATH,
+    'posting_date': POSTING_DATE_XPATH,
+    'salary': SALARY_XPATH,
+    'country': COUNTRY_XPATH,
+    'region': REGION_XPATH,
+    'locality': LOCALITY_XPATH,
+    'employment_type': EMPLOYMENT_TYPE_XPATH,
+    'required_skills': REQUIRED_SKILLS_XPATH,
+    'is_remote': IS_REMOTE_XPATH,
+    'be_in_first_ten': BE_IN_FIRST_TEN_XPATH,
+}, exists=('is_remote', 'be_in_first_ten'), derived={'salary': salary_fields})
+
+
+def extract_job(body, encoding, url, fetched_on, item_cls=None, fields=None):
+    """Function that runs on the workers of the ParsePool, it gets the job
+    posting from the raw html of the page with the compiled extractor"""
+    return JOB_EXTRACTOR.project(fields).extract_body(
+        body, encoding, url, {'fetched_on': fetched_on}, item_cls)
 
 
 # * 2 Define the CrawlSpider
 
-class ReedUKCrawlSpider(CrawlSpider):
+class ReedUKCrawlSpider(CombinedRulesMixin, ProjectionMixin, CrawlSpider):
     """
     Class that inherits from CrawlerSpider, which contains all the functionality
     of the Crawler to extract the data
@@ -94,60 +179,193 @@ class ReedUKCrawlSpider(CrawlSpider):
         'USER_AGENT': 'Opera/9.80 (Windows NT 6.1; WOW64) Presto/2.12.388 Version/12.18',
         'FEEDS': {
             'reed_uk.csv': {
-                'format': 'csv',
+                # ! Only new postings get scraped, so they are appended
+                'format': 'csv_append',
                 'encoding': 'utf8',
-                'overwrite': True,
+                'overwrite': False,
                 'fields': ['id', 'title', 'employer', 'posting_date',
                            'salary', 'country', 'region', 'locality',
                            'employment_type', 'is_remote', 'be_in_first_ten',
                            'required_skills']
-            }
+            },
+            # ! Typed columns for the analysts, one file per run
+            'parquet/reed_uk_%(time)s.parquet': {
+                'format': 'parquet',
+                'fields': ['id', 'title', 'employer', 'posting_date',
+                           'salary', 'salary_min', 'salary_max', 'salary_currency',
+                           'salary_period', 'salary_annual', 'country', 'region',
+                           'locality', 'employment_type', 'is_remote',
+                           'be_in_first_ten', 'required_skills', 'gdp_region',
+                           'region_population', 'region_gdp_per_head']
+            },
         },
         'CONCURRENT_REQUESTS': 32,
         'ROBOTSTXT_OBEY': True,
-        # ! To handle time between requirements
-        'DOWNLOAD_DELAY': 1,
+        # ! The time between requirements is handled by AdaptiveThrottleMiddleware
         # ! To handle connection errors
         'DOWNLOADER_MIDDLEWARES': {
-            "scrapy.downloadermiddlewares.retry.RetryMiddleware": 500
+            "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
+            "workshop1.middlewares.BackoffRetryMiddleware": 500,
+            "workshop1.revalidation.RevalidationDownloaderMiddleware": 520,
+            "workshop1.middlewares.Workshop1DownloaderMiddleware": 543,
+            "workshop1.middlewares.AdaptiveThrottleMiddleware": 550,
+            "workshop1.frontier.FrontierAckMiddleware": 990,
         },
         'RETRY_HTTP_CODES': [
             500, 502, 503, 504, 522, 524, 400, 408, 429, 403],
         'RETRY_ENABLED': True,
         'RETRY_TIMES': 10,
+        # ! Ids of the postings already scraped, set it to None to crawl everything
+        'SEEN_IDS_FILE': 'reed_uk_seen_ids.txt',
+        # ! Worker processes that parse the job pages (0 parses them on the reactor)
+        'PARSE_WORKERS': 0,
+        # ! Maximum pages waiting for a worker, bounds the memory used by the pool
+        'PARSE_MAX_PENDING': 64,
     }
 
+    # ! 'itemloader' or 'compiled', e.g. scrapy crawl reed_uk -a extractor=compiled
+    extractor = 'itemloader'
+
+    # ! 'item' or 'compact' (slotted), e.g. scrapy crawl reed_uk -a item_type=compact
+    item_type = 'item'
+    # * Item class of the spider, all its fields are extracted when all are read
+    item_class = Job
+
     allowed_domains = ['www.reed.co.uk']
 
     # * 4 Define the seed urls
     start_urls = ['https://www.reed.co.uk/jobs/data-scientist-jobs']
 
     # * 5 Define the rules
+    # ! The job pages go first, and the next listing pages wait while more
+    # ! than max_queue requests are already scheduled (see workshop1.pacing)
     rules = (
         # * Horizontal pagination
-        Rule(
+        PrioritisedRule(
             LinkExtractor(
                 allow=r'/jobs/data-scientist-jobs\?pageno=\d+$'
-            ), follow=True,
+            ), follow=True, priority=0, max_queue=50,
         ),
         # * Vertical pagination
-        Rule(
+        PrioritisedRule(
             LinkExtractor(
                 allow=r'/jobs/.*/\d+',
                 restrict_xpaths=[DIV_JOBS_XPATH],
-            ), follow=True, callback='parse_job'
+            ), follow=True, callback='parse_job', process_links='skip_seen_jobs',
+            process_request='route_parse_job', priority=10,
         )
     )
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.seen_ids = None
+        seen_ids_file = crawler.settings.get('SEEN_IDS_FILE')
+        if seen_ids_file:
+            spider.seen_ids = SeenIdStore(seen_ids_file)
+            if not spider.seen_ids:
+                # * First incremental run, take the ids from the last export
+                spider.seen_ids.seed_from_csv('reed_uk.csv')
+            crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+
+        spider.parse_pool = None
+        parse_workers = crawler.settings.getint('PARSE_WORKERS')
+        if parse_workers > 0:
+            spider.parse_pool = ParsePool(
+                parse_workers, crawler.settings.getint('PARSE_MAX_PENDING', 64))
+
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    # ! Index of the pagination rule, it is not followed anymore after
+    # ! EARLY_STOP_PAGES listing pages with only known jobs (workshop1.early_stop)
+    pagination_rule = 0
+
+    # ! Only the fields read by the feeds and the pipelines are extracted, and
+    # ! the ids are always needed by the seen ids (workshop1.projection)
+    required_fields = ('id',)
+    field_sources = {name: 'salary' for name in SALARY_FIELDS}
+
+    # ! Unchanged job pages are not parsed again, their stored items are
+    # ! emitted instead (workshop1.revalidation). The offloaded pages are
+    # ! still parsed when the server answers 200 with the same body
+    revalidate_callbacks = ('parse_job', 'parse_job_offloaded')
+
+    def listing_job_ids(self, response):
+        """
+        Function that returns the ids of the job postings linked from a
+        search results page
+        """
+        job_ids = []
+        for href in response.xpath(DIV_JOBS_XPATH).xpath('.//a/@href').getall():
+            match = JOB_URL_ID_RE.search(href)
+            if match:
+                job_ids.append(match.group(1))
+        return job_ids
+
+    def skip_seen_jobs(self, links):
+        """
+        Function that removes the links of the job postings that were already
+        scraped, so they never reach the downloader
+        """
+        if not self.seen_ids:
+            return links
+
+        new_links = []
+        for link in links:
+            match = JOB_URL_ID_RE.search(link.url)
+            if match and match.group(1) in self.seen_ids:
+                self.crawler.stats.inc_value('seen_ids/skipped')
+                continue
+            new_links.append(link)
+        return new_links
+
+    def route_parse_job(self, request, response):
+        """
+        Function that sends the job pages to parse_job_offloaded when there is
+        a pool of parse workers
+        """
+        if self.parse_pool is None:
+            return request
+        return request.replace(callback=self.parse_job_offloaded)
+
+    async def parse_job_offloaded(self, response):
+        """
+        Function that parses the job page on a worker process with the compiled
+        extractor, and follows the links of the page like the Rule would
+        """
+        items = await self.parse_pool.run(
+            extract_job, response.body, response.encoding, response.url,
+            response_fetch_date(response), CompactJob if self.item_type == 'compact' else None,
+            self.extract_fields)
+        return items + list(self._parse_response(response, None, {}))
+
+    def item_scraped(self, item, response, spider):
+        job_id = ItemAdapter(item).get('id')
+        if job_id is not None:
+            self.seen_ids.add(job_id)
+
+    def spider_closed(self, spider):
+        if self.seen_ids is not None:
+            self.seen_ids.close()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+
     def parse_job(self, response):
         """
         Function that obtain all the data once the crawler reched the desired url
         given by the rules of the SpiderCrawler
         """
-
+        fetched_on = response_fetch_date(response)
+        if self.extractor == 'compiled':
+            yield from JOB_EXTRACTOR.project(self.extract_fields).extract_response(
+                response, {'fetched_on': fetched_on},
+                CompactJob if self.item_type == 'compact' else None)
+            return
 
         sel = Selector(response)
-        item = ItemLoader(Job(), sel)
+        job = CompactJob() if self.item_type == 'compact' else Job()
+        item = ProjectedItemLoader(job, sel, fields=self.extract_fields, fetched_on=fetched_on)
         item.add_xpath('id', ID_XPATH)
         item.add_xpath('employer', EMPLOYER_XPATH)
         item.add_xpath('posting_date', POSTING_DATE_XPATH)
@@ -158,21 +376,27 @@ class ReedUKCrawlSpider(CrawlSpider):
         item.add_xpath('required_skills', REQUIRED_SKILLS_XPATH)
         item.add_xpath('country', COUNTRY_XPATH)
 
-        title = sel.xpath(TITLE_XPATH).get()
-        if not title:
-            title = sel.xpath(ALTERNATIVE_TITLE_XPATH).get()
-        item.add_value('title', title)
-
-        has_remote_work = sel.xpath(IS_REMOTE_XPATH)
-        if has_remote_work:
-            item.add_value('is_remote', True)
-        else:
-            item.add_value('is_remote', False)
-
-        has_to_be_in_first_ten = sel.xpath(BE_IN_FIRST_TEN_XPATH)
-        if has_to_be_in_first_ten:
-            item.add_value('be_in_first_ten', True)
-        else:
-            item.add_value('be_in_first_ten', False)
+        for name, value in salary_fields(item.get_output_value('salary')).items():
+            item.add_value(name, value)
+
+        if self.wants('title'):
+            title = sel.xpath(TITLE_XPATH).get()
+            if not title:
+                title = sel.xpath(ALTERNATIVE_TITLE_XPATH).get()
+            item.add_value('title', title)
+
+        if self.wants('is_remote'):
+            has_remote_work = sel.xpath(IS_REMOTE_XPATH)
+            if has_remote_work:
+                item.add_value('is_remote', True)
+            else:
+                item.add_value('is_remote', False)
+
+        if self.wants('be_in_first_ten'):
+            has_to_be_in_first_ten = sel.xpath(BE_IN_FIRST_TEN_XPATH)
+            if has_to_be_in_first_ten:
+                item.add_value('be_in_first_ten', True)
+            else:
+                item.add_value('be_in_first_ten', False)
 
         yield item.load_item()
@@ -1,12 +1,17 @@
+from typing import List
+
 from scrapy.item import Field, Item
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.selector import Selector
-from scrapy.loader.processors import MapCompose, TakeFirst
+from itemloaders.processors import MapCompose, TakeFirst
 from scrapy.linkextractors import LinkExtractor
 # from scrapy.crawler import CrawlerProcess
 
-from itemloaders import ItemLoader
-from ..processor_functions import cleanText
+from ..extractors import CompiledExtractor
+from ..items import compact_item
+from ..processor_functions import cleanText, resolve_posting_date, response_fetch_date
+from ..projection import ProjectedItemLoader, ProjectionMixin
+from ..salary import SALARY_FIELDS, salary_fields
 
 # * XPATHS
 DIV_JOBS_XPATH = '//div[contains(@class,"job ")]'
@@ -27,16 +32,60 @@ class Job(Item):
     title = Field()
     location = Field()
     salary = Field()
+    # * Normalised salary, see workshop1.salary
+    salary_min = Field(
+        output_processor=TakeFirst()
+    )
+    salary_max = Field(
+        output_processor=TakeFirst()
+    )
+    salary_currency = Field(
+        output_processor=TakeFirst()
+    )
+    salary_period = Field(
+        output_processor=TakeFirst()
+    )
+    salary_annual = Field(
+        output_processor=TakeFirst()
+    )
     job_type = Field()
     company = Field()
     date_posted = Field(
-        input_processor=MapCompose(cleanText)
+        input_processor=MapCompose(cleanText, resolve_posting_date)
     )
 
 
+# * Slotted version of Job, with less memory per item (-a item_type=compact)
+CompactJob = compact_item(Job, {
+    'id': List[str],
+    'title': List[str],
+    'location': List[str],
+    'salary': List[str],
+    'salary_min': float,
+    'salary_max': float,
+    'salary_currency': str,
+    'salary_period': str,
+    'salary_annual': float,
+    'job_type': List[str],
+    'company': List[str],
+    'date_posted': List[str],
+})
+
+# * Precompiled alternative to the ItemLoader of parse_job (-a extractor=compiled)
+JOB_EXTRACTOR = CompiledExtractor.from_item(Job, {
+    'id': ID_XPATH,
+    'title': TITLE_XPATH,
+    'salary': SALARY_XPATH,
+    'job_type': JOB_TYPE_XPATH,
+    'company': COMPANY_XPATH,
+    'date_posted': DATE_POSTED_XPATH,
+}, rows_xpath=DIV_JOBS_XPATH, constants={'location': ['London']},
+    derived={'salary': salary_fields})
+
+
 # * 2 Define the CrawlSpider
 
-class TotalJobsCrawlSpider(CrawlSpider):
+class TotalJobsCrawlSpider(ProjectionMixin, CrawlSpider):
     #  * 3 Configuration (headers, limitations, etc)
     name = "total_jobs"
 
@@ -47,12 +96,30 @@ class TotalJobsCrawlSpider(CrawlSpider):
                 'format': 'json',
                 'encoding': 'utf8',
                 'overwrite': True,
-                'fields': ['id', 'title', 'salary', 'job_type', 'company', 'date_posted'],
+                'fields': ['id', 'title', 'salary', 'salary_min', 'salary_max',
+                           'salary_currency', 'salary_period', 'salary_annual',
+                           'job_type', 'company', 'date_posted'],
+            },
+            # ! Typed columns for the analysts
+            'total_jobs.parquet': {
+                'format': 'parquet',
+                'overwrite': True,
+                'fields': ['id', 'title', 'salary', 'salary_min', 'salary_max',
+                           'salary_currency', 'salary_period', 'salary_annual',
+                           'job_type', 'company', 'date_posted'],
             }
         }
     }
 
-    download_delay = 3
+    # ! The delay between requests is handled by AdaptiveThrottleMiddleware
+
+    # ! 'itemloader' or 'compiled', e.g. scrapy crawl total_jobs -a extractor=compiled
+    extractor = 'itemloader'
+
+    # ! 'item' or 'compact' (slotted), e.g. scrapy crawl total_jobs -a item_type=compact
+    item_type = 'item'
+    # * Item class of the spider, all its fields are extracted when all are read
+    item_class = Job
 
     allowed_domains = ['www.totaljobs.com']
 
@@ -70,12 +137,37 @@ class TotalJobsCrawlSpider(CrawlSpider):
         ),
     )
 
+    # ! Index of the pagination rule, it is not followed anymore after
+    # ! EARLY_STOP_PAGES listing pages with only known jobs (workshop1.early_stop)
+    pagination_rule = 0
+
+    # ! Unchanged listing pages are not parsed again, their stored items and
+    # ! next pages are emitted instead (workshop1.revalidation)
+    revalidate_callbacks = ('parse_job',)
+
+    # ! Only the fields read by the feeds and the pipelines are extracted (workshop1.projection)
+    field_sources = {name: 'salary' for name in SALARY_FIELDS}
+
+    def listing_job_ids(self, response):
+        """
+        Function that returns the ids of the job postings shown on a listing page
+        """
+        return response.xpath(DIV_JOBS_XPATH).xpath(ID_XPATH).getall()
+
     def parse_job(self, response):
+        fetched_on = response_fetch_date(response)
+        if self.extractor == 'compiled':
+            yield from JOB_EXTRACTOR.project(self.extract_fields).extract_response(
+                response, {'fetched_on': fetched_on},
+                CompactJob if self.item_type == 'compact' else None)
+            return
+
         sel = Selector(response)
         div_jobs = sel.xpath(DIV_JOBS_XPATH)
 
         for div in div_jobs:
-            item = ItemLoader(Job(), div)
+            job = CompactJob() if self.item_type == 'compact' else Job()
+            item = ProjectedItemLoader(job, div, fields=self.extract_fields, fetched_on=fetched_on)
             item.add_xpath('id', ID_XPATH)
             item.add_xpath('title', TITLE_XPATH)
 
@@ -87,10 +179,14 @@ class TotalJobsCrawlSpider(CrawlSpider):
             item.add_xpath('company', COMPANY_XPATH)
             item.add_xpath('date_posted', DATE_POSTED_XPATH)
 
+            for name, value in salary_fields(item.get_output_value('salary')).items():
+                item.add_value(name, value)
+
             yield item.load_item()
 
 
 # * RUN SCRAPY PROCCESS
+# ! To run it together with the other job boards use $ python -m workshop1.orchestrator
 # process = CrawlerProcess()
 # process.crawl(TotalJobsCrawlSpider)
 # process.start()
@@ -1,12 +1,16 @@
+from typing import List
+
 from scrapy.item import Field, Item
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.selector import Selector
-from scrapy.loader.processors import MapCompose, TakeFirst
+from itemloaders.processors import MapCompose, TakeFirst
 from scrapy.linkextractors import LinkExtractor
 # from scrapy.crawler import CrawlerProcess
 
-from itemloaders import ItemLoader
+from ..extractors import CompiledExtractor
+from ..items import compact_item
 from ..processor_functions import cleanText
+from ..projection import ProjectedItemLoader, ProjectionMixin
 
 # * XPATHS
 DIV_JOBS_XPATH = '//section[@data-ng-repeat-start]'
@@ -34,9 +38,20 @@ class Job(Item):
     # )
 
 
+# * Slotted version of Job, with less memory per item (-a item_type=compact)
+CompactJob = compact_item(Job, {
+    'title': List[str],
+})
+
+# * Precompiled alternative to the ItemLoader of parse_job (-a extractor=compiled)
+JOB_EXTRACTOR = CompiledExtractor.from_item(Job, {
+    'title': TITLE_XPATH,
+}, rows_xpath=DIV_JOBS_XPATH)
+
+
 # * 2 Define the CrawlSpider
 
-class UpworkCrawlSpider(CrawlSpider):
+class UpworkCrawlSpider(ProjectionMixin, CrawlSpider):
     #  * 3 Configuration (headers, limitations, etc)
     name = "upwork"
 
@@ -53,7 +68,15 @@ class UpworkCrawlSpider(CrawlSpider):
         }
     }
 
-    download_delay = 2
+    # ! The delay between requests is handled by AdaptiveThrottleMiddleware
+
+    # ! 'itemloader' or 'compiled', e.g. scrapy crawl upwork -a extractor=compiled
+    extractor = 'itemloader'
+
+    # ! 'item' or 'compact' (slotted), e.g. scrapy crawl upwork -a item_type=compact
+    item_type = 'item'
+    # * Item class of the spider, all its fields are extracted when all are read
+    item_class = Job
 
     allowed_domains = ['www.upwork.com']
 
@@ -72,11 +95,17 @@ class UpworkCrawlSpider(CrawlSpider):
     )
 
     def parse_job(self, response):
+        if self.extractor == 'compiled':
+            yield from JOB_EXTRACTOR.project(self.extract_fields).extract_response(
+                response, item_cls=CompactJob if self.item_type == 'compact' else None)
+            return
+
         sel = Selector(response)
         div_jobs = sel.xpath(DIV_JOBS_XPATH)
 
         for div in div_jobs:
-            item = ItemLoader(Job(), div)
+            job = CompactJob() if self.item_type == 'compact' else Job()
+            item = ProjectedItemLoader(job, div, fields=self.extract_fields)
             # item.add_xpath('id', ID_XPATH)
             item.add_xpath('title', TITLE_XPATH)
 
@@ -92,6 +121,7 @@ class UpworkCrawlSpider(CrawlSpider):
 
 
 # * RUN SCRAPY PROCCESS
+# ! To run it together with the other job boards use $ python -m workshop1.orchestrator
 # process = CrawlerProcess()
 # process.crawl(UpworkCrawlSpider)
 # process.start()